@@ -4,9 +4,12 @@ from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     DATABASE_URL: str = "postgresql+psycopg2://netsentinel:netsentinel@db:5432/netsentinel"
+    # async driver URL for the async endpoints; derived from DATABASE_URL when empty
+    ASYNC_DATABASE_URL: str = ""
     FRONTEND_ORIGIN: str = "http://localhost:3000"
 
-    # which provider to use: "searxng" or "wikipedia"
+    # comma-separated providers: "searxng", "wikipedia", "fake" (offline);
+    # more than one are queried concurrently and merged (see services/fanout.py)
     SEARCH_PROVIDER: str = "searxng"
 
     # base URL of your SearxNG instance (make sure JSON format is enabled)
@@ -16,6 +19,158 @@ class Settings(BaseSettings):
     # optional: restrict categories, leave empty for all
     SEARXNG_CATEGORIES: str = "general,images"
 
+    # more SearxNG instances queried alongside SEARXNG_URL (comma-separated)
+    SEARXNG_EXTRA_URLS: str = ""
+
+    WIKIPEDIA_API_URL: str = "https://en.wikipedia.org/w/api.php"
+    WIKIPEDIA_PAGE_SIZE: int = 20
+
+    # artificial latency of the "fake" provider
+    FAKE_PROVIDER_LATENCY_MS: float = 0.0
+
+    # fan-out: answer with whatever arrived by FANOUT_DEADLINE seconds
+    FANOUT_DEADLINE: float = 2.5
+    # per-provider cut-offs, e.g. "wikipedia=1.5,searxng-2=2"
+    FANOUT_PROVIDER_DEADLINES: str = ""
+    # duplicate a request still running after the provider's p95 latency
+    FANOUT_HEDGE: bool = True
+    # hedge delay until enough latency samples were seen
+    FANOUT_HEDGE_DEFAULT_DELAY: float = 1.0
+
+    # outbound HTTP connection pools (per upstream host)
+    HTTP_POOL_MAX_CONNECTIONS_PER_HOST: int = 20
+    HTTP_POOL_MAX_CONNECTIONS_SEARXNG: int = 100
+    HTTP_POOL_MAX_KEEPALIVE_PER_HOST: int = 10
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    HTTP_MAX_HOST_POOLS: int = 64
+    HTTP_CONNECT_TIMEOUT: float = 3.0
+    HTTP_READ_TIMEOUT: float = 10.0
+    # how long a request may wait for a free connection slot
+    HTTP_POOL_TIMEOUT: float = 5.0
+    # adaptive read timeout: host p99 latency x multiplier, within
+    # [HTTP_MIN_READ_TIMEOUT, HTTP_READ_TIMEOUT]
+    HTTP_TIMEOUT_MULTIPLIER: float = 3.0
+    HTTP_MIN_READ_TIMEOUT: float = 1.0
+
+    # per-host circuit breakers: open after this many consecutive failures,
+    # fail fast for BREAKER_OPEN_SECONDS (doubling while the host stays down)
+    BREAKER_FAILURE_THRESHOLD: int = 5
+    BREAKER_OPEN_SECONDS: float = 15.0
+    BREAKER_MAX_OPEN_SECONDS: float = 300.0
+
+    # cache of raw upstream results (filtering still runs per request)
+    RESULT_CACHE_ENABLED: bool = True
+    # "memory" (per worker) or "redis" (shared across workers)
+    RESULT_CACHE_BACKEND: str = "memory"
+    RESULT_CACHE_TTL: float = 300.0
+    # after TTL, serve stale for this long while refreshing in the background
+    RESULT_CACHE_STALE_TTL: float = 600.0
+    # beyond that, keep entries this long to answer with when upstream is down
+    RESULT_CACHE_ERROR_TTL: float = 3600.0
+    RESULT_CACHE_MAX_ENTRIES: int = 1000
+    REDIS_URL: str = "redis://redis:6379/0"
+
+    # image proxy limits and thumbnail re-encoding
+    MEDIA_MAX_BYTES: int = 8 * 1024 * 1024
+    MEDIA_MAX_PIXELS: int = 40_000_000
+    MEDIA_THUMB_MAX_SIDE: int = 512
+    # "webp" or "jpeg"
+    MEDIA_THUMB_FORMAT: str = "webp"
+    MEDIA_THUMB_QUALITY: int = 80
+
+    # on-disk store of processed thumbnails ("" disables it)
+    MEDIA_STORE_DIR: str = "data/thumbnails"
+    MEDIA_STORE_MAX_BYTES: int = 1024 * 1024 * 1024
+    # re-fetch the remote image after this long to pick up changes
+    MEDIA_STORE_INDEX_TTL: float = 24 * 3600.0
+    # browser / reverse-proxy max-age; also bounds how long a filter-mode
+    # change takes to reach already cached images (ETag revalidation is cheap)
+    MEDIA_CACHE_MAX_AGE: int = 300
+
+    # prefetch + pre-moderate the top preview images right after a search
+    PREFETCH_ENABLED: bool = False
+    PREFETCH_TOP_N: int = 8
+    PREFETCH_CONCURRENCY: int = 4
+    PREFETCH_TIMEOUT: float = 15.0
+    PREFETCH_MAX_PENDING: int = 64
+
+    # image moderation verdict cache (memory LRU + SQLite file)
+    MODERATION_CACHE_PATH: str = "data/moderation_cache.sqlite3"
+    MODERATION_CACHE_MEMORY_ENTRIES: int = 512
+    MODERATION_CACHE_DISK_ENTRIES: int = 200_000
+    # bump when the detector/classifier changes to invalidate old verdicts
+    MODERATION_MODEL_VERSION: str = "nudenet3+falconsai-nsfw-2"
+
+    # micro-batching of moderation inference
+    MODERATION_BATCH_SIZE: int = 16
+    MODERATION_BATCH_MAX_WAIT_MS: float = 5.0
+    MODERATION_BATCH_CONCURRENCY: int = 1
+
+    # moderation cascade: stages run in this order. The whole-image
+    # classifier goes first because it can clear obviously safe images
+    # confidently; only uncertain ones pay for the NudeNet detector
+    MODERATION_CASCADE: str = "classifier,detector"
+    # a stage this sure an image is safe skips the remaining stages
+    MODERATION_SAFE_CONFIDENCE: float = 0.9
+    # let the detector's "nothing found" skip the classifier: faster, but
+    # misses NSFW images NudeNet cannot see (drawings, crops); off by default
+    MODERATION_DETECTOR_CAN_CLEAR: bool = False
+    # images are decoded and downscaled once to this size before any stage
+    MODERATION_MAX_SIDE: int = 640
+
+    # load + warm the moderation models at startup (see /health/ready)
+    MODERATION_PRELOAD: bool = False
+
+    # moderation worker processes (0 = run inference in the API process)
+    MODERATION_WORKERS: int = 0
+    # torch intra-op threads per worker process (0 = torch default)
+    MODERATION_WORKER_TORCH_THREADS: int = 0
+    # images waiting or in flight before /media/proxy answers 503
+    MODERATION_QUEUE_SIZE: int = 256
+    MODERATION_JOB_TIMEOUT: float = 20.0
+
+    # GlobalSettings cache: reloaded on LISTEN/NOTIFY, at the latest after TTL
+    SETTINGS_CACHE_TTL: float = 60.0
+    SETTINGS_NOTIFY_CHANNEL: str = "netsentinel_settings"
+
+    # write-behind search history: rows are queued and bulk-inserted by a
+    # background task instead of on the request path (Postgres only)
+    HISTORY_WRITE_BEHIND: bool = True
+    HISTORY_QUEUE_SIZE: int = 10_000
+    HISTORY_BATCH_SIZE: int = 500
+    HISTORY_FLUSH_INTERVAL: float = 0.5
+    # queued rows written later than this are counted as delayed
+    HISTORY_DELAY_WARN: float = 5.0
+    # query ids prefetched per sequence round trip (result ids: 10x)
+    HISTORY_ID_BLOCK: int = 100
+
+    # history retention, enforced by a background job (0 = no limit)
+    HISTORY_RETENTION_DAYS: int = 0
+    HISTORY_MAX_QUERIES: int = 0
+    HISTORY_RETENTION_INTERVAL: float = 3600.0
+    # purges delete this many queries per transaction, pausing in between
+    HISTORY_PURGE_BATCH_SIZE: int = 2000
+    HISTORY_PURGE_PAUSE: float = 0.05
+
+    # domain blocklist: comma-separated list files (plain, hosts-file or
+    # adblock "||domain^" lines), compiled into DOMAIN_INDEX_PATH at startup
+    # when they are newer; rebuild by hand with
+    # python -m app.services.domain_index build
+    DOMAIN_BLOCKLIST_FILES: str = ""
+    DOMAIN_ALLOWLIST_FILES: str = ""  # exceptions to the blocklist
+    DOMAIN_INDEX_PATH: str = "data/domain_index.bin"
+    DOMAIN_INDEX_CHECK_INTERVAL: float = 5.0  # seconds between mtime checks
+
+    # text classifier stage (optional, needs numpy): hashed n-gram linear
+    # model (.npz from python -m app.services.text_classifier train); empty = off
+    TEXT_CLASSIFIER_MODEL_PATH: str = ""
+    # minimum score that blocks, per filter mode; unlisted modes skip the stage
+    TEXT_CLASSIFIER_THRESHOLDS: str = "strict=0.5,moderate=0.8"
+    TEXT_CLASSIFIER_CACHE_ENTRIES: int = 50_000
+
+    # keyword filtering: True = whole words only ("sex" no longer blocks "Essex")
+    KEYWORD_WORD_BOUNDARY: bool = False
+
     class Config:
         env_file = ".env"
 
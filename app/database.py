@@ -1,5 +1,6 @@
 # app/database.py
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 from .config import settings
@@ -10,9 +11,33 @@ SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False, futu
 Base = declarative_base()
 
 
+def _async_database_url() -> str:
+    if settings.ASYNC_DATABASE_URL:
+        return settings.ASYNC_DATABASE_URL
+
+    scheme, sep, rest = settings.DATABASE_URL.partition("://")
+    if scheme.startswith("postgresql"):
+        return f"postgresql+asyncpg{sep}{rest}"
+    if scheme.startswith("sqlite"):
+        return f"sqlite+aiosqlite{sep}{rest}"
+    return settings.DATABASE_URL
+
+
+async_engine = create_async_engine(_async_database_url(), pool_pre_ping=True)
+# expire_on_commit=False: response models read ids/timestamps after commit
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False
+)
+
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
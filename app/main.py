@@ -1,16 +1,72 @@
 # app/main.py
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
 from .config import settings
-from .database import Base, engine
+from .database import Base, SessionLocal, async_engine, engine
 from .routers import search, stats, settings as settings_router
-from .routers import media , history
+from .routers import media , history, metrics
+from .services.domain_index import ensure_domain_index
+from .services.history_writer import start_history_writer, stop_history_writer
+from .services.http_client import aclose_http_manager
+from .services.moderation_cache import close_moderation_cache
+from .services.moderation_pool import (
+    moderation_readiness,
+    shutdown_moderation_executor,
+    warm_moderation_models,
+)
+from .services.prefetch import shutdown_prefetcher
+from .services.result_cache import aclose_result_cache
+from .services.retention import start_retention_job, stop_retention_job
+from .services.rollups import backfill_rollups
+from .services.settings_cache import start_settings_listener, stop_settings_listener
 
 # Create tables
 Base.metadata.create_all(bind=engine)
+# create_all skips tables that already exist: add indexes introduced later
+for table in Base.metadata.sorted_tables:
+    for index in table.indexes:
+        index.create(bind=engine, checkfirst=True)
+
+with SessionLocal() as db:
+    backfill_rollups(db)
+
+# compile the domain lists if they changed; workers map the result
+ensure_domain_index()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_settings_listener()
+    start_history_writer()
+    start_retention_job()
+
+    warmup = None
+    if settings.MODERATION_PRELOAD:
+        # in the background: /health answers immediately, /health/ready once warm
+        warmup = asyncio.create_task(warm_moderation_models())
 
-app = FastAPI(title="NetSentinel API")
+    yield
+
+    if warmup is not None and not warmup.done():
+        warmup.cancel()
+    shutdown_prefetcher()
+    await stop_retention_job()
+    # flush queued history before the engine goes away
+    await stop_history_writer()
+    stop_settings_listener()
+    await aclose_http_manager()
+    await aclose_result_cache()
+    close_moderation_cache()
+    shutdown_moderation_executor()
+    await async_engine.dispose()
+
+
+app = FastAPI(title="NetSentinel API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,6 +74,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # keyset pagination cursors of list endpoints
+    expose_headers=["X-Next-Cursor"],
 )
 
 app.include_router(search.router, prefix="/api")
@@ -25,8 +83,20 @@ app.include_router(stats.router, prefix="/api")
 app.include_router(settings_router.router, prefix="/api")
 app.include_router(media.router, prefix="/api")  
 app.include_router(history.router, prefix="/api")
+app.include_router(metrics.router, prefix="/api")
 
 
 @app.get("/health")
 def health():
     return {"status": "ok"}
+
+
+@app.get("/health/ready")
+def ready():
+    moderation = moderation_readiness()
+    status_code = 200 if moderation["ready"] else 503
+    return JSONResponse(
+        status_code=status_code,
+        content={"status": "ready" if moderation["ready"] else "starting", "moderation": moderation},
+    )
+
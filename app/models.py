@@ -3,6 +3,7 @@ from datetime import datetime
 import enum
 
 from sqlalchemy import (
+    BigInteger,
     Column,
     Integer,
     String,
@@ -10,6 +11,7 @@ from sqlalchemy import (
     Boolean,
     Enum,
     ForeignKey,
+    Index,
     Text,
 )
 from sqlalchemy.orm import relationship
@@ -47,6 +49,11 @@ class SearchQuery(Base):
         cascade="all, delete-orphan",
     )
 
+    __table_args__ = (
+        # keyset paging, exports and retention all walk (created_at, id)
+        Index("ix_search_queries_created_at_id", "created_at", "id"),
+    )
+
 
 class SearchResult(Base):
     __tablename__ = "search_results"
@@ -61,10 +68,15 @@ class SearchResult(Base):
     is_blocked = Column(Boolean, default=False)
     blocked_reason = Column(String(256), nullable=True)
 
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
 
     search_query = relationship("SearchQuery", back_populates="results")
 
+    __table_args__ = (
+        # a query's results in keyset order; also serves query_id lookups
+        Index("ix_search_results_query_id_created_at_id", "query_id", "created_at", "id"),
+    )
+
 
 class GlobalSettings(Base):
     __tablename__ = "global_settings"
@@ -83,3 +95,33 @@ class GlobalSettings(Base):
     blocked_keywords = Column(Text, default="")
     allowed_domains = Column(Text, default="")
 
+
+
+# --- stats rollups, maintained incrementally by services/rollups.py ---
+
+class StatsCounter(Base):
+    __tablename__ = "stats_counters"
+
+    name = Column(String(64), primary_key=True)
+    value = Column(BigInteger, default=0, nullable=False)
+
+
+class ActivityBucket(Base):
+    __tablename__ = "activity_buckets"
+
+    # start of the hour (UTC, like created_at)
+    bucket_start = Column(DateTime, primary_key=True)
+    searches = Column(Integer, default=0, nullable=False)
+    safe_results = Column(Integer, default=0, nullable=False)
+    blocked_results = Column(Integer, default=0, nullable=False)
+
+
+class BlockedTermBucket(Base):
+    __tablename__ = "blocked_term_buckets"
+
+    # start of the day (UTC); terms are too many for hourly buckets
+    bucket_start = Column(DateTime, primary_key=True)
+    # "keyword", "domain" or "classifier" (term = text classifier model version)
+    kind = Column(String(16), primary_key=True)
+    term = Column(String(256), primary_key=True)
+    count = Column(Integer, default=0, nullable=False)
@@ -1,56 +1,191 @@
 # app/routers/history.py
-from fastapi import APIRouter, Depends
+from datetime import datetime
+from typing import List, Optional
+
+import asyncio
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from fastapi.responses import StreamingResponse
-import csv
-from io import StringIO
 
+from .. import schemas
 from ..database import get_db
-from .. import models
+from ..services.history_export import EXPORT_FORMATS, export_history, naive_utc
+from ..services.history_pages import page_queries, page_results
+from ..services.retention import (
+    PurgeInProgress,
+    apply_retention,
+    get_history_purger,
+    retention_policy,
+)
 
 router = APIRouter(prefix="/history", tags=["history"])
 
 
-@router.delete("")
-def clear_search_history(db: Session = Depends(get_db)):
-    # Delete results first (if FK cascade is not fully enforced in your DB)
-    db.query(models.SearchResult).delete(synchronize_session=False)
-    deleted_queries = db.query(models.SearchQuery).delete(synchronize_session=False)
-    db.commit()
-    return {"ok": True, "deleted_queries": deleted_queries}
+@router.get("", response_model=List[schemas.ActivityItem])
+def list_history(
+    response: Response,
+    db: Session = Depends(get_db),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+):
+    """Stored searches, newest first; the next page's cursor is in X-Next-Cursor."""
+    try:
+        rows, next_cursor = page_queries(db, limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
 
+    return [
+        schemas.ActivityItem(
+            id=row.id,
+            query=row.query,
+            created_at=row.created_at,
+            safe_results=row.safe_results,
+            blocked_results=row.blocked_results,
+        )
+        for row in rows
+    ]
 
-@router.get("/export.csv")
-def export_history_csv(db: Session = Depends(get_db)):
+
+@router.get("/{query_id}/results", response_model=List[schemas.StoredResultOut])
+def list_stored_results(
+    query_id: int,
+    response: Response,
+    db: Session = Depends(get_db),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+):
+    try:
+        rows, next_cursor = page_results(db, query_id, limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+    return [
+        schemas.StoredResultOut(
+            id=row.id,
+            query_id=row.query_id,
+            title=row.title,
+            url=row.url,
+            snippet=row.snippet,
+            type=row.type,
+            created_at=row.created_at,
+        )
+        for row in rows
+    ]
+
+
+_background_purges: set = set()
+
+
+def _purge_done(task: asyncio.Task) -> None:
+    _background_purges.discard(task)
+    if not task.cancelled():
+        task.exception()  # already logged by the purger; mark as retrieved
+
+
+def _run_in_background(purge) -> None:
+    # keep a reference until done
+    task = asyncio.create_task(purge)
+    _background_purges.add(task)
+    task.add_done_callback(_purge_done)
+
+
+@router.delete("")
+async def clear_search_history(background: bool = False):
     """
-    Exports SearchQuery rows as CSV (basic audit trail).
-    Extend this if you want to include SearchResult rows too.
+    Deletes all history in batches (see services/retention.py).
+    With background=true, answers 202 right away; follow progress at
+    GET /history/retention.
     """
-    rows = (
-        db.query(models.SearchQuery)
-        .order_by(models.SearchQuery.created_at.desc())
-        .all()
-    )
+    purger = get_history_purger()
+    if purger.running:
+        raise HTTPException(status_code=409, detail="A history purge is already running")
+
+    if background:
+        _run_in_background(run_in_threadpool(purger.purge_all))
+        return JSONResponse(status_code=202, content={"ok": True, "started": True})
 
-    buffer = StringIO()
-    writer = csv.writer(buffer)
-    writer.writerow(["id", "query", "created_at", "filter_mode", "total_results", "safe_results", "blocked_results"])
-
-    for r in rows:
-        writer.writerow([
-            r.id,
-            r.query,
-            r.created_at.isoformat(),
-            r.filter_mode.value if hasattr(r.filter_mode, "value") else str(r.filter_mode),
-            r.total_results,
-            r.safe_results,
-            r.blocked_results,
-        ])
-
-    buffer.seek(0)
+    try:
+        progress = await run_in_threadpool(purger.purge_all)
+    except PurgeInProgress:
+        raise HTTPException(status_code=409, detail="A history purge is already running")
+    return {"ok": True, "deleted_queries": progress.deleted_queries}
+
+
+@router.get("/retention")
+def retention_status():
+    return {"policy": retention_policy(), **get_history_purger().status()}
+
+
+@router.post("/retention/run", status_code=202)
+async def run_retention():
+    """Apply the retention policy now instead of waiting for the next interval."""
+    if get_history_purger().running:
+        raise HTTPException(status_code=409, detail="A history purge is already running")
+    _run_in_background(apply_retention())
+    return {"ok": True, "started": True}
+
+
+def _export_response(
+    format: str,
+    gzip: bool,
+    start: Optional[datetime],
+    end: Optional[datetime],
+    include_results: bool,
+) -> StreamingResponse:
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}",
+        )
+    start, end = naive_utc(start), naive_utc(end)
+    if start is not None and end is not None and start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+
+    media_type, extension = EXPORT_FORMATS[format]
+    filename = f"search_history.{extension}"
+    if gzip:
+        media_type = "application/gzip"
+        filename += ".gz"
+
+    # the generator opens its own session: rows are still being read
+    # after this handler (and its Depends(get_db) session) has returned
     return StreamingResponse(
-        iter([buffer.getvalue()]),
-        media_type="text/csv",
-        headers={"Content-Disposition": "attachment; filename=search_history.csv"},
+        export_history(format, gzip=gzip, start=start, end=end, include_results=include_results),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
     )
+
+
+@router.get("/export.csv")
+def export_history_csv(
+    gzip: bool = False,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    include_results: bool = False,
+):
+    """
+    Exports SearchQuery rows as CSV (basic audit trail), streamed.
+    With include_results=true there is one row per stored SearchResult.
+    """
+    return _export_response("csv", gzip, start, end, include_results)
+
+
+@router.get("/export")
+def export_history_any(
+    format: str = "csv",
+    gzip: bool = False,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    include_results: bool = False,
+):
+    """
+    Streamed export of search history as CSV or NDJSON, optionally gzipped
+    and limited to [start, end). NDJSON nests the results of each query.
+    """
+    return _export_response(format, gzip, start, end, include_results)
@@ -1,55 +1,80 @@
 # app/routers/media.py
-from io import BytesIO
+from typing import Optional
 from urllib.parse import unquote_plus
 
-import requests
-from fastapi import APIRouter, HTTPException, Query, Depends
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, HTTPException, Query, Header
+from fastapi.responses import Response
 
-from ..services.image_moderation import censor_if_needed
-from ..utils.settings import get_or_create_global_settings
+from ..config import settings as app_settings
+from ..services.media_pipeline import (
+    MediaError,
+    lookup_processed,
+    process_image,
+    read_processed,
+)
+from ..services.settings_cache import get_settings_snapshot
+from ..services.singleflight import get_singleflight
 from ..models import FilterMode
 router = APIRouter(prefix="/media", tags=["media"])
-from sqlalchemy.orm import Session
-from ..database import get_db
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate.strip('"') == etag:
+            return True
+    return False
+
+
+def cache_headers(etag: str) -> dict:
+    return {
+        "ETag": f'"{etag}"',
+        "Cache-Control": f"public, max-age={app_settings.MEDIA_CACHE_MAX_AGE}",
+    }
 
 
 @router.get("/proxy")
-def proxy_image(
+async def proxy_image(
     url: str = Query(..., description="Original image URL (URL-encoded)"),
     mode: FilterMode | None = Query(
         None,
         description="Optional override for filter mode: relaxed/moderate/strict",
     ),
-    db: Session = Depends(get_db),
+    if_none_match: Optional[str] = Header(None),
 ):
     decoded_url = unquote_plus(url)
 
     if not decoded_url.startswith(("http://", "https://")):
         raise HTTPException(status_code=400, detail="Invalid image URL")
 
-    try:
-        resp = requests.get(decoded_url, timeout=10)
-    except requests.RequestException:
-        raise HTTPException(status_code=502, detail="Failed to fetch remote image")
-
-    if resp.status_code != 200:
-        raise HTTPException(status_code=404, detail="Image not found")
-
-    content_type = resp.headers.get("content-type", "")
-    if not content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="URL does not point to an image")
-
-    original_bytes = resp.content
-
-    settings = get_or_create_global_settings(db)
+    settings = await get_settings_snapshot()
     effective_mode = mode or settings.filter_mode
 
-    if effective_mode == FilterMode.relaxed:
-        censored_bytes = original_bytes
-    elif effective_mode == FilterMode.moderate:
-        censored_bytes, _ = censor_if_needed(original_bytes, threshold=0.8)
-    else:  # strict
-        censored_bytes, _ = censor_if_needed(original_bytes, threshold=0.6)
+    # already processed: answer from the thumbnail store (or 304) without fetching
+    stored = await lookup_processed(decoded_url, effective_mode)
+    if stored is not None:
+        etag, media_type = stored
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=cache_headers(etag))
+        content = await read_processed(etag)
+        if content is not None:
+            return Response(content=content, media_type=media_type, headers=cache_headers(etag))
+
+    # concurrent requests for the same image + mode share one fetch/moderation
+    try:
+        image = await get_singleflight("media").do(
+            (decoded_url, effective_mode),
+            lambda: process_image(decoded_url, effective_mode),
+        )
+    except MediaError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers=e.headers)
 
-    return StreamingResponse(BytesIO(censored_bytes), media_type="image/jpeg")
\ No newline at end of file
+    if etag_matches(if_none_match, image.etag):
+        return Response(status_code=304, headers=cache_headers(image.etag))
+    return Response(content=image.content, media_type=image.media_type, headers=cache_headers(image.etag))
@@ -0,0 +1,48 @@
+# app/routers/metrics.py
+from fastapi import APIRouter
+
+from ..services.domain_index import get_domain_index_handle
+from ..services.history_writer import get_history_writer
+from ..services.http_client import get_http_manager
+from ..services.image_moderation import stage_metrics
+from ..services.moderation_batcher import moderation_batcher_metrics
+from ..services.moderation_cache import get_moderation_cache
+from ..services.prefetch import get_prefetcher
+from ..services.result_cache import get_result_cache
+from ..services.retention import get_history_purger
+from ..services.search_providers import provider_metrics
+from ..services.settings_cache import get_settings_cache
+from ..services.singleflight import singleflight_metrics
+from ..services.text_classifier import text_classifier_metrics
+from ..services.thumbnail_store import get_thumbnail_store
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+
+@router.get("")
+async def read_metrics():
+    store = get_thumbnail_store()
+    writer = get_history_writer()
+    domain_index = get_domain_index_handle()
+    return {
+        "http_pools": get_http_manager().metrics(),
+        "result_cache": get_result_cache().metrics(),
+        "singleflight": singleflight_metrics(),
+        "moderation_cache": get_moderation_cache().metrics(),
+        "moderation_batcher": moderation_batcher_metrics(),
+        "moderation_stages": stage_metrics(),
+        "thumbnail_store": store.metrics() if store is not None else None,
+        "prefetch": get_prefetcher().metrics(),
+        "settings_cache": get_settings_cache().metrics(),
+        "history_writer": writer.metrics() if writer is not None else None,
+        "retention": get_history_purger().status(),
+        "search_providers": provider_metrics(),
+        "domain_index": domain_index.metrics() if domain_index is not None else None,
+        "text_classifier": text_classifier_metrics(),
+    }
+
+
+@router.get("/upstreams")
+async def read_upstreams():
+    """Circuit breaker state, latency and current read timeout per upstream host."""
+    return get_http_manager().upstreams.states()
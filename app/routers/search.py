@@ -1,17 +1,31 @@
 # app/routers/search.py
+import asyncio
+import json
 from datetime import datetime
-from typing import List
+from typing import AsyncIterator, List, Optional, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-import requests
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+import httpx
 from typing import Dict
 from .. import models, schemas
-from ..database import get_db
+from ..config import settings as app_settings
+from ..database import get_async_db
+from ..services.domain_index import get_domain_index
+from ..services.history_writer import get_history_writer, save_search
 from ..services.search_providers import get_provider
-from ..services.filtering import filter_results, classify_result_type
-from ..utils.settings import get_or_create_global_settings
+from ..services.prefetch import get_prefetcher
+from ..services.rollups import record_blocked_terms, record_searches
+from ..services.result_cache import get_result_cache, make_cache_key, normalize_query
+from ..services.singleflight import get_singleflight
+from ..services.text_classifier import get_text_classifier
+from ..services.filtering import apply_filters, classify_result_type
+from ..services.settings_cache import get_settings_snapshot
 from ..models import ResultType  
+from ..utils.cursors import decode_cursor, encode_cursor
 import logging
 router = APIRouter(prefix="/search", tags=["search"])
 logging.basicConfig(level=logging.INFO)
@@ -28,21 +42,76 @@ def infer_result_type(r: Dict) -> ResultType:
   return classify_result_type(r["url"])
 
 
+# results kept per upstream page; more than any SearxNG page holds, so
+# requests with different limits/offsets share one cached page
+UPSTREAM_PAGE_LIMIT = 100
+
+
+def decode_search_cursor(cursor: Optional[str], query: str) -> Tuple[int, int]:
+    """(upstream page, offset within it) from a next_cursor token."""
+    if not cursor:
+        return 1, 0
+    data = decode_cursor(cursor)
+    if data.get("q") != normalize_query(query):
+        raise ValueError("cursor belongs to a different query")
+    page, offset = data.get("page"), data.get("offset")
+    if not isinstance(page, int) or not isinstance(offset, int) or page < 1 or offset < 0:
+        raise ValueError("invalid cursor")
+    return page, offset
+
+
+def next_search_cursor(query: str, page: int, end: int, page_size: int) -> Optional[str]:
+    """Rest of this upstream page if any, else the next page; None when exhausted."""
+    if end < page_size:
+        return encode_cursor({"q": normalize_query(query), "page": page, "offset": end})
+    if page_size > 0:
+        return encode_cursor({"q": normalize_query(query), "page": page + 1, "offset": 0})
+    return None
+
+
+async def fetch_raw_results(provider, query: str, limit: int, page: int = 1) -> List[Dict]:
+    """
+    Upstream results, served from the result cache when enabled.
+    Concurrent identical searches share one upstream call.
+    Cached lists are shared between requests and must not be mutated.
+    """
+    key = make_cache_key(query, getattr(provider, "categories", ""), limit, page)
+
+    async def fetch() -> List[Dict]:
+        return await get_singleflight("search").do(
+            key, lambda: provider.asearch(query, limit=limit, page=page)
+        )
+
+    if not app_settings.RESULT_CACHE_ENABLED:
+        return await fetch()
+
+    return await get_result_cache().get_or_fetch(key, fetch)
+
 
 @router.post("", response_model=schemas.SearchResponse)
-def perform_search(
+async def perform_search(
     payload: schemas.SearchRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     if not payload.query.strip():
         raise HTTPException(status_code=400, detail="Query cannot be empty")
 
+    try:
+        page, offset = decode_search_cursor(payload.cursor, payload.query)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
     provider = get_provider()
 
     try:
-        raw_results = provider.search(payload.query, limit=payload.limit)
-        has_more = len(raw_results) == payload.limit
-    except requests.HTTPError as e:
+        # the whole upstream page is cached; cursors walk through it and on
+        # to the next pageno without re-running earlier pages
+        raw_page = await fetch_raw_results(provider, payload.query, UPSTREAM_PAGE_LIMIT, page)
+        end = offset + payload.limit
+        raw_results = raw_page[offset:end]
+        next_cursor = next_search_cursor(payload.query, page, end, len(raw_page))
+        has_more = next_cursor is not None
+    except httpx.HTTPStatusError as e:
         # Upstream returned HTTP error (e.g. 500)
         logger.exception("Upstream search provider HTTP error")
         # 👉 Either raise 502 (strict)...
@@ -52,7 +121,7 @@ def perform_search(
         # )
         # ...or degrade gracefully:
         return schemas.SearchResponse(results=[], has_more=False)
-    except requests.RequestException as e:
+    except httpx.RequestError as e:
         # Timeouts / connection issues / DNS, etc.
         logger.exception("Failed to contact upstream search provider")
         # 👉 Again, either raise...
@@ -63,24 +132,34 @@ def perform_search(
         # ...or degrade gracefully:
         return schemas.SearchResponse(results=[], has_more=False)
 
-    settings = get_or_create_global_settings(db)
+    settings = await get_settings_snapshot()
     effective_mode = payload.filter_mode or settings.filter_mode
 
-    filtered, blocked_count = filter_results(
+    classifier = get_text_classifier()
+    blocked_terms: List[Tuple[str, str]] = []
+    filtered, blocked_count = apply_filters(
         raw_results,
-        filter_mode=effective_mode,
-        blocked_keywords=settings.blocked_keywords or "",
-        allowed_domains=settings.allowed_domains or "",
+        matcher=settings.matcher(effective_mode),
+        allowed=settings.allowed_domain_set,
+        blocked_terms=blocked_terms,
+        domain_index=get_domain_index(),
+        classifier=classifier,
+        classifier_threshold=classifier.threshold(effective_mode) if classifier else None,
     )
 
     total = len(raw_results)
     safe = len(filtered)
 
+    if app_settings.PREFETCH_ENABLED:
+        # warm the thumbnails the browser is about to request; the proxy
+        # resolves mode from the global settings, so prefetch for that mode
+        get_prefetcher().schedule(filtered, settings.filter_mode)
+
     # CASE 1: Don't save history; just respond
     if not settings.save_search_history:
         now = datetime.utcnow()
         out: List[schemas.SearchResultOut] = []
-        for idx, r in enumerate(filtered, start=1):
+        for idx, r in enumerate(filtered, start=offset + 1):
             out.append(
                 schemas.SearchResultOut(
                     id=idx,
@@ -92,18 +171,78 @@ def perform_search(
                     preview_url=r.get("preview_url"),
                 )
             )
-        return schemas.SearchResponse(results=out, has_more=has_more)
+        return schemas.SearchResponse(results=out, has_more=has_more, next_cursor=next_cursor)
 
-    # CASE 2: Save query + results but still return "live" preview URLs
+    # CASE 2: Save query + results off the request path (write-behind)
+    writer = get_history_writer()
+    if writer is not None:
+        now = datetime.utcnow()
+        query_id = (await writer.query_ids.take(1))[0]
+        result_ids = await writer.result_ids.take(len(filtered)) if filtered else []
+
+        out: List[schemas.SearchResultOut] = []
+        result_rows: List[Dict] = []
+        for r, result_id in zip(filtered, result_ids):
+            result_type = infer_result_type(r)
+            result_rows.append(
+                dict(
+                    id=result_id,
+                    query_id=query_id,
+                    title=r["title"],
+                    url=r["url"],
+                    snippet=r["snippet"],
+                    type=result_type,
+                    is_blocked=False,
+                    blocked_reason=None,
+                    created_at=now,
+                )
+            )
+            out.append(
+                schemas.SearchResultOut(
+                    id=result_id,
+                    title=r["title"],
+                    url=r["url"],
+                    snippet=r["snippet"],
+                    type=result_type,
+                    timestamp=now,
+                    preview_url=r.get("preview_url"),
+                )
+            )
+
+        writer.record(
+            dict(
+                id=query_id,
+                query=payload.query,
+                filter_mode=effective_mode,
+                total_results=total,
+                safe_results=safe,
+                blocked_results=blocked_count,
+                created_at=now,
+            ),
+            result_rows,
+            blocked_terms,
+        )
+        return schemas.SearchResponse(results=out, has_more=has_more, next_cursor=next_cursor)
+
+    # CASE 3: Save query + results inline but still return "live" preview URLs
     q = models.SearchQuery(
         query=payload.query,
         filter_mode=effective_mode,
         total_results=total,
         safe_results=safe,
         blocked_results=blocked_count,
+        created_at=datetime.utcnow(),
     )
     db.add(q)
-    db.flush()
+    await db.flush()
+    rollup_row = dict(created_at=q.created_at, safe_results=safe, blocked_results=blocked_count)
+
+    def record_rollups(session) -> None:
+        conn = session.connection()
+        record_searches(conn, [rollup_row])
+        record_blocked_terms(conn, ((q.created_at, kind, term) for kind, term in blocked_terms))
+
+    await db.run_sync(record_rollups)
 
     db_results: List[models.SearchResult] = []
     for r in filtered:
@@ -118,8 +257,7 @@ def perform_search(
         db.add(row)
         db_results.append(row)
 
-    db.commit()
-    db.refresh(q)
+    await db.commit()
 
     out: List[schemas.SearchResultOut] = []
     for r, row in zip(filtered, db_results):
@@ -134,4 +272,232 @@ def perform_search(
                 preview_url=r.get("preview_url"),
             )
         )
-    return schemas.SearchResponse(results=out, has_more=has_more)
\ No newline at end of file
+    return schemas.SearchResponse(results=out, has_more=has_more, next_cursor=next_cursor)
+
+
+# --- streaming variant -------------------------------------------------------
+
+STREAM_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+# background saves when write-behind is unavailable (keep references)
+_pending_saves: set = set()
+
+
+def _ndjson_event(event: str, data: Dict) -> str:
+    # nested like SSE's event/data: results carry their own "type" field
+    return json.dumps({"event": event, "data": data}) + "\n"
+
+
+def _sse_event(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _single_batch(results: List[Dict]) -> AsyncIterator[List[Dict]]:
+    yield results
+
+
+def _save_in_background(query_row: Dict, result_rows: List[Dict], blocked_terms) -> None:
+    def done(task: asyncio.Task) -> None:
+        _pending_saves.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Saving streamed search failed", exc_info=task.exception())
+
+    task = asyncio.get_running_loop().create_task(
+        run_in_threadpool(save_search, query_row, result_rows, blocked_terms)
+    )
+    _pending_saves.add(task)
+    task.add_done_callback(done)
+
+
+async def stream_search_events(
+    payload: schemas.SearchRequest, page: int, offset: int, fmt: str
+) -> AsyncIterator[str]:
+    """
+    One "result" event per result as soon as it passes filtering, then a
+    "summary" event with the counts, has_more and next_cursor. History is
+    handed to the write-behind writer (or saved in the background) after
+    the last result, never on the response path.
+    """
+    encode = _sse_event if fmt == "sse" else _ndjson_event
+
+    settings = await get_settings_snapshot()
+    effective_mode = payload.filter_mode or settings.filter_mode
+    matcher = settings.matcher(effective_mode)
+    domain_index = get_domain_index()
+    classifier = get_text_classifier()
+    threshold = classifier.threshold(effective_mode) if classifier else None
+    save = settings.save_search_history
+    writer = get_history_writer() if save else None
+    query_id = (await writer.query_ids.take(1))[0] if writer is not None else None
+    now = datetime.utcnow()
+
+    provider = get_provider()
+    cache = get_result_cache() if app_settings.RESULT_CACHE_ENABLED else None
+    # same entry as /search, except for providers that stream in a different
+    # order (fan-out: arrival vs RRF), where cursors from one mode would index
+    # into pages of the other
+    categories = getattr(provider, "categories", "")
+    if getattr(provider, "streams_in_arrival_order", False):
+        categories = f"{categories}\x1fstream"
+    key = make_cache_key(payload.query, categories, UPSTREAM_PAGE_LIMIT, page)
+    cached = await cache.lookup(key) if cache is not None else None
+    served_stale = False
+
+    async def upstream_batches() -> AsyncIterator[List[Dict]]:
+        nonlocal served_stale
+        sent = False
+        try:
+            async for batch in provider.asearch_iter(
+                payload.query, limit=UPSTREAM_PAGE_LIMIT, page=page
+            ):
+                sent = True
+                yield batch
+        except httpx.HTTPError:
+            # stale-if-error like /search, unless results already went out
+            stale = await cache.lookup_on_error(key) if cache is not None and not sent else None
+            if stale is None:
+                raise
+            served_stale = True
+            yield stale
+
+    batches = _single_batch(cached) if cached is not None else upstream_batches()
+
+    end = offset + payload.limit
+    raw_page: List[Dict] = []
+    filtered: List[Dict] = []
+    result_rows: List[Dict] = []
+    blocked_terms: List[Tuple[str, str]] = []
+    blocked_count = 0
+
+    try:
+        async for batch in batches:
+            batch_start = len(raw_page)
+            raw_page.extend(batch)
+            window = batch[max(0, offset - batch_start):max(0, end - batch_start)]
+            if not window:
+                continue
+
+            # one filter call per provider batch, so the classifier scores it at once
+            passed, blocked = apply_filters(
+                window,
+                matcher,
+                settings.allowed_domain_set,
+                blocked_terms,
+                domain_index,
+                classifier,
+                threshold,
+            )
+            blocked_count += blocked
+
+            for r in passed:
+                result_type = infer_result_type(r)
+                if writer is not None:
+                    result_id = (await writer.result_ids.take(1))[0]
+                else:
+                    result_id = offset + len(filtered) + 1
+                filtered.append(r)
+
+                out = schemas.SearchResultOut(
+                    id=result_id,
+                    title=r["title"],
+                    url=r["url"],
+                    snippet=r["snippet"],
+                    type=result_type,
+                    timestamp=now,
+                    preview_url=r.get("preview_url"),
+                )
+                yield encode("result", jsonable_encoder(out))
+
+                if save:
+                    row = dict(
+                        title=r["title"],
+                        url=r["url"],
+                        snippet=r["snippet"],
+                        type=result_type,
+                        is_blocked=False,
+                        blocked_reason=None,
+                        created_at=now,
+                    )
+                    if writer is not None:
+                        row.update(id=result_id, query_id=query_id)
+                    result_rows.append(row)
+    except httpx.HTTPError:
+        logger.exception("Failed to contact upstream search provider")
+        yield encode("error", {"detail": "Search provider unavailable"})
+        yield encode(
+            "summary",
+            {"total": 0, "safe": 0, "blocked": 0, "has_more": False, "next_cursor": None},
+        )
+        return
+
+    if cache is not None and cached is None and not served_stale:
+        await cache.store(key, raw_page)
+
+    total = len(raw_page[offset:end])
+    safe = len(filtered)
+    next_cursor = next_search_cursor(payload.query, page, end, len(raw_page))
+
+    if app_settings.PREFETCH_ENABLED:
+        get_prefetcher().schedule(filtered, settings.filter_mode)
+
+    if save:
+        query_row = dict(
+            query=payload.query,
+            filter_mode=effective_mode,
+            total_results=total,
+            safe_results=safe,
+            blocked_results=blocked_count,
+            created_at=now,
+        )
+        if writer is not None:
+            writer.record(dict(query_row, id=query_id), result_rows, blocked_terms)
+        else:
+            _save_in_background(query_row, result_rows, blocked_terms)
+
+    yield encode(
+        "summary",
+        {
+            "total": total,
+            "safe": safe,
+            "blocked": blocked_count,
+            "has_more": next_cursor is not None,
+            "next_cursor": next_cursor,
+        },
+    )
+
+
+@router.post("/stream")
+async def perform_search_stream(
+    payload: schemas.SearchRequest,
+    format: Optional[str] = None,
+    accept: Optional[str] = Header(None),
+):
+    """
+    Streaming /search: NDJSON lines ({"event": "result" | "summary" | "error",
+    "data": {...}}) or Server-Sent Events with the same event names and data
+    (format=sse, or Accept: text/event-stream).
+    Ids are only database ids when history is written behind.
+    """
+    if not payload.query.strip():
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+    try:
+        page, offset = decode_search_cursor(payload.cursor, payload.query)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    fmt = format or ("sse" if accept and "text/event-stream" in accept else "ndjson")
+    if fmt not in STREAM_MEDIA_TYPES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"format must be one of: {', '.join(STREAM_MEDIA_TYPES)}",
+        )
+
+    return StreamingResponse(
+        stream_search_events(payload, page, offset, fmt),
+        media_type=STREAM_MEDIA_TYPES[fmt],
+        # no proxy buffering, or the client sees everything at the end anyway
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -4,6 +4,7 @@ from sqlalchemy.orm import Session
 
 from .. import schemas
 from ..database import get_db
+from ..services.settings_cache import notify_settings_changed
 from ..utils.settings import get_or_create_global_settings
 
 router = APIRouter(prefix="/settings", tags=["settings"])
@@ -30,6 +31,8 @@ def update_settings(payload: schemas.SettingsUpdate, db: Session = Depends(get_d
     db.add(s)
     db.commit()
     db.refresh(s)
+    # search / media read a cached copy: drop it here and in every other worker
+    notify_settings_changed(db)
 
     return schemas.SettingsOut(
         filter_mode=s.filter_mode,
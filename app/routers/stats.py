@@ -1,47 +1,75 @@
 # app/routers/stats.py
-from typing import List
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends
-from sqlalchemy import func
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 
-from .. import models, schemas
+from .. import schemas
 from ..database import get_db
+from ..services.history_pages import page_queries
+from ..services.rollups import (
+    BLOCKED_RESULTS,
+    SAFE_RESULTS,
+    TOTAL_SEARCHES,
+    read_activity,
+    read_top_blocked,
+    read_totals,
+    read_window_totals,
+)
 
 router = APIRouter(prefix="/stats", tags=["stats"])
 
+# ?window=... -> hours of activity buckets to sum
+WINDOWS = {"24h": 24, "7d": 7 * 24}
+
+# granularity -> (default range, max range)
+GRANULARITIES = {
+    "hour": (timedelta(hours=24), timedelta(days=31)),
+    "day": (timedelta(days=30), timedelta(days=366)),
+}
+
 
 @router.get("/overview", response_model=schemas.OverviewStats)
-def overview(db: Session = Depends(get_db)):
-    total_searches = db.query(func.count(models.SearchQuery.id)).scalar() or 0
-    blocked_content = (
-        db.query(func.coalesce(func.sum(models.SearchQuery.blocked_results), 0)).scalar()
-        or 0
-    )
-    safe_results = (
-        db.query(func.coalesce(func.sum(models.SearchQuery.safe_results), 0)).scalar()
-        or 0
-    )
+def overview(db: Session = Depends(get_db), window: Optional[str] = None):
+    # served from the rollup tables, never from search_queries
+    if window is None:
+        totals = read_totals(db)
+    elif window in WINDOWS:
+        totals = read_window_totals(db, WINDOWS[window])
+    else:
+        raise HTTPException(
+            status_code=400,
+            detail=f"window must be one of: {', '.join(WINDOWS)}",
+        )
+
+    total_searches = totals[TOTAL_SEARCHES]
 
     # simple heuristic: ~1 minute per search
     active_time_hours = round(total_searches / 60.0, 2)
 
     return schemas.OverviewStats(
         total_searches=total_searches,
-        blocked_content=blocked_content,
-        safe_results=safe_results,
+        blocked_content=totals[BLOCKED_RESULTS],
+        safe_results=totals[SAFE_RESULTS],
         active_time_hours=active_time_hours,
     )
 
 
 @router.get("/recent", response_model=List[schemas.ActivityItem])
-def recent(db: Session = Depends(get_db), limit: int = 10):
-    rows = (
-        db.query(models.SearchQuery)
-        .order_by(models.SearchQuery.created_at.desc())
-        .limit(limit)
-        .all()
-    )
+def recent(
+    response: Response,
+    db: Session = Depends(get_db),
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = None,
+):
+    """Newest searches first; pass the X-Next-Cursor header back as ?cursor= for the next page."""
+    try:
+        rows, next_cursor = page_queries(db, limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
 
     return [
         schemas.ActivityItem(
@@ -53,3 +81,48 @@ def recent(db: Session = Depends(get_db), limit: int = 10):
         )
         for row in rows
     ]
+
+
+@router.get("/timeseries", response_model=schemas.TimeseriesStats)
+def timeseries(
+    db: Session = Depends(get_db),
+    granularity: str = "hour",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    top: int = Query(10, ge=0, le=100),
+):
+    """
+    Searches / safe / blocked per hour or day in [start, end) (UTC), plus the
+    most frequent blocking keywords and domains. Reads only the rollups.
+    """
+    if granularity not in GRANULARITIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"granularity must be one of: {', '.join(GRANULARITIES)}",
+        )
+    default_range, max_range = GRANULARITIES[granularity]
+
+    # naive UTC, like created_at
+    if start is not None and start.tzinfo is not None:
+        start = start.astimezone(timezone.utc).replace(tzinfo=None)
+    if end is not None and end.tzinfo is not None:
+        end = end.astimezone(timezone.utc).replace(tzinfo=None)
+
+    end = end or datetime.utcnow()
+    start = start or end - default_range
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    if end - start > max_range:
+        raise HTTPException(
+            status_code=400,
+            detail=f"range too large for granularity={granularity} (max {max_range.days} days)",
+        )
+
+    return schemas.TimeseriesStats(
+        granularity=granularity,
+        start=start,
+        end=end,
+        points=read_activity(db, start, end, granularity),
+        top_blocked_keywords=read_top_blocked(db, "keyword", start, end, top),
+        top_blocked_domains=read_top_blocked(db, "domain", start, end, top),
+    )
@@ -11,6 +11,8 @@ class SearchRequest(BaseModel):
     query: str
     filter_mode: Optional[FilterMode] = None
     limit: int = 10
+    # next_cursor of the previous response, to get the next page
+    cursor: Optional[str] = None
 
 
 class SearchResultOut(BaseModel):
@@ -32,6 +34,7 @@ class SearchResultOut(BaseModel):
 class SearchResponse(BaseModel):
     results: List[SearchResultOut]
     has_more: bool
+    next_cursor: Optional[str] = None
 
 
 class SettingsOut(BaseModel):
@@ -65,3 +68,35 @@ class ActivityItem(BaseModel):
     created_at: datetime
     safe_results: int
     blocked_results: int
+
+
+class StoredResultOut(BaseModel):
+    id: int
+    query_id: int
+    title: str
+    url: str
+    snippet: str
+    type: ResultType
+    created_at: datetime
+
+
+class TimeseriesPoint(BaseModel):
+    bucket_start: datetime
+    searches: int
+    safe_results: int
+    blocked_results: int
+
+
+class BlockedTermCount(BaseModel):
+    kind: str
+    term: str
+    count: int
+
+
+class TimeseriesStats(BaseModel):
+    granularity: str
+    start: datetime
+    end: datetime
+    points: List[TimeseriesPoint]
+    top_blocked_keywords: List[BlockedTermCount]
+    top_blocked_domains: List[BlockedTermCount]
@@ -0,0 +1,315 @@
+# app/services/domain_index.py
+"""
+Compiled domain allow/block index.
+
+Lists (one domain per line; hosts-file "0.0.0.0 example.com" and adblock
+"||example.com^" lines are understood too) are compiled into a flat,
+memory-mapped hash table of domain suffixes:
+
+    header  "NSDI" | version u32 | capacity u64 | count u64
+    slots   capacity x u64: 62-bit blake2b hash of the domain | 2 flag bits
+
+An entry covers the domain and all of its subdomains. A lookup probes the
+host's suffixes from most to least specific (en.m.wikipedia.org,
+m.wikipedia.org, wikipedia.org, org), so it costs O(label count) no matter
+how many domains are listed; the most specific listed suffix decides and
+allow beats block for the same suffix. The file is mapped read-only, so
+all workers share one copy through the page cache. Rebuilding replaces the
+file atomically and workers pick it up on the next mtime check.
+
+Build with:
+    python -m app.services.domain_index build --block list.txt [--allow ok.txt] [-o path]
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"NSDI"
+VERSION = 1
+_HEADER = struct.Struct("<4sIQQ")
+_SLOT = struct.Struct("<Q")
+
+BLOCK = 1
+ALLOW = 2
+_FLAG_MASK = 3
+_HASH_MASK = ~_FLAG_MASK & 0xFFFFFFFFFFFFFFFF
+
+
+def _hash(domain: str) -> int:
+    h = int.from_bytes(hashlib.blake2b(domain.encode("utf-8"), digest_size=8).digest(), "little")
+    h &= _HASH_MASK
+    return h or 4  # 0 marks an empty slot
+
+
+def normalize_domain(line: str) -> Optional[str]:
+    """Domain from one list line, or None for comments / junk."""
+    line = line.split("#", 1)[0].strip().lower()
+    if not line or line.startswith("!"):
+        return None
+    parts = line.split()
+    if len(parts) >= 2 and parts[0] in ("0.0.0.0", "127.0.0.1", "::", "::1"):
+        line = parts[1]
+    elif len(parts) != 1:
+        return None
+    if line.startswith("||"):
+        line = line[2:]
+    line = line.rstrip("^").strip(".")
+    if line.startswith("*."):
+        line = line[2:]
+    if not line or "/" in line or line in ("localhost", "localhost.localdomain"):
+        return None
+    try:
+        # IDNs are matched in their ASCII form, like urlparse().hostname
+        return line.encode("idna").decode("ascii")
+    except UnicodeError:
+        return None
+
+
+def domain_suffixes(host: str) -> Iterator[str]:
+    """en.wikipedia.org -> en.wikipedia.org, wikipedia.org, org"""
+    labels = host.strip(".").lower().split(".")
+    for i in range(len(labels)):
+        yield ".".join(labels[i:])
+
+
+def suffix_in_set(host: str, domains) -> Optional[str]:
+    """Most specific suffix of host contained in domains (subdomain match)."""
+    for suffix in domain_suffixes(host):
+        if suffix in domains:
+            return suffix
+    return None
+
+
+def read_domain_file(path: str) -> Iterator[str]:
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            domain = normalize_domain(line)
+            if domain:
+                yield domain
+
+
+def build_index(blocked: Iterable[str], allowed: Iterable[str], path: str) -> int:
+    """Compile domains into an index file (atomically replaced). Returns the entry count."""
+    entries: Dict[int, int] = {}
+    for domain in blocked:
+        h = _hash(domain)
+        entries[h] = entries.get(h, 0) | BLOCK
+    for domain in allowed:
+        entries[_hash(domain)] = ALLOW  # allow beats block for the same suffix
+
+    capacity = 16
+    while capacity < len(entries) * 2:  # load factor <= 0.5 keeps probes short
+        capacity *= 2
+
+    table = bytearray(_SLOT.size * capacity)
+    mask = capacity - 1
+    for h, flags in entries.items():
+        flags = ALLOW if flags & ALLOW else BLOCK
+        i = (h >> 2) & mask
+        while _SLOT.unpack_from(table, i * _SLOT.size)[0]:
+            i = (i + 1) & mask
+        _SLOT.pack_into(table, i * _SLOT.size, h | flags)
+
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, capacity, len(entries)))
+            f.write(table)
+        # workers still map the old inode; they switch on their next mtime check
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    return len(entries)
+
+
+class DomainIndex:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, capacity, count = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self._mm.close()
+            raise ValueError(f"{path} is not a domain index (version {VERSION})")
+        if len(self._mm) < _HEADER.size + capacity * _SLOT.size:
+            self._mm.close()
+            raise ValueError(f"{path} is truncated")
+        self.capacity = capacity
+        self.count = count
+        self._mask = capacity - 1
+
+    def _flags(self, domain: str) -> int:
+        h = _hash(domain)
+        i = (h >> 2) & self._mask
+        while True:
+            slot = _SLOT.unpack_from(self._mm, _HEADER.size + i * _SLOT.size)[0]
+            if not slot:
+                return 0
+            if slot & _HASH_MASK == h:
+                return slot & _FLAG_MASK
+            i = (i + 1) & self._mask
+
+    def lookup(self, host: str) -> Tuple[int, Optional[str]]:
+        """(BLOCK | ALLOW | 0, listed suffix that decided)."""
+        if not host or not self.count:
+            return 0, None
+        for suffix in domain_suffixes(host):
+            flags = self._flags(suffix)
+            if flags:
+                return flags, suffix
+        return 0, None
+
+    def blocked_by(self, host: str) -> Optional[str]:
+        flags, suffix = self.lookup(host)
+        return suffix if flags == BLOCK else None
+
+    def close(self) -> None:
+        self._mm.close()
+
+
+class DomainIndexHandle:
+    """Current DomainIndex of a path, reopened when the file changes."""
+
+    def __init__(self, path: str, check_interval: float):
+        self.path = path
+        self.check_interval = check_interval
+        self._index: Optional[DomainIndex] = None
+        self._mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.reloads = 0
+
+    def _maybe_reload(self) -> None:
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except OSError:
+                mtime = None
+            if mtime == self._mtime:
+                return
+            old = self._index
+            try:
+                self._index = DomainIndex(self.path) if mtime is not None else None
+            except (OSError, ValueError):
+                logger.exception("Could not load domain index %s", self.path)
+                return
+            self._mtime = mtime
+            self.reloads += 1
+            if self._index is not None:
+                logger.info("Loaded domain index %s (%d domains)", self.path, self._index.count)
+            # the old map is left to the GC: a request may still be reading it
+            del old
+
+    def get(self) -> Optional[DomainIndex]:
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            self._maybe_reload()
+        return self._index
+
+    def metrics(self) -> Dict:
+        index = self._index
+        return {
+            "path": self.path,
+            "domains": index.count if index is not None else 0,
+            "reloads": self.reloads,
+        }
+
+
+def _list_files(spec: str) -> List[str]:
+    return [p.strip() for p in spec.split(",") if p.strip()]
+
+
+def ensure_domain_index() -> None:
+    """
+    Build DOMAIN_INDEX_PATH from the configured list files if it is missing
+    or older than any of them. Run at startup, off the event loop.
+    """
+    block_files = _list_files(settings.DOMAIN_BLOCKLIST_FILES)
+    allow_files = _list_files(settings.DOMAIN_ALLOWLIST_FILES)
+    if not settings.DOMAIN_INDEX_PATH or not (block_files or allow_files):
+        return
+    try:
+        index_mtime = os.stat(settings.DOMAIN_INDEX_PATH).st_mtime
+    except OSError:
+        index_mtime = None
+    try:
+        newest = max(os.stat(p).st_mtime for p in block_files + allow_files)
+    except OSError:
+        logger.exception("Domain list file missing")
+        return
+    if index_mtime is not None and index_mtime >= newest:
+        return
+
+    count = build_index(
+        (d for p in block_files for d in read_domain_file(p)),
+        (d for p in allow_files for d in read_domain_file(p)),
+        settings.DOMAIN_INDEX_PATH,
+    )
+    logger.info("Built domain index %s (%d domains)", settings.DOMAIN_INDEX_PATH, count)
+
+
+_handle: DomainIndexHandle | None = None
+
+
+def get_domain_index_handle() -> Optional[DomainIndexHandle]:
+    global _handle
+    if not settings.DOMAIN_INDEX_PATH:
+        return None
+    if _handle is None:
+        _handle = DomainIndexHandle(settings.DOMAIN_INDEX_PATH, settings.DOMAIN_INDEX_CHECK_INTERVAL)
+    return _handle
+
+
+def get_domain_index() -> Optional[DomainIndex]:
+    handle = get_domain_index_handle()
+    return handle.get() if handle is not None else None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compile domain lists into a domain index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build")
+    build.add_argument("--block", action="append", default=[], help="blocklist file (repeatable)")
+    build.add_argument("--allow", action="append", default=[], help="allowlist file (repeatable)")
+    build.add_argument("-o", "--output", default=settings.DOMAIN_INDEX_PATH)
+    lookup = sub.add_parser("lookup")
+    lookup.add_argument("host", nargs="+")
+    lookup.add_argument("-i", "--index", default=settings.DOMAIN_INDEX_PATH)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        count = build_index(
+            (d for p in args.block for d in read_domain_file(p)),
+            (d for p in args.allow for d in read_domain_file(p)),
+            args.output,
+        )
+        print(f"{args.output}: {count} domains")
+    else:
+        index = DomainIndex(args.index)
+        names = {BLOCK: "block", ALLOW: "allow", 0: "-"}
+        for host in args.host:
+            flags, suffix = index.lookup(host)
+            print(f"{host}\t{names[flags]}\t{suffix or ''}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+# app/services/fanout.py
+"""
+Concurrent fan-out over several search providers.
+
+Every provider is queried at once. A provider that has not answered after
+its own p95 latency gets one hedged duplicate request (first answer wins),
+each provider is cut off at its deadline, and whatever arrived by
+FANOUT_DEADLINE is merged:
+  - results are deduplicated on a normalized URL;
+  - ranks are merged with reciprocal rank fusion (RRF), so a result that
+    several providers rank highly wins over one provider's #1.
+One slow or dead upstream therefore costs at most the deadline, not the
+whole search.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import httpx
+
+from ..config import settings
+from .search_providers import BaseProvider
+from .upstream_health import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+# RRF damping constant (the usual value from the literature)
+RRF_K = 60
+
+_TRACKING_PARAMS = ("utm_", "fbclid", "gclid")
+
+
+def normalize_url(url: str) -> str:
+    """Key for dedup: same page even if scheme, www., slash or tracking differ."""
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:
+        return url
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    path = parts.path.rstrip("/") or "/"
+    query = sorted(
+        (k, v)
+        for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith(_TRACKING_PARAMS)
+    )
+    return urlunsplit(("", host, path, urlencode(query), ""))
+
+
+def rrf_merge(ranked_lists: Sequence[List[Dict]], limit: int) -> List[Dict]:
+    """Dedup on normalized URL and order by reciprocal rank fusion."""
+    scores: Dict[str, float] = {}
+    merged: Dict[str, Dict] = {}
+    for results in ranked_lists:
+        for rank, r in enumerate(results, start=1):
+            key = normalize_url(r["url"])
+            scores[key] = scores.get(key, 0.0) + 1.0 / (RRF_K + rank)
+            if key not in merged:
+                merged[key] = r
+            elif not merged[key].get("preview_url") and r.get("preview_url"):
+                # cached lists are shared: copy instead of mutating
+                merged[key] = {**merged[key], "preview_url": r["preview_url"]}
+
+    ordered = sorted(scores, key=lambda k: scores[k], reverse=True)
+    return [merged[k] for k in ordered[:limit]]
+
+
+class ProviderStats:
+    def __init__(self) -> None:
+        self.latency = LatencyTracker()
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def as_dict(self) -> Dict:
+        p50 = self.latency.percentile(0.5)
+        p95 = self.latency.percentile(0.95)
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+        }
+
+
+def parse_deadlines(spec: str) -> Dict[str, float]:
+    """"wikipedia=1.5,searxng=3" -> {"wikipedia": 1.5, "searxng": 3.0}"""
+    deadlines: Dict[str, float] = {}
+    for item in spec.split(","):
+        name, sep, value = item.partition("=")
+        if sep and name.strip():
+            try:
+                deadlines[name.strip().lower()] = float(value)
+            except ValueError:
+                logger.warning("Ignoring bad provider deadline %r", item)
+    return deadlines
+
+
+class FanOutProvider(BaseProvider):
+    name = "fanout"
+    # asearch is RRF-merged, asearch_iter is arrival order
+    streams_in_arrival_order = True
+
+    def __init__(
+        self,
+        providers: List[BaseProvider],
+        deadline: Optional[float] = None,
+        provider_deadlines: Optional[Dict[str, float]] = None,
+        hedge: Optional[bool] = None,
+        hedge_default_delay: Optional[float] = None,
+    ):
+        names = [p.name for p in providers]
+        if len(set(names)) != len(names):
+            # stats and hedging state are per name; duplicates would merge them
+            raise ValueError(f"Duplicate search provider names: {names}")
+        self.providers = providers
+        self.deadline = deadline if deadline is not None else settings.FANOUT_DEADLINE
+        self.provider_deadlines = (
+            provider_deadlines
+            if provider_deadlines is not None
+            else parse_deadlines(settings.FANOUT_PROVIDER_DEADLINES)
+        )
+        self.hedge = settings.FANOUT_HEDGE if hedge is None else hedge
+        self.hedge_default_delay = (
+            hedge_default_delay
+            if hedge_default_delay is not None
+            else settings.FANOUT_HEDGE_DEFAULT_DELAY
+        )
+        self.categories = "+".join(
+            f"{p.name}:{getattr(p, 'categories', '')}" for p in providers
+        )
+        self.stats: Dict[str, ProviderStats] = {p.name: ProviderStats() for p in providers}
+        self.partial = 0
+
+    def _deadline_for(self, provider: BaseProvider) -> float:
+        return min(self.provider_deadlines.get(provider.name, self.deadline), self.deadline)
+
+    async def _timed(self, provider: BaseProvider, query: str, limit: int, page: int) -> List[Dict]:
+        started = time.monotonic()
+        results = await provider.asearch(query, limit=limit, page=page)
+        self.stats[provider.name].latency.observe(time.monotonic() - started)
+        return results
+
+    async def _hedged(self, provider: BaseProvider, query: str, limit: int, page: int) -> List[Dict]:
+        """One request, plus a duplicate if the first is slower than this provider's p95."""
+        stats = self.stats[provider.name]
+        first = asyncio.ensure_future(self._timed(provider, query, limit, page))
+        second: Optional[asyncio.Future] = None
+        try:
+            if not self.hedge:
+                return await first
+
+            delay = stats.latency.percentile(0.95) or self.hedge_default_delay
+            done, _ = await asyncio.wait({first}, timeout=delay)
+            if done:
+                return first.result()
+
+            stats.hedges += 1
+            second = asyncio.ensure_future(self._timed(provider, query, limit, page))
+            attempts = {first, second}
+            while attempts:
+                done, attempts = await asyncio.wait(attempts, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            stats.hedge_wins += 1
+                        return task.result()
+            # both failed: report the original request's error
+            return first.result()
+        finally:
+            # the loser, or both when the deadline cancels us
+            first.cancel()
+            if second is not None:
+                second.cancel()
+
+    async def _call(
+        self, provider: BaseProvider, query: str, limit: int, page: int
+    ) -> Tuple[str, Optional[List[Dict]]]:
+        stats = self.stats[provider.name]
+        stats.calls += 1
+        try:
+            results = await asyncio.wait_for(
+                self._hedged(provider, query, limit, page), self._deadline_for(provider)
+            )
+            return provider.name, results
+        except asyncio.TimeoutError:
+            stats.timeouts += 1
+        except Exception:
+            stats.errors += 1
+            logger.warning("Search provider %s failed", provider.name, exc_info=True)
+        return provider.name, None
+
+    def _cancel_late(self, tasks: List[asyncio.Future]) -> None:
+        """
+        Cancel the calls still running at the overall deadline and count them
+        as timeouts: with the default per-provider deadline (= the overall
+        one) the outer wait fires first, so _call's own wait_for never does.
+        """
+        for provider, task in zip(self.providers, tasks):
+            if not task.done():
+                self.stats[provider.name].timeouts += 1
+                task.cancel()
+
+    async def asearch(self, query: str, limit: int = 10, page: int = 1) -> List[Dict]:
+        tasks = [
+            asyncio.ensure_future(self._call(p, query, limit, page)) for p in self.providers
+        ]
+        done, _ = await asyncio.wait(tasks, timeout=self.deadline)
+        self._cancel_late(tasks)
+
+        # keep provider order: earlier providers win RRF ties
+        answered = [t.result() for t in tasks if t in done]
+        ranked_lists = [results for _, results in answered if results is not None]
+        if not ranked_lists:
+            # surfaces as "upstream unavailable" and is not cached
+            raise httpx.ConnectError("No search provider answered before the deadline")
+        if len(ranked_lists) < len(self.providers):
+            self.partial += 1
+
+        return rrf_merge(ranked_lists, limit)
+
+    async def asearch_iter(
+        self, query: str, limit: int = 10, page: int = 1
+    ) -> AsyncIterator[List[Dict]]:
+        """
+        Each provider's results as soon as it answers, minus URLs already
+        sent. Arrival order, not RRF order: nothing waits for the slowest.
+        """
+        tasks = [
+            asyncio.ensure_future(self._call(p, query, limit, page)) for p in self.providers
+        ]
+        seen = set()
+        answered = 0
+        try:
+            for next_done in asyncio.as_completed(tasks, timeout=self.deadline):
+                try:
+                    _, results = await next_done
+                except asyncio.TimeoutError:
+                    self._cancel_late(tasks)
+                    break
+                if results is None:
+                    continue
+                answered += 1
+                batch = []
+                for r in results:
+                    key = normalize_url(r["url"])
+                    if key not in seen:
+                        seen.add(key)
+                        batch.append(r)
+                if batch:
+                    yield batch
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        if not answered:
+            raise httpx.ConnectError("No search provider answered before the deadline")
+        if answered < len(self.providers):
+            self.partial += 1
+
+    def search(self, query: str, limit: int = 10, page: int = 1) -> List[Dict]:
+        return asyncio.run(self.asearch(query, limit=limit, page=page))
+
+    def metrics(self) -> Dict:
+        return {
+            "partial_responses": self.partial,
+            "providers": {name: s.as_dict() for name, s in self.stats.items()},
+        }
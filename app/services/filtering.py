@@ -1,8 +1,12 @@
 # app/services/filtering.py
-from typing import Dict, List, Tuple
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Optional, Tuple
 from urllib.parse import urlparse
 
 from ..models import FilterMode, ResultType
+from .domain_index import DomainIndex, suffix_in_set
+from .keyword_matcher import KeywordMatcher
+from .text_classifier import TextClassifier
 
 
 # Very simple keyword lists – you can extend these
@@ -21,29 +25,53 @@ def get_base_keywords(mode: FilterMode) -> set[str]:
     return RELAXED_KEYWORDS
 
 
-def text_contains_banned(text: str, banned: set[str]) -> bool:
-    lowered = text.lower()
-    return any(word in lowered for word in banned)
-
-
 def parse_csv(text: str) -> List[str]:
     if not text:
         return []
     return [x.strip().lower() for x in text.split(",") if x.strip()]
 
 
-def filter_results(
-    raw_results: List[Dict],
+@lru_cache(maxsize=64)
+def get_keyword_matcher(
     filter_mode: FilterMode,
     blocked_keywords: str,
-    allowed_domains: str,
-) -> Tuple[List[Dict], int]:
-    base_keywords = get_base_keywords(filter_mode)
-    extra_blocked = set(parse_csv(blocked_keywords))
-    banned = base_keywords.union(extra_blocked)
+    word_boundary: bool = False,
+) -> KeywordMatcher:
+    """
+    Compiled matcher for (filter_mode, blocked_keywords CSV).
+    The raw CSV string acts as the keyword-set version, so editing the
+    settings produces a new cache entry instead of a stale match.
+    """
+    banned = frozenset(get_base_keywords(filter_mode).union(parse_csv(blocked_keywords)))
+    return KeywordMatcher(banned, word_boundary=word_boundary)
+
 
-    allowed = set(parse_csv(allowed_domains))
+@lru_cache(maxsize=64)
+def parse_domain_set(allowed_domains: str) -> FrozenSet[str]:
+    return frozenset(parse_csv(allowed_domains))
 
+
+def apply_filters(
+    raw_results: List[Dict],
+    matcher: KeywordMatcher,
+    allowed: FrozenSet[str],
+    blocked_terms: Optional[List[Tuple[str, str]]] = None,
+    domain_index: Optional[DomainIndex] = None,
+    classifier: Optional[TextClassifier] = None,
+    classifier_threshold: Optional[float] = None,
+) -> Tuple[List[Dict], int]:
+    """
+    Keyword, domain and classifier filtering of raw results, with an
+    already compiled matcher and parsed domain set.
+    Allowed domains match their subdomains too (wikipedia.org allows
+    en.wikipedia.org); hosts blocked by domain_index are dropped even
+    inside an allowed domain. Results that pass the keyword check are then
+    scored by the text classifier in one batch, if one is given with a
+    threshold.
+    If blocked_terms is given, a ("domain", domain), ("keyword", keyword)
+    or ("classifier", model version) reason is appended to it for every
+    blocked result.
+    """
     filtered: List[Dict] = []
     blocked_count = 0
 
@@ -52,17 +80,42 @@ def filter_results(
         text = f"{r['title']} {r['snippet']}"
         domain = (urlparse(url).hostname or "").lower()
 
-        # If allowed_domains defined, only allow those
-        if allowed and domain not in allowed:
+        # If allowed_domains defined, only allow those (and their subdomains)
+        if allowed and suffix_in_set(domain, allowed) is None:
             blocked_count += 1
+            if blocked_terms is not None:
+                blocked_terms.append(("domain", domain))
             continue
 
-        if text_contains_banned(text, banned):
+        # the blocklist applies inside allowed domains too (bad.example.com)
+        if domain_index is not None:
+            listed = domain_index.blocked_by(domain)
+            if listed is not None:
+                blocked_count += 1
+                if blocked_terms is not None:
+                    blocked_terms.append(("domain", listed))
+                continue
+
+        keyword = matcher.search(text)
+        if keyword is not None:
             blocked_count += 1
+            if blocked_terms is not None:
+                blocked_terms.append(("keyword", keyword))
             continue
 
         filtered.append(r)
 
+    if classifier is not None and classifier_threshold is not None and filtered:
+        scores = classifier.score([f"{r['title']} {r['snippet']}" for r in filtered])
+        kept = [r for r, score in zip(filtered, scores) if score < classifier_threshold]
+        dropped = len(filtered) - len(kept)
+        if dropped:
+            classifier.blocked += dropped
+            blocked_count += dropped
+            if blocked_terms is not None:
+                blocked_terms.extend([("classifier", classifier.version)] * dropped)
+        filtered = kept
+
     return filtered, blocked_count
 
 
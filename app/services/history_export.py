@@ -0,0 +1,184 @@
+# app/services/history_export.py
+"""
+Streaming export of search history.
+
+Rows come from a server-side cursor (stream_results + yield_per), are
+encoded into ~64 KiB chunks and optionally gzipped on the fly, so memory
+stays flat no matter how much history is exported. The generator owns its
+database session because it keeps reading after the request handler
+returned.
+"""
+from __future__ import annotations
+
+import csv
+import json
+import zlib
+from datetime import datetime, timezone
+from io import StringIO
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import select
+
+from .. import models
+from ..database import SessionLocal
+
+# format -> (media type, file extension)
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+}
+
+YIELD_PER = 1000
+CHUNK_SIZE = 64 * 1024
+
+QUERY_COLUMNS = ["id", "query", "created_at", "filter_mode", "total_results", "safe_results", "blocked_results"]
+RESULT_COLUMNS = ["result_id", "result_title", "result_url", "result_snippet", "result_type", "result_created_at"]
+
+
+def naive_utc(ts: Optional[datetime]) -> Optional[datetime]:
+    # created_at is stored as naive UTC
+    if ts is not None and ts.tzinfo is not None:
+        return ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+
+def _enum_value(v) -> str:
+    return v.value if hasattr(v, "value") else str(v)
+
+
+def _iso(ts: Optional[datetime]) -> Optional[str]:
+    return ts.isoformat() if ts is not None else None
+
+
+def _select_rows(start: Optional[datetime], end: Optional[datetime], include_results: bool):
+    q = models.SearchQuery
+    columns = [q.id, q.query, q.created_at, q.filter_mode, q.total_results, q.safe_results, q.blocked_results]
+    stmt = select(*columns)
+
+    if include_results:
+        r = models.SearchResult
+        stmt = select(*columns, r.id, r.title, r.url, r.snippet, r.type, r.created_at).outerjoin(
+            r, r.query_id == q.id
+        )
+
+    if start is not None:
+        stmt = stmt.where(q.created_at >= start)
+    if end is not None:
+        stmt = stmt.where(q.created_at < end)
+
+    # newest first (uses the (created_at, id) index); results of a query stay together
+    stmt = stmt.order_by(q.created_at.desc(), q.id.desc())
+    if include_results:
+        stmt = stmt.order_by(models.SearchResult.id)
+
+    return stmt.execution_options(stream_results=True, yield_per=YIELD_PER)
+
+
+def _csv_lines(rows, include_results: bool) -> Iterator[str]:
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(QUERY_COLUMNS + (RESULT_COLUMNS if include_results else []))
+
+    for row in rows:
+        values = [
+            row[0],
+            row[1],
+            _iso(row[2]),
+            _enum_value(row[3]),
+            row[4],
+            row[5],
+            row[6],
+        ]
+        if include_results:
+            # outer join: queries without stored results get empty columns
+            result_type = _enum_value(row[11]) if row[11] is not None else None
+            values += [row[7], row[8], row[9], row[10], result_type, _iso(row[12])]
+        writer.writerow(values)
+
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+
+def _query_object(row) -> Dict:
+    return {
+        "id": row[0],
+        "query": row[1],
+        "created_at": _iso(row[2]),
+        "filter_mode": _enum_value(row[3]),
+        "total_results": row[4],
+        "safe_results": row[5],
+        "blocked_results": row[6],
+    }
+
+
+def _ndjson_lines(rows, include_results: bool) -> Iterator[str]:
+    if not include_results:
+        for row in rows:
+            yield json.dumps(_query_object(row)) + "\n"
+        return
+
+    # rows arrive grouped by query: emit one object per query with its results
+    current: Optional[Dict] = None
+    results: List[Dict] = []
+    for row in rows:
+        if current is None or current["id"] != row[0]:
+            if current is not None:
+                yield json.dumps({**current, "results": results}) + "\n"
+            current, results = _query_object(row), []
+        if row[7] is not None:
+            results.append({
+                "id": row[7],
+                "title": row[8],
+                "url": row[9],
+                "snippet": row[10],
+                "type": _enum_value(row[11]),
+                "created_at": _iso(row[12]),
+            })
+    if current is not None:
+        yield json.dumps({**current, "results": results}) + "\n"
+
+
+def _chunked(lines: Iterator[str]) -> Iterator[bytes]:
+    pending: List[str] = []
+    size = 0
+    for line in lines:
+        pending.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield "".join(pending).encode("utf-8")
+            pending, size = [], 0
+    if pending:
+        yield "".join(pending).encode("utf-8")
+
+
+def _gzipped(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_history(
+    format: str,
+    gzip: bool = False,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    include_results: bool = False,
+) -> Iterator[bytes]:
+    """
+    Byte chunks of the export; run by StreamingResponse in the threadpool.
+    start/end are naive UTC (see naive_utc).
+    """
+    encode = _csv_lines if format == "csv" else _ndjson_lines
+    stmt = _select_rows(start, end, include_results)
+
+    with SessionLocal() as db:
+        rows = db.execute(stmt)
+        chunks = _chunked(encode(rows, include_results))
+        yield from _gzipped(chunks) if gzip else chunks
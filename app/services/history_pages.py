@@ -0,0 +1,52 @@
+# app/services/history_pages.py
+"""
+Keyset pagination over stored history.
+
+Pages are addressed by the (created_at, id) of the last row already seen,
+never by OFFSET, so page 1000 costs the same index range scan as page 1
+(composite indexes on (created_at, id) and (query_id, created_at, id)).
+"""
+from typing import List, Optional, Tuple
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..utils.cursors import decode_keyset, encode_keyset
+
+
+def page_queries(
+    db: Session, limit: int, cursor: Optional[str] = None
+) -> Tuple[List[models.SearchQuery], Optional[str]]:
+    """Newest queries first; returns (rows, next cursor or None)."""
+    q = models.SearchQuery
+    stmt = select(q).order_by(q.created_at.desc(), q.id.desc())
+
+    after = decode_keyset(cursor)
+    if after is not None:
+        stmt = stmt.where(tuple_(q.created_at, q.id) < tuple_(*after))
+
+    # one extra row tells us whether there is a next page
+    rows = db.execute(stmt.limit(limit + 1)).scalars().all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_keyset(rows[-1].created_at, rows[-1].id)
+
+
+def page_results(
+    db: Session, query_id: int, limit: int, cursor: Optional[str] = None
+) -> Tuple[List[models.SearchResult], Optional[str]]:
+    """Stored results of one query in rank order (insertion order)."""
+    r = models.SearchResult
+    stmt = select(r).where(r.query_id == query_id).order_by(r.created_at, r.id)
+
+    after = decode_keyset(cursor)
+    if after is not None:
+        stmt = stmt.where(tuple_(r.created_at, r.id) > tuple_(*after))
+
+    rows = db.execute(stmt.limit(limit + 1)).scalars().all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_keyset(rows[-1].created_at, rows[-1].id)
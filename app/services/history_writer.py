@@ -0,0 +1,303 @@
+# app/services/history_writer.py
+"""
+Write-behind persistence of search history.
+
+perform_search used to add every SearchResult, flush, commit and refresh on
+the request path. With HISTORY_WRITE_BEHIND the rows are handed to this
+recorder instead: ids come from a prefetched block of sequence values (so
+the response can carry them without a DB round trip) and a background task
+writes the buffered rows with multi-row INSERTs, one transaction per batch.
+
+The queue is bounded (HISTORY_QUEUE_SIZE). When it is full, new history is
+dropped rather than slowing down searches; drops and slow flushes are
+counted and exposed under /api/metrics. Pending rows are flushed on
+shutdown.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import insert, text
+
+from ..config import settings
+from ..database import engine
+from .. import models
+from .rollups import record_blocked_terms, record_searches
+
+logger = logging.getLogger(__name__)
+
+
+class IdAllocator:
+    """Hands out primary keys from prefetched blocks of a Postgres sequence."""
+
+    def __init__(self, table: str, block_size: int):
+        self.table = table
+        self.block_size = max(1, block_size)
+        self._ids: Deque[int] = deque()
+        self._lock: Optional[asyncio.Lock] = None
+        self._refill_task: Optional[asyncio.Task] = None
+
+    def _fetch_block(self, n: int) -> List[int]:
+        with engine.connect() as conn:
+            rows = conn.execute(
+                text(
+                    "SELECT nextval(pg_get_serial_sequence(:table, 'id')) "
+                    "FROM generate_series(1, :n)"
+                ),
+                {"table": self.table, "n": n},
+            )
+            return [row[0] for row in rows]
+
+    async def _refill(self, needed: int) -> None:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if len(self._ids) >= needed:
+                return
+            block = await run_in_threadpool(self._fetch_block, max(self.block_size, needed))
+            self._ids.extend(block)
+
+    async def take(self, n: int) -> List[int]:
+        while len(self._ids) < n:
+            # pool ran dry: this request pays for a round trip. Re-check
+            # afterwards: other coroutines may have drained the new block.
+            await self._refill(n)
+        # no await between the check and the pops
+        ids = [self._ids.popleft() for _ in range(n)]
+
+        # refill ahead of time so the next requests don't have to wait
+        if len(self._ids) < self.block_size // 2 and (
+            self._refill_task is None or self._refill_task.done()
+        ):
+            self._refill_task = asyncio.get_running_loop().create_task(
+                self._refill(self.block_size)
+            )
+        return ids
+
+
+@dataclass
+class HistoryRecord:
+    query: Dict
+    results: List[Dict]
+    # (kind, term) reasons for the results that were filtered out
+    blocked_terms: Sequence[Tuple[str, str]]
+    enqueued_at: float
+
+
+class HistoryWriter:
+    def __init__(
+        self,
+        queue_size: int,
+        batch_size: int,
+        flush_interval: float,
+        delay_warn: float,
+        id_block: int,
+    ):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.delay_warn = delay_warn
+        self.query_ids = IdAllocator(models.SearchQuery.__tablename__, id_block)
+        self.result_ids = IdAllocator(models.SearchResult.__tablename__, id_block * 10)
+
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.delayed = 0
+        self.failed = 0
+        self.max_lag = 0.0
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def record(
+        self,
+        query_row: Dict,
+        result_rows: List[Dict],
+        blocked_terms: Sequence[Tuple[str, str]] = (),
+    ) -> bool:
+        """Queue one search for writing. Never blocks; returns False if dropped."""
+        record = HistoryRecord(query_row, result_rows, blocked_terms, time.monotonic())
+        try:
+            self._queue.put_nowait(record)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning("History queue full, dropping search history row")
+            return False
+        self.enqueued += 1
+        return True
+
+    async def _get(self, timeout: Optional[float]) -> Optional[HistoryRecord]:
+        """Next queued record; None on timeout or when stop() was called."""
+        get = asyncio.ensure_future(self._queue.get())
+        stopping = asyncio.ensure_future(self._stopping.wait())
+        try:
+            await asyncio.wait(
+                {get, stopping}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+        finally:
+            stopping.cancel()
+            if not get.done():
+                # a cancelled Queue.get does not consume an item
+                get.cancel()
+        if get.done() and not get.cancelled():
+            return get.result()
+        return None
+
+    async def _next_batch(self) -> List[HistoryRecord]:
+        """
+        Up to batch_size records, waiting at most flush_interval after the
+        first one. Returns early (possibly empty) once stop() is called;
+        records already taken off the queue are always returned, never lost.
+        """
+        batch: List[HistoryRecord] = []
+        deadline: Optional[float] = None
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                if self._stopping.is_set():
+                    break
+                timeout = None if deadline is None else deadline - time.monotonic()
+                if timeout is not None and timeout <= 0:
+                    break
+                record = await self._get(timeout)
+                if record is None:
+                    continue  # re-checks the queue, the stop flag and the deadline
+                batch.append(record)
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+        return batch
+
+    def _write_batch(self, batch: List[HistoryRecord]) -> None:
+        query_rows = [record.query for record in batch]
+        result_rows = [row for record in batch for row in record.results]
+        with engine.begin() as conn:
+            # executemany: SQLAlchemy turns these into multi-row INSERT ... VALUES
+            conn.execute(insert(models.SearchQuery), query_rows)
+            if result_rows:
+                conn.execute(insert(models.SearchResult), result_rows)
+            record_searches(conn, query_rows)
+            record_blocked_terms(
+                conn,
+                (
+                    (record.query["created_at"], kind, term)
+                    for record in batch
+                    for kind, term in record.blocked_terms
+                ),
+            )
+
+    async def _flush(self, batch: List[HistoryRecord]) -> None:
+        try:
+            await run_in_threadpool(self._write_batch, batch)
+        except Exception:
+            self.failed += len(batch)
+            logger.exception("Failed to write %d search history rows", len(batch))
+            return
+
+        now = time.monotonic()
+        self.written += len(batch)
+        for record in batch:
+            lag = now - record.enqueued_at
+            self.max_lag = max(self.max_lag, lag)
+            if lag > self.delay_warn:
+                self.delayed += 1
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._next_batch()
+            if batch:
+                await self._flush(batch)
+            if self._stopping.is_set() and self._queue.empty():
+                return
+
+    async def stop(self) -> None:
+        """Let the background task write the partial batch and drain the queue, then stop."""
+        self._stopping.set()
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+        # only reached with rows left if the task died or was never started
+        pending: List[HistoryRecord] = []
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        for i in range(0, len(pending), self.batch_size):
+            await self._flush(pending[i : i + self.batch_size])
+
+    def metrics(self) -> Dict:
+        return {
+            "queued": self._queue.qsize(),
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "delayed": self.delayed,
+            "failed": self.failed,
+            "max_lag_s": round(self.max_lag, 3),
+        }
+
+
+_writer: HistoryWriter | None = None
+
+
+def save_search(
+    query_row: Dict,
+    result_rows: List[Dict],
+    blocked_terms: Sequence[Tuple[str, str]] = (),
+) -> int:
+    """
+    Insert one search with database-generated ids, in one transaction
+    (used off the response path when write-behind is unavailable).
+    Returns the new query id.
+    """
+    with engine.begin() as conn:
+        query_id = conn.execute(insert(models.SearchQuery).values(**query_row)).inserted_primary_key[0]
+        if result_rows:
+            conn.execute(
+                insert(models.SearchResult),
+                [{**row, "query_id": query_id} for row in result_rows],
+            )
+        record_searches(conn, [query_row])
+        record_blocked_terms(
+            conn, ((query_row["created_at"], kind, term) for kind, term in blocked_terms)
+        )
+    return query_id
+
+
+def write_behind_available() -> bool:
+    # sequence-prefetched ids need Postgres
+    return settings.HISTORY_WRITE_BEHIND and engine.url.get_backend_name() == "postgresql"
+
+
+def get_history_writer() -> Optional[HistoryWriter]:
+    return _writer
+
+
+def start_history_writer() -> None:
+    global _writer
+    if _writer is None and write_behind_available():
+        _writer = HistoryWriter(
+            queue_size=settings.HISTORY_QUEUE_SIZE,
+            batch_size=settings.HISTORY_BATCH_SIZE,
+            flush_interval=settings.HISTORY_FLUSH_INTERVAL,
+            delay_warn=settings.HISTORY_DELAY_WARN,
+            id_block=settings.HISTORY_ID_BLOCK,
+        )
+        _writer.start()
+
+
+async def stop_history_writer() -> None:
+    global _writer
+    if _writer is not None:
+        await _writer.stop()
+        _writer = None
@@ -0,0 +1,250 @@
+# app/services/http_client.py
+"""
+Managed outbound HTTP clients.
+
+Every upstream host (SearxNG, image CDNs, ...) gets its own keep-alive
+connection pool with a bounded number of concurrent requests, so one
+image-heavy results page cannot starve the search provider of sockets.
+Pools are created lazily, the least recently used one is closed when there
+are too many hosts, and everything is closed from the FastAPI lifespan.
+
+Requests also go through the host's UpstreamHealth (services/upstream_health.py):
+an open circuit breaker fails them immediately with CircuitOpenError, and
+the read timeout adapts to the host's observed latency.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict
+from urllib.parse import urlsplit
+
+import httpx
+
+from ..config import settings
+from .upstream_health import UpstreamHealth, UpstreamRegistry
+
+USER_AGENT = "NetSentinelSafeSearch/1.0 (student project; contact: youremail@example.com)"
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(
+        settings.HTTP_READ_TIMEOUT,
+        connect=settings.HTTP_CONNECT_TIMEOUT,
+        pool=settings.HTTP_POOL_TIMEOUT,
+    )
+
+
+def _limits(max_connections: int) -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=min(settings.HTTP_POOL_MAX_KEEPALIVE_PER_HOST, max_connections),
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+def origin_of(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}".lower()
+
+
+class HostPool:
+    """Connection pool + concurrency accounting for one origin."""
+
+    def __init__(self, origin: str, max_connections: int):
+        self.origin = origin
+        self.max_connections = max_connections
+        self.client = httpx.AsyncClient(
+            headers={"User-Agent": USER_AGENT},
+            timeout=_timeout(),
+            limits=_limits(max_connections),
+        )
+        self._slots = asyncio.Semaphore(max_connections)
+
+        self.active = 0
+        self.requests = 0
+        self.errors = 0
+        self.waits = 0
+        self.wait_time_total = 0.0
+        self.last_used = time.monotonic()
+
+    def idle_connections(self) -> int:
+        # httpx does not expose pool state publicly; peek at httpcore's pool
+        pool = getattr(getattr(self.client, "_transport", None), "_pool", None)
+        try:
+            return sum(1 for conn in pool.connections if conn.is_idle())
+        except Exception:
+            return 0
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        self.last_used = time.monotonic()
+        if self._slots.locked():
+            self.waits += 1
+            started = time.monotonic()
+            try:
+                await asyncio.wait_for(self._slots.acquire(), settings.HTTP_POOL_TIMEOUT)
+            except asyncio.TimeoutError:
+                self.errors += 1
+                raise httpx.PoolTimeout(f"No free connection for {self.origin}")
+            self.wait_time_total += time.monotonic() - started
+        else:
+            await self._slots.acquire()
+
+        self.active += 1
+        self.requests += 1
+        try:
+            yield
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.active -= 1
+            self._slots.release()
+
+    def metrics(self) -> Dict:
+        return {
+            "max_connections": self.max_connections,
+            "active": self.active,
+            "idle": self.idle_connections(),
+            "requests": self.requests,
+            "errors": self.errors,
+            "waits": self.waits,
+            "wait_time_total_s": round(self.wait_time_total, 3),
+        }
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+
+class HTTPClientManager:
+    def __init__(self):
+        self._pools: "OrderedDict[str, HostPool]" = OrderedDict()
+        self._sync_client: httpx.Client | None = None
+        self.upstreams = UpstreamRegistry(max_hosts=settings.HTTP_MAX_HOST_POOLS * 4)
+        self.evictions = 0
+
+    def _max_connections_for(self, origin: str) -> int:
+        if origin == origin_of(settings.SEARXNG_URL):
+            return settings.HTTP_POOL_MAX_CONNECTIONS_SEARXNG
+        return settings.HTTP_POOL_MAX_CONNECTIONS_PER_HOST
+
+    def pool_for(self, url: str) -> HostPool:
+        origin = origin_of(url)
+        pool = self._pools.get(origin)
+        if pool is not None:
+            self._pools.move_to_end(origin)
+            return pool
+
+        pool = HostPool(origin, self._max_connections_for(origin))
+        self._pools[origin] = pool
+        self._evict_idle_pools()
+        return pool
+
+    def _evict_idle_pools(self) -> None:
+        # too many distinct image hosts: drop the least recently used idle ones
+        for origin in list(self._pools):
+            if len(self._pools) <= settings.HTTP_MAX_HOST_POOLS:
+                break
+            pool = self._pools[origin]
+            if pool.active:
+                continue
+            del self._pools[origin]
+            self.evictions += 1
+            asyncio.get_running_loop().create_task(pool.aclose())
+
+    @asynccontextmanager
+    async def _guarded(self, url: str, kwargs: Dict) -> AsyncIterator[UpstreamHealth]:
+        """Breaker check + adaptive timeout around one request; the caller reports the outcome."""
+        health = self.upstreams.get(origin_of(url))
+        health.check()
+        kwargs.setdefault("timeout", health.timeout())
+        try:
+            yield health
+        except httpx.PoolTimeout:
+            # our own connection limit, not the upstream's fault
+            health.release()
+            raise
+        except httpx.TransportError:
+            health.record_failure()
+            raise
+        except BaseException:
+            health.release()
+            raise
+
+    @staticmethod
+    def _record(health: UpstreamHealth, resp: httpx.Response, started: float) -> None:
+        if resp.status_code >= 500:
+            health.record_failure()
+        else:
+            health.record_success(time.monotonic() - started)
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        pool = self.pool_for(url)
+        async with self._guarded(url, kwargs) as health:
+            async with pool.slot():
+                started = time.monotonic()
+                resp = await pool.client.request(method, url, **kwargs)
+            self._record(health, resp, started)
+            return resp
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs) -> AsyncIterator[httpx.Response]:
+        """Streamed response; the connection slot is held until the block exits."""
+        pool = self.pool_for(url)
+        async with self._guarded(url, kwargs) as health:
+            async with pool.slot():
+                started = time.monotonic()
+                async with pool.client.stream(method, url, **kwargs) as resp:
+                    # time to headers: the body is the caller's business
+                    self._record(health, resp, started)
+                    yield resp
+
+    def sync_client(self) -> httpx.Client:
+        """Pooled blocking client for code that still runs in threads."""
+        if self._sync_client is None or self._sync_client.is_closed:
+            self._sync_client = httpx.Client(
+                headers={"User-Agent": USER_AGENT},
+                timeout=_timeout(),
+                limits=_limits(settings.HTTP_POOL_MAX_CONNECTIONS_PER_HOST),
+            )
+        return self._sync_client
+
+    def metrics(self) -> Dict:
+        return {
+            "hosts": {origin: pool.metrics() for origin, pool in self._pools.items()},
+            "active": sum(p.active for p in self._pools.values()),
+            "idle": sum(p.idle_connections() for p in self._pools.values()),
+            "waits": sum(p.waits for p in self._pools.values()),
+            "pool_evictions": self.evictions,
+        }
+
+    async def aclose(self) -> None:
+        pools = list(self._pools.values())
+        self._pools.clear()
+        await asyncio.gather(*(p.aclose() for p in pools), return_exceptions=True)
+        if self._sync_client is not None:
+            self._sync_client.close()
+            self._sync_client = None
+
+
+_manager: HTTPClientManager | None = None
+
+
+def get_http_manager() -> HTTPClientManager:
+    global _manager
+    if _manager is None:
+        _manager = HTTPClientManager()
+    return _manager
+
+
+async def aclose_http_manager() -> None:
+    global _manager
+    if _manager is not None:
+        await _manager.aclose()
+        _manager = None
@@ -1,14 +1,18 @@
 # app/services/image_moderation.py
 from __future__ import annotations
+import time
 from io import BytesIO
-from typing import Tuple, Optional
+from typing import TYPE_CHECKING, Dict, List, Tuple, Optional, Union
 
 from PIL import Image, ImageFilter
-from nudenet import NudeDetector
 
-# new imports
-import torch
-from transformers import AutoModelForImageClassification, ViTImageProcessor
+from ..config import settings
+
+# nudenet / torch / transformers are imported lazily: importing them costs
+# seconds and hundreds of MB, and search-only workers never need them.
+if TYPE_CHECKING:
+    from nudenet import NudeDetector
+    from transformers import AutoModelForImageClassification, ViTImageProcessor
 
 _detector: NudeDetector | None = None
 _classifier_model: Optional[AutoModelForImageClassification] = None
@@ -17,12 +21,16 @@ _classifier_processor: Optional[ViTImageProcessor] = None
 def get_detector() -> NudeDetector:
     global _detector
     if _detector is None:
+        from nudenet import NudeDetector
+
         _detector = NudeDetector()
     return _detector
 
 def get_classifier():
     global _classifier_model, _classifier_processor
     if _classifier_model is None:
+        from transformers import AutoModelForImageClassification, ViTImageProcessor
+
         _classifier_model = AutoModelForImageClassification.from_pretrained(
             "Falconsai/nsfw_image_detection"
         )
@@ -31,33 +39,235 @@ def get_classifier():
         )
     return _classifier_model, _classifier_processor
 
-def classify_nsfw(image_bytes: bytes) -> bool:
+# NudeNet v3 labels that count as nudity
+UNSAFE_DETECTOR_CLASSES = {
+    "FEMALE_GENITALIA_EXPOSED",
+    "MALE_GENITALIA_EXPOSED",
+    "FEMALE_BREAST_EXPOSED",
+    "BUTTOCKS_EXPOSED",
+    "ANUS_EXPOSED",
+}
+
+
+def classifier_scores(images: List[Image.Image]) -> List[float]:
+    """NSFW probability per image, one batched forward pass."""
+    if not images:
+        return []
+    import torch
+
     model, proc = get_classifier()
-    image = Image.open(BytesIO(image_bytes)).convert("RGB")
-    inputs = proc(images=image, return_tensors="pt")
-    with torch.no_grad():
-        outputs = model(**inputs)
-        logits = outputs.logits
-    cls_idx = logits.argmax(-1).item()
-    label = model.config.id2label[cls_idx]
-    return (label.lower() == "nsfw")
-
-def censor_if_needed(image_bytes: bytes, threshold: float = 0.5) -> Tuple[bytes, bool]:
-    # first, run detector (your existing logic)
-    det = get_detector()
-    detections = det.detect(image_bytes)
-    # your existing detection logic...
-    # For brevity, suppose you have a helper is_nude_by_detector(...)
-    if is_nude_by_detector(detections, threshold):
-        return blur_image(image_bytes), True
-
-    # then run classifier as fallback
+    inputs = proc(images=images, return_tensors="pt")
+    with torch.inference_mode():
+        probs = model(**inputs).logits.softmax(-1)
+    nsfw_idx = next(
+        idx for idx, label in model.config.id2label.items() if label.lower() == "nsfw"
+    )
+    return probs[:, nsfw_idx].tolist()
+
+
+def _to_detector_input(image: Image.Image):
+    # NudeNet reads numpy arrays in OpenCV (BGR) order
+    import numpy as np
+
+    return np.ascontiguousarray(np.asarray(image)[:, :, ::-1])
+
+
+def _detect_batch(det: NudeDetector, images: list) -> List[Union[list, Exception]]:
+    if hasattr(det, "detect_batch"):
+        try:
+            return det.detect_batch(images, batch_size=len(images))
+        except Exception:
+            # one bad image fails the whole batch; retry one by one below
+            pass
+
+    out: List[Union[list, Exception]] = []
+    for image in images:
+        try:
+            out.append(det.detect(image))
+        except Exception as exc:
+            out.append(exc)
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Moderation cascade
+#
+# Every stage maps a batch of decoded images to (nsfw_score, safe_confidence)
+# pairs. Images run through MODERATION_CASCADE in order; an image leaves the
+# cascade as soon as one stage is confident:
+#   - nsfw_score >= that stage's cut          -> NSFW, blur it
+#   - safe_confidence >= MODERATION_SAFE_CONFIDENCE -> safe, skip the rest
+# The last stage's verdict is final either way.
+#
+# The default order is classifier, detector: the classifier clears most safe
+# images on its own (p(nsfw) <= 1 - MODERATION_SAFE_CONFIDENCE). The
+# detector only clears images with MODERATION_DETECTOR_CAN_CLEAR: "no
+# exposed body parts found" is exactly what drawings and tight crops look
+# like to NudeNet, so as an early stage it can only confirm NSFW.
+# ---------------------------------------------------------------------------
+
+StageResult = Tuple[float, float]  # (nsfw_score, safe_confidence)
+
+
+def detector_stage(images: List[Image.Image]) -> List[Union[StageResult, Exception]]:
+    detections = _detect_batch(get_detector(), [_to_detector_input(img) for img in images])
+    out: List[Union[StageResult, Exception]] = []
+    for dets in detections:
+        if isinstance(dets, Exception):
+            out.append(dets)
+            continue
+        dets = dets or []
+        nsfw = max(
+            (d.get("score", 0.0) for d in dets if d.get("class") in UNSAFE_DETECTOR_CLASSES),
+            default=0.0,
+        )
+        if settings.MODERATION_DETECTOR_CAN_CLEAR:
+            # opt-in: nothing human-looking found at all -> confidently safe
+            anything = max((d.get("score", 0.0) for d in dets), default=0.0)
+            out.append((nsfw, 1.0 - anything))
+        else:
+            # can confirm NSFW, never clear: the next stage decides
+            out.append((nsfw, 0.0))
+    return out
+
+
+def classifier_stage(images: List[Image.Image]) -> List[Union[StageResult, Exception]]:
     try:
-        if classify_nsfw(image_bytes):
-            return blur_image(image_bytes), True
-    except Exception:
-        # classifier failure — optionally log
-        pass
-
-    # otherwise safe
-    return image_bytes, False
+        scores = classifier_scores(images)
+    except Exception as exc:
+        # fail closed: a per-item error is never turned into a (cached) "safe"
+        return [exc] * len(images)
+    return [(p, 1.0 - p) for p in scores]
+
+
+STAGES = {
+    "detector": detector_stage,
+    "classifier": classifier_stage,
+}
+
+
+def _stage_cut(stage: str, threshold: float) -> float:
+    # the request threshold applies to detector boxes; the classifier keeps
+    # its argmax decision (p >= 0.5 for a two-label model)
+    return threshold if stage == "detector" else 0.5
+
+
+def decode_image(image_bytes: bytes, max_side: int) -> Image.Image:
+    """Decode once and downscale once; every stage works on this image."""
+    image = Image.open(BytesIO(image_bytes))
+    image.draft("RGB", (max_side, max_side))  # cheap JPEG DCT downscale
+    image = image.convert("RGB")
+    image.thumbnail((max_side, max_side))
+    return image
+
+
+def _blur(image: Image.Image, radius: int = 30) -> bytes:
+    out = BytesIO()
+    image.filter(ImageFilter.GaussianBlur(radius)).save(out, format="JPEG", quality=80)
+    return out.getvalue()
+
+
+def censor_batch(
+    items: List[Tuple[bytes, float]],
+) -> List[Union[Tuple[bytes, bool, Dict[str, float]], Exception]]:
+    """
+    Batched moderation: items are (image_bytes, threshold).
+    Returns one (output_bytes, is_nsfw, stage_ms) per item, or the exception
+    that item raised, so one broken image does not fail its neighbours.
+    stage_ms holds this item's share of each stage's batch time.
+    """
+    n = len(items)
+    results: List[Union[Tuple[bytes, bool, Dict[str, float]], Exception, None]] = [None] * n
+    stage_ms: List[Dict[str, float]] = [{} for _ in range(n)]
+    images: Dict[int, Image.Image] = {}
+
+    started = time.perf_counter()
+    for i, (image_bytes, _) in enumerate(items):
+        try:
+            images[i] = decode_image(image_bytes, settings.MODERATION_MAX_SIDE)
+        except Exception as exc:
+            results[i] = exc
+    if images:
+        share = (time.perf_counter() - started) * 1000 / len(images)
+        for i in images:
+            stage_ms[i]["decode"] = share
+
+    stages = [s.strip() for s in settings.MODERATION_CASCADE.split(",") if s.strip() in STAGES]
+    remaining = list(images)
+
+    for pos, stage in enumerate(stages):
+        if not remaining:
+            break
+        last = pos == len(stages) - 1
+
+        started = time.perf_counter()
+        outputs = STAGES[stage]([images[i] for i in remaining])
+        share = (time.perf_counter() - started) * 1000 / len(remaining)
+
+        still: List[int] = []
+        for i, out in zip(remaining, outputs):
+            stage_ms[i][stage] = share
+            if isinstance(out, Exception):
+                results[i] = out
+                continue
+            nsfw, safe_conf = out
+            if nsfw >= _stage_cut(stage, items[i][1]):
+                results[i] = (_blur(images[i]), True, stage_ms[i])
+            elif last or safe_conf >= settings.MODERATION_SAFE_CONFIDENCE:
+                results[i] = (items[i][0], False, stage_ms[i])
+            else:
+                still.append(i)
+        remaining = still
+
+    # no stage configured (or all skipped): nothing to judge, pass through
+    for i in remaining:
+        results[i] = (items[i][0], False, stage_ms[i])
+
+    return results
+
+
+# per-stage timing, aggregated in the API process (see record_stage_timings)
+_stage_stats: Dict[str, Dict[str, float]] = {}
+
+
+def record_stage_timings(stage_ms: Dict[str, float]) -> None:
+    for stage, ms in stage_ms.items():
+        stats = _stage_stats.setdefault(stage, {"count": 0, "total_ms": 0.0})
+        stats["count"] += 1
+        stats["total_ms"] += ms
+
+
+def stage_metrics() -> Dict[str, Dict[str, float]]:
+    return {
+        stage: {
+            "count": int(stats["count"]),
+            "avg_ms": round(stats["total_ms"] / stats["count"], 2) if stats["count"] else 0.0,
+        }
+        for stage, stats in _stage_stats.items()
+    }
+
+
+def warm_up() -> Dict[str, float]:
+    """
+    Load both models and run one dummy inference through the batch path, so
+    the first real request does not pay for lazy init / kernel selection.
+    Returns the time spent per step in seconds.
+    """
+    timings: Dict[str, float] = {}
+
+    started = time.perf_counter()
+    get_detector()
+    timings["load_detector"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    get_classifier()
+    timings["load_classifier"] = time.perf_counter() - started
+
+    # run every stage directly: the cascade could short-circuit a dummy image
+    dummy = Image.new("RGB", (64, 64), color=(127, 127, 127))
+    for name, stage in STAGES.items():
+        started = time.perf_counter()
+        stage([dummy])
+        timings[f"warm_{name}"] = time.perf_counter() - started
+
+    return timings
@@ -0,0 +1,109 @@
+# app/services/keyword_matcher.py
+"""
+Compiled multi-keyword matcher.
+
+All keywords are folded into a prefix trie and emitted as ONE regular
+expression (shared prefixes become nested groups), so scanning a text is a
+single pass in C regardless of how many keywords the admin configured.
+
+Small substring lists skip the regex: `kw in text` per keyword is faster
+until roughly a hundred keywords (benchmarks/bench_keyword_matcher.py: the
+trie was 0.4x the loop at 10 keywords, break-even around 120).
+"""
+from __future__ import annotations
+
+import re
+from typing import Dict, FrozenSet, Iterable, Optional, Tuple
+
+_END = ""  # trie terminal marker
+
+# up to this many keywords, substring mode uses a plain `in` loop
+LOOP_MAX_KEYWORDS = 100
+
+
+def _build_trie(words: Iterable[str]) -> Dict:
+    trie: Dict = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[_END] = {}
+    return trie
+
+
+def _trie_to_pattern(node: Dict) -> str:
+    terminal = _END in node
+    branches = []
+    single_chars = []
+
+    for ch in sorted(k for k in node if k != _END):
+        sub = _trie_to_pattern(node[ch])
+        if sub:
+            branches.append(re.escape(ch) + sub)
+        else:
+            single_chars.append(re.escape(ch))
+
+    if single_chars:
+        if len(single_chars) == 1:
+            branches.append(single_chars[0])
+        else:
+            branches.append("[" + "".join(single_chars) + "]")
+
+    if not branches:
+        return ""
+
+    if len(branches) == 1 and not terminal:
+        return branches[0]
+
+    pattern = "(?:" + "|".join(branches) + ")"
+    if terminal:
+        # a shorter keyword ends here; the rest is optional
+        pattern += "?"
+    return pattern
+
+
+class KeywordMatcher:
+    """
+    Matches a text against a fixed keyword set in one pass.
+
+    word_boundary=False keeps the historical substring behaviour
+    ("sex" matches "Essex"); word_boundary=True only matches whole words.
+    """
+
+    def __init__(self, keywords: Iterable[str], word_boundary: bool = False):
+        words = sorted({k.strip().lower() for k in keywords if k and k.strip()})
+        self.keywords: FrozenSet[str] = frozenset(words)
+        self.word_boundary = word_boundary
+        self._pattern: Optional[re.Pattern] = None
+        # sorted, so the reported keyword does not depend on set order
+        self._loop_words: Optional[Tuple[str, ...]] = None
+
+        if words and not word_boundary and len(words) <= LOOP_MAX_KEYWORDS:
+            self._loop_words = tuple(words)
+        elif words:
+            body = _trie_to_pattern(_build_trie(words))
+            if word_boundary:
+                body = r"(?<!\w)" + body + r"(?!\w)"
+            self._pattern = re.compile(body)
+
+    def __len__(self) -> int:
+        return len(self.keywords)
+
+    def search(self, text: str) -> Optional[str]:
+        """Return the first keyword found in text, or None."""
+        if not text:
+            return None
+        if self._loop_words is not None:
+            lowered = text.lower()
+            for word in self._loop_words:
+                if word in lowered:
+                    return word
+            return None
+        if self._pattern is None:
+            return None
+        m = self._pattern.search(text.lower())
+        return m.group(0) if m else None
+
+    def matches(self, text: str) -> bool:
+        return self.search(text) is not None
+
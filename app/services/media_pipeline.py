@@ -0,0 +1,252 @@
+# app/services/media_pipeline.py
+"""
+Image proxy pipeline: fetch -> validate -> thumbnail -> moderate.
+
+The remote body is streamed with a hard MEDIA_MAX_BYTES cut-off and its magic
+bytes are checked as soon as the first chunk arrives, so a multi-MB (or
+non-image) response is dropped early instead of being buffered whole. Every
+image is re-encoded to a bounded thumbnail before moderation, which keeps
+worker memory, bandwidth and inference cost proportional to the thumbnail,
+not the original.
+"""
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Dict, Optional, Tuple
+from urllib.parse import urljoin
+
+import httpx
+from fastapi.concurrency import run_in_threadpool
+from PIL import Image, ImageOps
+
+from ..config import settings
+from ..models import FilterMode
+from .http_client import get_http_manager
+from .image_moderation import record_stage_timings
+from .moderation_batcher import get_moderation_batcher
+from .moderation_cache import get_moderation_cache
+from .moderation_pool import ModerationBusy, ModerationTimeout
+from .thumbnail_store import content_etag, get_thumbnail_store
+from .upstream_health import CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+# NSFW threshold per filter mode; relaxed skips moderation entirely
+MODE_THRESHOLDS: Dict[FilterMode, Optional[float]] = {
+    FilterMode.relaxed: None,
+    FilterMode.moderate: 0.8,
+    FilterMode.strict: 0.6,
+}
+
+# redirects are followed hop by hop, so every origin gets its own breaker
+# and connection slot instead of being charged to the first one
+MAX_IMAGE_REDIRECTS = 5
+
+# content types some CDNs send for images; the magic bytes decide
+_GENERIC_CONTENT_TYPES = {"", "application/octet-stream", "binary/octet-stream"}
+
+_THUMB_FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "jpg": ("JPEG", "image/jpeg"),
+}
+
+
+class MediaError(Exception):
+    """A proxy request failed; carries the HTTP status to answer with."""
+
+    def __init__(self, status_code: int, detail: str, headers: Optional[Dict[str, str]] = None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.headers = headers
+
+
+@dataclass(frozen=True)
+class ProcessedImage:
+    content: bytes
+    media_type: str
+    etag: str
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """Content type from magic bytes, or None if this is not a supported image."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head.startswith(b"BM"):
+        return "image/bmp"
+    return None
+
+
+async def _read_image(resp: httpx.Response, max_bytes: int) -> Tuple[bytes, str]:
+    if resp.status_code != 200:
+        raise MediaError(404, "Image not found")
+
+    content_type = resp.headers.get("content-type", "").split(";")[0].strip().lower()
+    if not content_type.startswith("image/") and content_type not in _GENERIC_CONTENT_TYPES:
+        raise MediaError(400, "URL does not point to an image")
+
+    declared = resp.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_bytes:
+        raise MediaError(413, "Remote image is too large")
+
+    body = bytearray()
+    sniffed: Optional[str] = None
+    async for chunk in resp.aiter_bytes():
+        body += chunk
+        if len(body) > max_bytes:
+            raise MediaError(413, "Remote image is too large")
+        if sniffed is None and len(body) >= 12:
+            sniffed = sniff_image_type(bytes(body[:12]))
+            if sniffed is None:
+                raise MediaError(415, "Unsupported image format")
+
+    if sniffed is None:
+        # tiny body: never got 12 bytes to look at
+        sniffed = sniff_image_type(bytes(body))
+        if sniffed is None:
+            raise MediaError(415, "Unsupported image format")
+    return bytes(body), sniffed
+
+
+async def fetch_image(url: str) -> Tuple[bytes, str]:
+    """Stream the remote image, enforcing size and type limits as it arrives."""
+    max_bytes = settings.MEDIA_MAX_BYTES
+    manager = get_http_manager()
+    try:
+        for _ in range(MAX_IMAGE_REDIRECTS + 1):
+            async with manager.stream("GET", url, follow_redirects=False) as resp:
+                if not resp.is_redirect:
+                    return await _read_image(resp, max_bytes)
+                location = resp.headers.get("location")
+            if not location:
+                raise MediaError(502, "Failed to fetch remote image")
+            url = urljoin(url, location)
+            if not url.startswith(("http://", "https://")):
+                raise MediaError(400, "Image redirect to a non-HTTP URL")
+        raise MediaError(502, "Too many redirects fetching remote image")
+    except CircuitOpenError as e:
+        # host has been failing: answer now instead of waiting for a timeout
+        raise MediaError(
+            503,
+            "Image host is unavailable",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except httpx.HTTPError:
+        raise MediaError(502, "Failed to fetch remote image")
+
+
+def make_thumbnail(image_bytes: bytes) -> Tuple[bytes, str]:
+    """Decode, bound to MEDIA_THUMB_MAX_SIDE and re-encode (strips metadata too)."""
+    pil_format, media_type = _THUMB_FORMATS.get(
+        settings.MEDIA_THUMB_FORMAT.lower(), _THUMB_FORMATS["webp"]
+    )
+    max_side = settings.MEDIA_THUMB_MAX_SIDE
+
+    try:
+        image = Image.open(BytesIO(image_bytes))
+        width, height = image.size
+        if width * height > settings.MEDIA_MAX_PIXELS:
+            raise MediaError(413, "Remote image has too many pixels")
+
+        image.draft("RGB", (max_side, max_side))  # cheap JPEG DCT downscale
+        image = ImageOps.exif_transpose(image)
+        keep_alpha = pil_format == "WEBP" and image.mode in ("RGBA", "LA", "P")
+        image = image.convert("RGBA" if keep_alpha else "RGB")
+        image.thumbnail((max_side, max_side))
+
+        out = BytesIO()
+        image.save(out, format=pil_format, quality=settings.MEDIA_THUMB_QUALITY)
+    except MediaError:
+        raise
+    except Exception:
+        raise MediaError(415, "Could not decode image")
+
+    return out.getvalue(), media_type
+
+
+async def moderate(image_bytes: bytes, threshold: float) -> bytes:
+    """
+    Verdict cache first; on a miss the image joins the next micro-batch.
+    Inference and cache I/O never run on the event loop.
+    """
+    cache = get_moderation_cache()
+    key = cache.key(image_bytes, threshold)
+
+    hit = await run_in_threadpool(cache.get, key)
+    if hit is not None:
+        is_nsfw, blurred = hit
+        return blurred if is_nsfw and blurred is not None else image_bytes
+
+    try:
+        censored_bytes, is_nsfw, stage_ms = await get_moderation_batcher().submit(
+            (image_bytes, threshold)
+        )
+    except ModerationBusy as e:
+        raise MediaError(
+            503,
+            "Image moderation is busy, retry shortly",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except ModerationTimeout:
+        raise MediaError(504, "Image moderation timed out")
+    except Exception:
+        # a stage failed for this image: no verdict, so nothing may be cached
+        # (neither here nor in the thumbnail store) and nothing is served
+        logger.exception("Image moderation failed")
+        raise MediaError(503, "Image moderation failed, retry shortly", headers={"Retry-After": "5"})
+
+    record_stage_timings(stage_ms)
+    await run_in_threadpool(cache.put, key, is_nsfw, censored_bytes)
+    return censored_bytes
+
+
+async def lookup_processed(url: str, mode: FilterMode) -> Optional[Tuple[str, str]]:
+    """(etag, media_type) of an already processed image, without fetching it."""
+    store = get_thumbnail_store()
+    if store is None:
+        return None
+    return await run_in_threadpool(store.lookup, url, mode.value)
+
+
+async def read_processed(etag: str) -> Optional[bytes]:
+    store = get_thumbnail_store()
+    if store is None:
+        return None
+    return await run_in_threadpool(store.read, etag)
+
+
+async def process_image(url: str, mode: FilterMode) -> ProcessedImage:
+    original_bytes, _ = await fetch_image(url)
+    etag = content_etag(url, mode.value, original_bytes)
+    store = get_thumbnail_store()
+
+    if store is not None:
+        # same remote content seen before (e.g. index entry expired): reuse it
+        stored = await run_in_threadpool(store.read, etag)
+        if stored is not None:
+            media_type = sniff_image_type(stored[:12]) or "application/octet-stream"
+            await run_in_threadpool(store.put, url, mode.value, etag, media_type, stored)
+            return ProcessedImage(stored, media_type, etag)
+
+    thumb_bytes, media_type = await run_in_threadpool(make_thumbnail, original_bytes)
+
+    threshold = MODE_THRESHOLDS.get(mode)
+    if threshold is None:
+        output = thumb_bytes
+    else:
+        output = await moderate(thumb_bytes, threshold)
+        # blurred output is always JPEG, whatever the thumbnail format
+        media_type = sniff_image_type(output[:12]) or media_type
+
+    if store is not None:
+        await run_in_threadpool(store.put, url, mode.value, etag, media_type, output)
+    return ProcessedImage(output, media_type, etag)
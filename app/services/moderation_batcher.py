@@ -0,0 +1,192 @@
+# app/services/moderation_batcher.py
+"""
+Micro-batching scheduler for image moderation.
+
+A results page fires 20-50 proxy requests at once; running the models once
+per image wastes most of the CPU. Pending images are collected for up to
+MODERATION_BATCH_MAX_WAIT_MS (or until MODERATION_BATCH_SIZE is reached) and
+moderated in one batched forward pass, then each verdict is handed back to
+the request that is waiting for it.
+
+Batches run in the moderation process pool when one is configured (see
+moderation_pool), otherwise in the threadpool. The queue is bounded: when
+MODERATION_QUEUE_SIZE images are already waiting, submit() raises
+ModerationBusy instead of piling up more work.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from ..config import settings
+from .moderation_pool import (
+    ModerationBusy,
+    ModerationTimeout,
+    get_moderation_executor,
+    reset_moderation_executor,
+    run_censor_batch,
+)
+
+# run_batch receives the items and returns one result (or Exception) per item
+BatchFn = Callable[[List[Any]], List[Any]]
+
+
+class MicroBatcher:
+    def __init__(
+        self,
+        run_batch: BatchFn,
+        max_batch_size: int,
+        max_wait_ms: float,
+        max_concurrent_batches: int = 1,
+        max_queue: int = 0,
+        job_timeout: float = 0.0,
+    ):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.max_concurrent_batches = max(1, max_concurrent_batches)
+        self.max_queue = max_queue  # 0 = unbounded
+        self.job_timeout = job_timeout  # 0 = no timeout
+
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._running: Optional[asyncio.Semaphore] = None
+        # items submitted but not yet answered (queued + in a running batch)
+        self.outstanding = 0
+
+        self.batches = 0
+        self.items = 0
+        self.busy_time = 0.0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def _retry_after(self) -> int:
+        # rough guess: how long the current backlog takes to drain
+        if not self.batches:
+            return 1
+        per_item = self.busy_time / self.items
+        return max(1, int(per_item * self.outstanding / self.max_concurrent_batches) + 1)
+
+    async def submit(self, item: Any) -> Any:
+        if self.max_queue and self.outstanding >= self.max_queue:
+            self.rejected += 1
+            raise ModerationBusy(self._retry_after())
+
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append((item, fut))
+        self.outstanding += 1
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        try:
+            return await fut
+        finally:
+            self.outstanding -= 1
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._pending:
+            batch = self._pending[: self.max_batch_size]
+            del self._pending[: self.max_batch_size]
+            asyncio.get_running_loop().create_task(self._run(batch))
+
+    @staticmethod
+    def _deliver(batch: List[Tuple[Any, asyncio.Future]], results: List[Any]) -> None:
+        for (_, fut), result in zip(batch, results):
+            if fut.done():
+                continue
+            if isinstance(result, Exception):
+                fut.set_exception(result)
+            else:
+                fut.set_result(result)
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        if self._running is None:
+            self._running = asyncio.Semaphore(self.max_concurrent_batches)
+
+        async with self._running:
+            # requests that went away while queued don't need a verdict
+            batch = [(item, fut) for item, fut in batch if not fut.done()]
+            if not batch:
+                return
+
+            started = time.perf_counter()
+            job = asyncio.ensure_future(self._execute([item for item, _ in batch]))
+            try:
+                results = await asyncio.wait_for(
+                    asyncio.shield(job), self.job_timeout or None
+                )
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                self._deliver(batch, [ModerationTimeout()] * len(batch))
+                # keep the slot until the worker is really free again
+                await asyncio.gather(job, return_exceptions=True)
+                return
+            except Exception as exc:
+                results = [exc] * len(batch)
+            finally:
+                self.busy_time += time.perf_counter() - started
+                self.batches += 1
+                self.items += len(batch)
+
+        self._deliver(batch, results)
+
+    async def _execute(self, items: List[Any]) -> List[Any]:
+        executor = get_moderation_executor()
+        if executor is None:
+            return await run_in_threadpool(self.run_batch, items)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                executor, self.run_batch, items
+            )
+        except BrokenProcessPool:
+            reset_moderation_executor()
+            raise
+
+    def metrics(self) -> Dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "busy_time_s": round(self.busy_time, 3),
+            "queued": len(self._pending),
+            "outstanding": self.outstanding,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "process_pool": settings.MODERATION_WORKERS > 0,
+        }
+
+
+_batcher: MicroBatcher | None = None
+
+
+def get_moderation_batcher() -> MicroBatcher:
+    global _batcher
+    if _batcher is None:
+        _batcher = MicroBatcher(
+            run_censor_batch,
+            max_batch_size=settings.MODERATION_BATCH_SIZE,
+            max_wait_ms=settings.MODERATION_BATCH_MAX_WAIT_MS,
+            # one batch in flight per worker process
+            max_concurrent_batches=max(
+                settings.MODERATION_BATCH_CONCURRENCY, settings.MODERATION_WORKERS
+            ),
+            max_queue=settings.MODERATION_QUEUE_SIZE,
+            job_timeout=settings.MODERATION_JOB_TIMEOUT,
+        )
+    return _batcher
+
+
+def moderation_batcher_metrics() -> Dict:
+    return _batcher.metrics() if _batcher is not None else {}
@@ -0,0 +1,202 @@
+# app/services/moderation_cache.py
+"""
+Two-tier cache of image moderation verdicts.
+
+Key: sha256(image bytes) + threshold + model version + a digest of the
+cascade settings (moderation_config_digest), so the same thumbnail is only
+run through the detector/classifier once per configuration. The blurred output
+is stored alongside NSFW verdicts; for safe images the original bytes are
+returned by the caller, so nothing else needs to be kept.
+
+  - memory: small LRU per process
+  - disk:   SQLite file (WAL mode) shared by all workers, survives restarts
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+Verdict = Tuple[bool, Optional[bytes]]  # (is_nsfw, blurred bytes if nsfw)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS verdicts (
+    key        TEXT PRIMARY KEY,
+    is_nsfw    INTEGER NOT NULL,
+    output     BLOB,
+    created_at REAL NOT NULL
+)
+"""
+
+
+def moderation_config_digest() -> str:
+    """
+    Digest of every setting besides the model version that can change a
+    verdict or its output, so changing one invalidates old entries without
+    a manual MODERATION_MODEL_VERSION bump.
+    """
+    stages = ",".join(s.strip() for s in settings.MODERATION_CASCADE.split(",") if s.strip())
+    raw = "\x1f".join([
+        stages,
+        f"{settings.MODERATION_SAFE_CONFIDENCE:.4f}",
+        str(bool(settings.MODERATION_DETECTOR_CAN_CLEAR)),
+        str(settings.MODERATION_MAX_SIDE),
+    ])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+class ModerationCache:
+    # prune the disk tier every N writes instead of on every insert
+    PRUNE_EVERY = 256
+
+    def __init__(
+        self,
+        path: str,
+        memory_entries: int,
+        disk_entries: int,
+        model_version: str,
+        config_digest: str = "",
+    ):
+        self.path = path
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.model_version = model_version
+        self.config_digest = config_digest
+
+        self._memory: "OrderedDict[str, Verdict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._writes = 0
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _conn(self) -> Optional[sqlite3.Connection]:
+        if self._db is None and self.path:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                db = sqlite3.connect(self.path, check_same_thread=False, timeout=5.0)
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute("PRAGMA synchronous=NORMAL")
+                db.execute(_SCHEMA)
+                db.commit()
+                self._db = db
+            except sqlite3.Error:
+                logger.exception("Moderation cache disk tier unavailable, using memory only")
+                self.path = ""
+        return self._db
+
+    def key(self, image_bytes: bytes, threshold: float) -> str:
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        return f"{digest}:{threshold:.3f}:{self.model_version}:{self.config_digest}"
+
+    def _remember(self, key: str, verdict: Verdict) -> None:
+        self._memory[key] = verdict
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Verdict]:
+        with self._lock:
+            verdict = self._memory.get(key)
+            if verdict is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return verdict
+
+            db = self._conn()
+            row = None
+            if db is not None:
+                try:
+                    row = db.execute(
+                        "SELECT is_nsfw, output FROM verdicts WHERE key = ?", (key,)
+                    ).fetchone()
+                except sqlite3.Error:
+                    logger.warning("Moderation cache read failed", exc_info=True)
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            verdict = (bool(row[0]), row[1])
+            self._remember(key, verdict)
+            self.disk_hits += 1
+            return verdict
+
+    def put(self, key: str, is_nsfw: bool, output: Optional[bytes]) -> None:
+        verdict: Verdict = (is_nsfw, output if is_nsfw else None)
+        with self._lock:
+            self._remember(key, verdict)
+
+            db = self._conn()
+            if db is None:
+                return
+            try:
+                db.execute(
+                    "INSERT OR REPLACE INTO verdicts (key, is_nsfw, output, created_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, int(verdict[0]), verdict[1], time.time()),
+                )
+                self._writes += 1
+                if self._writes % self.PRUNE_EVERY == 0:
+                    self._prune(db)
+                db.commit()
+            except sqlite3.Error:
+                logger.warning("Moderation cache write failed", exc_info=True)
+
+    def _prune(self, db: sqlite3.Connection) -> None:
+        db.execute(
+            "DELETE FROM verdicts WHERE key IN ("
+            " SELECT key FROM verdicts ORDER BY created_at DESC LIMIT -1 OFFSET ?"
+            ")",
+            (self.disk_entries,),
+        )
+
+    def metrics(self) -> Dict:
+        return {
+            "memory_size": len(self._memory),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "model_version": self.model_version,
+            "config_digest": self.config_digest,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+_cache: ModerationCache | None = None
+
+
+def get_moderation_cache() -> ModerationCache:
+    global _cache
+    if _cache is None:
+        _cache = ModerationCache(
+            path=settings.MODERATION_CACHE_PATH,
+            memory_entries=settings.MODERATION_CACHE_MEMORY_ENTRIES,
+            disk_entries=settings.MODERATION_CACHE_DISK_ENTRIES,
+            model_version=settings.MODERATION_MODEL_VERSION,
+            config_digest=moderation_config_digest(),
+        )
+    return _cache
+
+
+def close_moderation_cache() -> None:
+    global _cache
+    if _cache is not None:
+        _cache.close()
+        _cache = None
@@ -0,0 +1,139 @@
+# app/services/moderation_pool.py
+"""
+Dedicated worker processes for image moderation.
+
+NudeNet and PyTorch inference hold the GIL and the CPU for tens of
+milliseconds per batch; run inside the API worker they stall /api/search
+as well. With MODERATION_WORKERS > 0 the moderation batches run in a
+separate process pool whose workers load the models once at start-up.
+MODERATION_WORKERS = 0 keeps the old in-process (threadpool) behaviour.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ModerationBusy(Exception):
+    """The moderation queue is full; the client should retry later."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Moderation queue is full")
+        self.retry_after = retry_after
+
+
+class ModerationTimeout(Exception):
+    """A moderation job did not finish within MODERATION_JOB_TIMEOUT."""
+
+
+def _init_worker(torch_threads: int) -> None:
+    # runs once in every worker process: load and warm both models up front
+    from . import image_moderation
+
+    if torch_threads > 0:
+        import torch
+
+        torch.set_num_threads(torch_threads)
+
+    image_moderation.warm_up()
+
+
+def run_warm_up() -> Dict[str, float]:
+    from .image_moderation import warm_up
+
+    return warm_up()
+
+
+def run_censor_batch(items: list) -> list:
+    # module-level so it pickles by name; the parent never imports torch for it
+    from .image_moderation import censor_batch
+
+    return censor_batch(items)
+
+
+_executor: ProcessPoolExecutor | None = None
+
+
+def get_moderation_executor() -> Optional[ProcessPoolExecutor]:
+    global _executor
+    if settings.MODERATION_WORKERS <= 0:
+        return None
+    if _executor is None:
+        # spawn: forking a process that already touched torch is unsafe
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.MODERATION_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(settings.MODERATION_WORKER_TORCH_THREADS,),
+        )
+    return _executor
+
+
+def reset_moderation_executor() -> None:
+    """Drop a broken pool (e.g. a worker was OOM-killed); the next job starts a new one."""
+    global _executor
+    if _executor is not None:
+        logger.warning("Restarting moderation worker pool")
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def shutdown_moderation_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+
+
+# readiness of the moderation models, reported by /health/ready
+_readiness: Dict = {"state": "lazy"}
+
+
+async def warm_moderation_models() -> None:
+    """
+    Load + warm the models (in every worker process when a pool is used).
+    Started from the lifespan when MODERATION_PRELOAD is on.
+    """
+    _readiness.clear()
+    _readiness.update(state="warming", started_at=time.time())
+    started = time.perf_counter()
+    try:
+        executor = get_moderation_executor()
+        if executor is None:
+            timings = [await run_in_threadpool(run_warm_up)]
+        else:
+            # one job per worker at once, so the pool spawns (and warms) them all
+            loop = asyncio.get_running_loop()
+            timings = await asyncio.gather(
+                *(
+                    loop.run_in_executor(executor, run_warm_up)
+                    for _ in range(settings.MODERATION_WORKERS)
+                )
+            )
+    except Exception as e:
+        logger.exception("Moderation model warm-up failed")
+        _readiness.update(state="failed", error=str(e))
+        return
+
+    _readiness.update(
+        state="ready",
+        warmup_seconds=round(time.perf_counter() - started, 3),
+        workers=timings,
+    )
+
+
+def moderation_readiness() -> Dict:
+    state = dict(_readiness)
+    # lazy = models load on first use; that is not a reason to fail readiness
+    state["ready"] = state["state"] in ("ready", "lazy")
+    return state
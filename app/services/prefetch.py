@@ -0,0 +1,153 @@
+# app/services/prefetch.py
+"""
+Background prefetch + pre-moderation of result thumbnails.
+
+As soon as a search is answered, the top PREFETCH_TOP_N preview images are
+fetched, thumbnailed and moderated with bounded concurrency. The work goes
+through the same single-flight group and thumbnail store as
+/api/media/proxy, so the browser's proxy requests either join the in-flight
+work or hit the finished result.
+
+Prefetches are best-effort: when more than PREFETCH_MAX_PENDING are queued
+the oldest ones (from earlier searches) are cancelled, each one is bounded
+by PREFETCH_TIMEOUT, and errors are dropped silently.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+from urllib.parse import parse_qs, unquote_plus, urlsplit
+
+from ..config import settings
+from ..models import FilterMode
+from .media_pipeline import lookup_processed, process_image
+from .singleflight import get_singleflight
+
+logger = logging.getLogger(__name__)
+
+PrefetchKey = Tuple[str, FilterMode]
+
+
+def proxy_target(preview_url: Optional[str]) -> Optional[str]:
+    """Remote image URL behind a /api/media/proxy?url=... preview URL."""
+    if not preview_url:
+        return None
+    values = parse_qs(urlsplit(preview_url).query).get("url")
+    if not values:
+        return None
+    # same decoding as proxy_image: the query value is unquoted once more
+    target = unquote_plus(values[0])
+    return target if target.startswith(("http://", "https://")) else None
+
+
+class ThumbnailPrefetcher:
+    def __init__(self, top_n: int, concurrency: int, timeout: float, max_pending: int):
+        self.top_n = top_n
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.max_pending = max(1, max_pending)
+
+        self._tasks: "OrderedDict[PrefetchKey, asyncio.Task]" = OrderedDict()
+        self._slots: Optional[asyncio.Semaphore] = None
+
+        self.scheduled = 0
+        self.completed = 0
+        self.already_cached = 0
+        self.cancelled = 0
+        self.failed = 0
+
+    def schedule(self, results: Iterable[Dict], mode: FilterMode) -> None:
+        """Queue prefetches for the first top_n results that have a preview image."""
+        loop = asyncio.get_running_loop()
+        queued = 0
+        for r in results:
+            if queued >= self.top_n:
+                break
+            url = proxy_target(r.get("preview_url"))
+            if url is None:
+                continue
+            queued += 1
+            key = (url, mode)
+            if key in self._tasks:
+                continue
+
+            task = loop.create_task(self._prefetch(key))
+            self._tasks[key] = task
+            task.add_done_callback(lambda t, k=key: self._forget(k, t))
+            self.scheduled += 1
+
+        # newest searches win: drop prefetches nobody is likely to need now
+        while len(self._tasks) > self.max_pending:
+            _, oldest = self._tasks.popitem(last=False)
+            oldest.cancel()
+
+    def _forget(self, key: PrefetchKey, task: asyncio.Task) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+
+    async def _prefetch(self, key: PrefetchKey) -> None:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+
+        url, mode = key
+        group = get_singleflight("media")
+        try:
+            async with self._slots:
+                if await lookup_processed(url, mode) is not None:
+                    self.already_cached += 1
+                    return
+                await asyncio.wait_for(
+                    group.do(key, lambda: process_image(url, mode)),
+                    self.timeout,
+                )
+            self.completed += 1
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            # stop the fetch/moderation too, unless a browser request joined it
+            group.abandon(key)
+            raise
+        except asyncio.TimeoutError:
+            self.cancelled += 1
+            group.abandon(key)
+        except Exception:
+            self.failed += 1
+            logger.debug("Thumbnail prefetch failed for %s", url, exc_info=True)
+
+    def metrics(self) -> Dict:
+        return {
+            "pending": len(self._tasks),
+            "scheduled": self.scheduled,
+            "completed": self.completed,
+            "already_cached": self.already_cached,
+            "cancelled": self.cancelled,
+            "failed": self.failed,
+        }
+
+    def cancel_all(self) -> None:
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+
+
+_prefetcher: ThumbnailPrefetcher | None = None
+
+
+def get_prefetcher() -> ThumbnailPrefetcher:
+    global _prefetcher
+    if _prefetcher is None:
+        _prefetcher = ThumbnailPrefetcher(
+            top_n=settings.PREFETCH_TOP_N,
+            concurrency=settings.PREFETCH_CONCURRENCY,
+            timeout=settings.PREFETCH_TIMEOUT,
+            max_pending=settings.PREFETCH_MAX_PENDING,
+        )
+    return _prefetcher
+
+
+def shutdown_prefetcher() -> None:
+    global _prefetcher
+    if _prefetcher is not None:
+        _prefetcher.cancel_all()
+        _prefetcher = None
@@ -0,0 +1,282 @@
+# app/services/result_cache.py
+"""
+Cache for normalized upstream search results (before filtering).
+
+Entries are keyed by (normalized query, categories, limit, upstream page). An entry is
+served as-is for RESULT_CACHE_TTL seconds; for RESULT_CACHE_STALE_TTL more
+seconds it is still served but a background refresh is started
+(stale-while-revalidate). After that an entry is kept RESULT_CACHE_ERROR_TTL
+seconds longer and only served if fetching fresh results fails, e.g. while
+the upstream's circuit breaker is open (stale-if-error). Filtering always
+runs per request, so settings changes apply immediately.
+
+Backends:
+  - "memory": per-process LRU bounded by RESULT_CACHE_MAX_ENTRIES
+  - "redis":  shared by all uvicorn workers; size is bounded by the Redis
+              server's maxmemory + allkeys-lru policy
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import httpx
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+Entry = Tuple[List[Dict], float]  # (results, stored_at epoch seconds)
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+def make_cache_key(query: str, categories: str, limit: int, page: int = 1) -> str:
+    raw = f"{normalize_query(query)}\x1f{categories}\x1f{limit}\x1f{page}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class CacheBackend:
+    async def get(self, key: str) -> Optional[Entry]:
+        raise NotImplementedError
+
+    async def set(self, key: str, results: List[Dict], stored_at: float, expire_in: float) -> None:
+        raise NotImplementedError
+
+    async def clear(self) -> None:
+        raise NotImplementedError
+
+    def size(self) -> Optional[int]:
+        return None
+
+    async def aclose(self) -> None:
+        pass
+
+
+class MemoryBackend(CacheBackend):
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        # key -> (results, stored_at, expires_at)
+        self._data: "OrderedDict[str, Tuple[List[Dict], float, float]]" = OrderedDict()
+        self.evictions = 0
+
+    async def get(self, key: str) -> Optional[Entry]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        results, stored_at, expires_at = item
+        if time.time() >= expires_at:
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return results, stored_at
+
+    async def set(self, key: str, results: List[Dict], stored_at: float, expire_in: float) -> None:
+        self._data[key] = (results, stored_at, stored_at + expire_in)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    async def clear(self) -> None:
+        self._data.clear()
+
+    def size(self) -> Optional[int]:
+        return len(self._data)
+
+
+class RedisBackend(CacheBackend):
+    PREFIX = "netsentinel:results:"
+
+    def __init__(self, url: str):
+        # optional dependency, only needed when RESULT_CACHE_BACKEND=redis
+        import redis.asyncio as aioredis
+
+        self._redis = aioredis.from_url(url)
+
+    async def get(self, key: str) -> Optional[Entry]:
+        raw = await self._redis.get(self.PREFIX + key)
+        if raw is None:
+            return None
+        payload = json.loads(raw)
+        return payload["r"], payload["t"]
+
+    async def set(self, key: str, results: List[Dict], stored_at: float, expire_in: float) -> None:
+        payload = json.dumps({"r": results, "t": stored_at})
+        await self._redis.set(self.PREFIX + key, payload, ex=max(1, int(expire_in)))
+
+    async def clear(self) -> None:
+        async for key in self._redis.scan_iter(match=self.PREFIX + "*"):
+            await self._redis.delete(key)
+
+    async def aclose(self) -> None:
+        await self._redis.aclose()
+
+
+class ResultCache:
+    def __init__(self, backend: CacheBackend, ttl: float, stale_ttl: float, error_ttl: float = 0.0):
+        self.backend = backend
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.error_ttl = error_ttl
+        self._refreshing: Set[str] = set()
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.stale_on_error = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.errors = 0
+
+    async def _store(self, key: str, results: List[Dict]) -> None:
+        try:
+            await self.backend.set(
+                key, results, time.time(), self.ttl + self.stale_ttl + self.error_ttl
+            )
+        except Exception:
+            self.errors += 1
+            logger.exception("Result cache write failed")
+
+    async def _refresh(self, key: str, fetch: Callable[[], Awaitable[List[Dict]]]) -> None:
+        try:
+            results = await fetch()
+            await self._store(key, results)
+            self.refreshes += 1
+        except Exception:
+            logger.warning("Background refresh of cached search failed", exc_info=True)
+        finally:
+            self._refreshing.discard(key)
+
+    def _schedule_refresh(self, key: str, fetch: Callable[[], Awaitable[List[Dict]]]) -> None:
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+        asyncio.get_running_loop().create_task(self._refresh(key, fetch))
+
+    async def lookup(self, key: str) -> Optional[List[Dict]]:
+        """Cached results if still servable (fresh or stale), without fetching."""
+        try:
+            entry = await self.backend.get(key)
+        except Exception:
+            self.errors += 1
+            logger.exception("Result cache read failed")
+            return None
+        if entry is None:
+            self.misses += 1
+            return None
+        results, stored_at = entry
+        age = time.time() - stored_at
+        if age < self.ttl:
+            self.hits += 1
+            return results
+        if age < self.ttl + self.stale_ttl:
+            self.stale_hits += 1
+            return results
+        self.misses += 1
+        return None
+
+    async def lookup_on_error(self, key: str) -> Optional[List[Dict]]:
+        """
+        Cached results kept for stale-if-error, for a caller whose own fetch
+        just failed (lookup() already counted the miss).
+        """
+        try:
+            entry = await self.backend.get(key)
+        except Exception:
+            self.errors += 1
+            logger.exception("Result cache read failed")
+            return None
+        if entry is None:
+            return None
+        results, stored_at = entry
+        if time.time() - stored_at >= self.ttl + self.stale_ttl + self.error_ttl:
+            return None
+        self.stale_on_error += 1
+        logger.warning("Upstream failed; serving expired cached results")
+        return results
+
+    async def store(self, key: str, results: List[Dict]) -> None:
+        await self._store(key, results)
+
+    async def get_or_fetch(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[List[Dict]]],
+    ) -> List[Dict]:
+        try:
+            entry = await self.backend.get(key)
+        except Exception:
+            self.errors += 1
+            logger.exception("Result cache read failed")
+            entry = None
+
+        if entry is not None:
+            results, stored_at = entry
+            age = time.time() - stored_at
+            if age < self.ttl:
+                self.hits += 1
+                return results
+            if age < self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                self._schedule_refresh(key, fetch)
+                return results
+
+        self.misses += 1
+        try:
+            results = await fetch()
+        except httpx.HTTPError:
+            if entry is None:
+                raise
+            # upstream down (or breaker open): old results beat no results
+            self.stale_on_error += 1
+            logger.warning("Upstream failed; serving expired cached results")
+            return entry[0]
+        await self._store(key, results)
+        return results
+
+    def metrics(self) -> Dict:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "size": self.backend.size(),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "stale_on_error": self.stale_on_error,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.stale_hits) / lookups, 3) if lookups else 0.0,
+            "refreshes": self.refreshes,
+            "errors": self.errors,
+        }
+
+
+_cache: ResultCache | None = None
+
+
+def get_result_cache() -> ResultCache:
+    global _cache
+    if _cache is None:
+        if settings.RESULT_CACHE_BACKEND.lower() == "redis":
+            backend: CacheBackend = RedisBackend(settings.REDIS_URL)
+        else:
+            backend = MemoryBackend(settings.RESULT_CACHE_MAX_ENTRIES)
+        _cache = ResultCache(
+            backend,
+            ttl=settings.RESULT_CACHE_TTL,
+            stale_ttl=settings.RESULT_CACHE_STALE_TTL,
+            error_ttl=settings.RESULT_CACHE_ERROR_TTL,
+        )
+    return _cache
+
+
+async def aclose_result_cache() -> None:
+    global _cache
+    if _cache is not None:
+        await _cache.backend.aclose()
+        _cache = None
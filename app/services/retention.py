@@ -0,0 +1,225 @@
+# app/services/retention.py
+"""
+Batched deletion of search history.
+
+Deletes never touch more than HISTORY_PURGE_BATCH_SIZE queries (plus their
+results) per transaction, oldest first, with a short pause in between, so
+neither row locks nor WAL bursts grow with the size of the table. The
+rollups are decremented in the same transactions (from the rows the DELETE
+actually returned), keeping /stats consistent with what is left.
+
+Used by
+  - the retention job: HISTORY_RETENTION_DAYS / HISTORY_MAX_QUERIES,
+    checked every HISTORY_RETENTION_INTERVAL seconds;
+  - DELETE /api/history (purge everything).
+Only one purge runs per worker at a time; progress is kept for
+GET /api/history/retention.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, delete, or_, select, true
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..config import settings
+from ..database import SessionLocal
+from .rollups import forget_blocked_terms_before, forget_searches, reset_rollups
+
+logger = logging.getLogger(__name__)
+
+
+class PurgeInProgress(Exception):
+    """Another purge is already running in this worker."""
+
+
+@dataclass
+class PurgeProgress:
+    reason: str
+    started_at: datetime
+    finished_at: Optional[datetime] = None
+    deleted_queries: int = 0
+    deleted_results: int = 0
+    batches: int = 0
+    error: Optional[str] = None
+
+
+class HistoryPurger:
+    def __init__(self, batch_size: int, pause: float):
+        self.batch_size = max(1, batch_size)
+        self.pause = pause
+        self._lock = threading.Lock()
+        self.current: Optional[PurgeProgress] = None
+        self.last: Optional[PurgeProgress] = None
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def _delete_batch(self, db: Session, condition, progress: PurgeProgress) -> bool:
+        """Delete the oldest batch matching condition; False when nothing is left."""
+        q = models.SearchQuery.__table__
+        r = models.SearchResult.__table__
+
+        ids = db.execute(
+            select(q.c.id).where(condition).order_by(q.c.created_at, q.c.id).limit(self.batch_size)
+        ).scalars().all()
+        if not ids:
+            return False
+
+        # results first: the FK cascade is not enforced everywhere
+        deleted_results = db.execute(delete(r).where(r.c.query_id.in_(ids))).rowcount
+        deleted = db.execute(
+            delete(q)
+            .where(q.c.id.in_(ids))
+            .returning(q.c.created_at, q.c.safe_results, q.c.blocked_results)
+        ).mappings().all()
+        # only what this transaction removed (another worker may have raced us)
+        forget_searches(db.connection(), deleted)
+        db.commit()
+
+        progress.deleted_queries += len(deleted)
+        progress.deleted_results += deleted_results or 0
+        progress.batches += 1
+        return True
+
+    def _run(self, reason: str, condition_for, finish=None) -> PurgeProgress:
+        if not self._lock.acquire(blocking=False):
+            raise PurgeInProgress()
+        progress = PurgeProgress(reason=reason, started_at=datetime.utcnow())
+        self.current = progress
+        try:
+            with SessionLocal() as db:
+                condition = condition_for(db)
+                if condition is not None:
+                    while self._delete_batch(db, condition, progress):
+                        time.sleep(self.pause)
+                if finish is not None:
+                    finish(db)
+                    db.commit()
+        except Exception as e:
+            progress.error = str(e)
+            logger.exception("History purge (%s) failed", reason)
+            raise
+        finally:
+            progress.finished_at = datetime.utcnow()
+            self.last, self.current = progress, None
+            self._lock.release()
+
+        if progress.deleted_queries:
+            logger.info(
+                "History purge (%s): deleted %d queries, %d results in %d batches",
+                reason,
+                progress.deleted_queries,
+                progress.deleted_results,
+                progress.batches,
+            )
+        return progress
+
+    def purge_all(self) -> PurgeProgress:
+        # nothing left to count: zero the rollups (blocked terms included)
+        return self._run("clear", lambda db: true(), finish=reset_rollups)
+
+    def purge_by_policy(self, max_age_days: int, max_queries: int) -> Optional[PurgeProgress]:
+        """Apply the retention policy; None if no limit is configured."""
+        if max_age_days <= 0 and max_queries <= 0:
+            return None
+
+        q = models.SearchQuery.__table__
+        cutoff = datetime.utcnow() - timedelta(days=max_age_days) if max_age_days > 0 else None
+
+        def condition_for(db: Session):
+            conditions = []
+            if cutoff is not None:
+                conditions.append(q.c.created_at < cutoff)
+            if max_queries > 0:
+                # newest row that is over the limit; it and everything older goes
+                boundary = db.execute(
+                    select(q.c.created_at, q.c.id)
+                    .order_by(q.c.created_at.desc(), q.c.id.desc())
+                    .offset(max_queries)
+                    .limit(1)
+                ).first()
+                if boundary is not None:
+                    ts, query_id = boundary
+                    conditions.append(
+                        or_(q.c.created_at < ts, and_(q.c.created_at == ts, q.c.id <= query_id))
+                    )
+            return or_(*conditions) if conditions else None
+
+        def finish(db: Session) -> None:
+            if cutoff is not None:
+                forget_blocked_terms_before(db.connection(), cutoff)
+
+        return self._run("retention", condition_for, finish=finish)
+
+    def status(self) -> Dict:
+        return {
+            "running": self.running,
+            "current": asdict(self.current) if self.current else None,
+            "last": asdict(self.last) if self.last else None,
+        }
+
+
+_purger: HistoryPurger | None = None
+
+
+def get_history_purger() -> HistoryPurger:
+    global _purger
+    if _purger is None:
+        _purger = HistoryPurger(settings.HISTORY_PURGE_BATCH_SIZE, settings.HISTORY_PURGE_PAUSE)
+    return _purger
+
+
+def retention_policy() -> Dict:
+    return {
+        "max_age_days": settings.HISTORY_RETENTION_DAYS,
+        "max_queries": settings.HISTORY_MAX_QUERIES,
+        "interval_s": settings.HISTORY_RETENTION_INTERVAL,
+    }
+
+
+async def apply_retention() -> Optional[PurgeProgress]:
+    return await run_in_threadpool(
+        get_history_purger().purge_by_policy,
+        settings.HISTORY_RETENTION_DAYS,
+        settings.HISTORY_MAX_QUERIES,
+    )
+
+
+async def _retention_loop() -> None:
+    while True:
+        try:
+            await apply_retention()
+        except PurgeInProgress:
+            pass
+        except Exception:
+            # already logged by the purger; try again next interval
+            pass
+        await asyncio.sleep(settings.HISTORY_RETENTION_INTERVAL)
+
+
+_task: Optional[asyncio.Task] = None
+
+
+def start_retention_job() -> None:
+    global _task
+    if _task is None and (settings.HISTORY_RETENTION_DAYS > 0 or settings.HISTORY_MAX_QUERIES > 0):
+        _task = asyncio.get_running_loop().create_task(_retention_loop())
+
+
+async def stop_retention_job() -> None:
+    global _task
+    if _task is not None:
+        _task.cancel()
+        # a batch already running in the threadpool finishes on its own
+        await asyncio.gather(_task, return_exceptions=True)
+        _task = None
@@ -0,0 +1,304 @@
+# app/services/rollups.py
+"""
+Incrementally maintained search statistics.
+
+Every persisted search adds to
+  - stats_counters:       all-time totals (one row per counter)
+  - activity_buckets:     per-hour totals
+  - blocked_term_buckets: per-day counts of blocking keywords / domains
+in the same transaction that inserts the history rows, so /stats/overview
+reads a handful of rows instead of aggregating search_queries, and
+/stats/timeseries sums at most a few thousand buckets.
+
+Counters and activity buckets are backfilled from existing history once,
+when the rollup tables are first created, and can be rebuilt with
+
+    python -m app.services.rollups rebuild
+
+Blocked terms cannot be backfilled: blocked results were never stored.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Mapping, Tuple
+
+from sqlalchemy import delete, func, insert, select, text, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from .. import models
+
+logger = logging.getLogger(__name__)
+
+TOTAL_SEARCHES = "total_searches"
+SAFE_RESULTS = "safe_results"
+BLOCKED_RESULTS = "blocked_results"
+COUNTERS = (TOTAL_SEARCHES, SAFE_RESULTS, BLOCKED_RESULTS)
+
+# arbitrary, just has to be unique within the app
+_BACKFILL_LOCK_ID = 0x6E5F_0116
+
+
+# blocked_term_buckets.term column size
+MAX_TERM_LENGTH = 256
+
+
+def hour_bucket(ts: datetime) -> datetime:
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def day_bucket(ts: datetime) -> datetime:
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _upsert_add(conn: Connection, table, key_cols: List[str], rows: List[Dict]) -> None:
+    """INSERT rows, adding the non-key columns onto rows that already exist."""
+    if not rows:
+        return
+    add_cols = [c for c in rows[0] if c not in key_cols]
+
+    dialect = conn.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        stmt = dialect_insert(table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=key_cols,
+            set_={c: table.c[c] + stmt.excluded[c] for c in add_cols},
+        )
+        conn.execute(stmt)
+        return
+
+    # no native upsert: update, insert when nothing was there yet
+    for row in rows:
+        result = conn.execute(
+            update(table)
+            .where(*[table.c[k] == row[k] for k in key_cols])
+            .values({c: table.c[c] + row[c] for c in add_cols})
+        )
+        if result.rowcount == 0:
+            conn.execute(insert(table).values(row))
+
+
+def record_searches(conn: Connection, query_rows: Iterable[Mapping], sign: int = 1) -> None:
+    """
+    Add persisted search_queries rows to the rollups (call in their
+    transaction); sign=-1 subtracts deleted rows again.
+    """
+    totals = dict.fromkeys(COUNTERS, 0)
+    buckets: Dict[datetime, Dict[str, int]] = defaultdict(
+        lambda: {"searches": 0, "safe_results": 0, "blocked_results": 0}
+    )
+    for row in query_rows:
+        safe = row.get("safe_results") or 0
+        blocked = row.get("blocked_results") or 0
+        totals[TOTAL_SEARCHES] += 1
+        totals[SAFE_RESULTS] += safe
+        totals[BLOCKED_RESULTS] += blocked
+
+        bucket = buckets[hour_bucket(row["created_at"])]
+        bucket["searches"] += 1
+        bucket["safe_results"] += safe
+        bucket["blocked_results"] += blocked
+
+    if not totals[TOTAL_SEARCHES]:
+        return
+
+    _upsert_add(
+        conn,
+        models.StatsCounter.__table__,
+        ["name"],
+        [{"name": name, "value": value * sign} for name, value in totals.items()],
+    )
+    _upsert_add(
+        conn,
+        models.ActivityBucket.__table__,
+        ["bucket_start"],
+        # sorted: concurrent writers lock bucket rows in the same order
+        [
+            {"bucket_start": start, **{c: n * sign for c, n in counts.items()}}
+            for start, counts in sorted(buckets.items())
+        ],
+    )
+
+
+def forget_searches(conn: Connection, query_rows: Iterable[Mapping]) -> None:
+    """Subtract deleted search_queries rows (call in the deleting transaction)."""
+    rows = list(query_rows)
+    if not rows:
+        return
+    record_searches(conn, rows, sign=-1)
+    b = models.ActivityBucket.__table__
+    oldest = hour_bucket(min(row["created_at"] for row in rows))
+    newest = hour_bucket(max(row["created_at"] for row in rows))
+    conn.execute(
+        delete(b).where(b.c.bucket_start.between(oldest, newest), b.c.searches <= 0)
+    )
+
+
+def forget_blocked_terms_before(conn: Connection, cutoff: datetime) -> None:
+    """Drop blocked-term days that lie entirely before cutoff."""
+    t = models.BlockedTermBucket.__table__
+    conn.execute(delete(t).where(t.c.bucket_start < day_bucket(cutoff)))
+
+
+def record_blocked_terms(conn: Connection, terms: Iterable[Tuple[datetime, str, str]]) -> None:
+    """Count (created_at, kind, term) block reasons into daily buckets."""
+    counts = Counter(
+        (day_bucket(created_at), kind, term[:MAX_TERM_LENGTH])
+        for created_at, kind, term in terms
+    )
+    _upsert_add(
+        conn,
+        models.BlockedTermBucket.__table__,
+        ["bucket_start", "kind", "term"],
+        [
+            {"bucket_start": start, "kind": kind, "term": term, "count": n}
+            for (start, kind, term), n in sorted(counts.items())
+        ],
+    )
+
+
+def reset_rollups(db: Session) -> None:
+    """Zero everything (history was cleared). Caller commits."""
+    db.execute(delete(models.ActivityBucket))
+    db.execute(delete(models.BlockedTermBucket))
+    db.execute(update(models.StatsCounter).values(value=0))
+
+
+def read_totals(db: Session) -> Dict[str, int]:
+    rows = db.execute(select(models.StatsCounter.name, models.StatsCounter.value)).all()
+    totals = dict.fromkeys(COUNTERS, 0)
+    totals.update({name: value for name, value in rows})
+    return totals
+
+
+def read_window_totals(db: Session, hours: int, now: datetime | None = None) -> Dict[str, int]:
+    """Totals over the last `hours` hourly buckets, the current hour included."""
+    start = hour_bucket(now or datetime.utcnow()) - timedelta(hours=hours - 1)
+    b = models.ActivityBucket
+    searches, safe, blocked = db.execute(
+        select(
+            func.coalesce(func.sum(b.searches), 0),
+            func.coalesce(func.sum(b.safe_results), 0),
+            func.coalesce(func.sum(b.blocked_results), 0),
+        ).where(b.bucket_start >= start)
+    ).one()
+    return {TOTAL_SEARCHES: searches, SAFE_RESULTS: safe, BLOCKED_RESULTS: blocked}
+
+
+def read_activity(
+    db: Session, start: datetime, end: datetime, granularity: str
+) -> List[Dict]:
+    """
+    Activity per hour or day in [start, end), zero-filled for charts.
+    Days are summed from the hourly buckets.
+    """
+    step = timedelta(hours=1) if granularity == "hour" else timedelta(days=1)
+    to_bucket = hour_bucket if granularity == "hour" else day_bucket
+
+    points: Dict[datetime, Dict] = {}
+    t = to_bucket(start)
+    while t < end:
+        points[t] = {"bucket_start": t, "searches": 0, "safe_results": 0, "blocked_results": 0}
+        t += step
+
+    b = models.ActivityBucket
+    rows = db.execute(
+        select(b.bucket_start, b.searches, b.safe_results, b.blocked_results)
+        .where(b.bucket_start >= to_bucket(start), b.bucket_start < end)
+    )
+    for bucket_start, searches, safe, blocked in rows:
+        point = points.get(to_bucket(bucket_start))
+        if point is None:
+            continue
+        point["searches"] += searches
+        point["safe_results"] += safe
+        point["blocked_results"] += blocked
+
+    return list(points.values())
+
+
+def read_top_blocked(
+    db: Session, kind: str, start: datetime, end: datetime, limit: int
+) -> List[Dict]:
+    """Most frequent blocking terms of one kind; day resolution."""
+    t = models.BlockedTermBucket
+    total = func.sum(t.count).label("total")
+    rows = db.execute(
+        select(t.term, total)
+        .where(t.kind == kind, t.bucket_start >= day_bucket(start), t.bucket_start < end)
+        .group_by(t.term)
+        .order_by(total.desc(), t.term)
+        .limit(limit)
+    )
+    return [{"kind": kind, "term": term, "count": count} for term, count in rows]
+
+
+def backfill_rollups(db: Session, rebuild: bool = False) -> bool:
+    """
+    Build the rollups from existing history if they were never built
+    (or always, with rebuild=True). One pass over search_queries; returns
+    True if a backfill ran. Blocked-term buckets are left alone.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        # several workers start at once: only one of them backfills
+        db.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": _BACKFILL_LOCK_ID})
+
+    if rebuild:
+        db.execute(delete(models.ActivityBucket))
+        db.execute(delete(models.StatsCounter))
+    elif db.execute(select(models.StatsCounter.name).limit(1)).first() is not None:
+        db.commit()
+        return False
+
+    q = models.SearchQuery
+    rows = db.execute(
+        select(q.created_at, q.safe_results, q.blocked_results).execution_options(yield_per=10_000)
+    )
+    conn = db.connection()
+    # the generator is fully aggregated before anything is written
+    record_searches(
+        conn,
+        (
+            {"created_at": created_at, "safe_results": safe, "blocked_results": blocked}
+            for created_at, safe, blocked in rows
+        ),
+    )
+
+    # counter rows double as the "already backfilled" marker
+    _upsert_add(
+        conn,
+        models.StatsCounter.__table__,
+        ["name"],
+        [{"name": name, "value": 0} for name in COUNTERS],
+    )
+    db.commit()
+    logger.info("Backfilled stats rollups from search history")
+    return True
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Maintain the stats rollup tables.")
+    parser.add_argument(
+        "command",
+        choices=["backfill", "rebuild"],
+        help="backfill: only if never built; rebuild: recompute from search history",
+    )
+    args = parser.parse_args()
+
+    from ..database import SessionLocal
+
+    logging.basicConfig(level=logging.INFO)
+    with SessionLocal() as db:
+        if not backfill_rollups(db, rebuild=args.command == "rebuild"):
+            logger.info("Rollups already built; use 'rebuild' to recompute them")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,45 @@
 # app/services/search_providers.py
-from typing import List, Dict, Optional
-from urllib.parse import quote_plus, urlparse, urlunparse
+import asyncio
+import hashlib
+import html
+import re
+from typing import AsyncIterator, Callable, List, Dict, Optional
+from urllib.parse import quote, quote_plus, urlparse, urlunparse
 
-import requests
+from fastapi.concurrency import run_in_threadpool
 
 from ..config import settings
+from .http_client import get_http_manager
 
 
 class BaseProvider:
-    def search(self, query: str, limit: int = 10) -> List[Dict]:
+    # identifies the provider in fan-out metrics and merged results
+    name = "base"
+    # part of the result cache key
+    categories = ""
+    # asearch_iter yields results in a different order than asearch, so
+    # streamed pages need their own cache entries
+    streams_in_arrival_order = False
+
+    def search(self, query: str, limit: int = 10, page: int = 1) -> List[Dict]:
         raise NotImplementedError
 
+    async def asearch(self, query: str, limit: int = 10, page: int = 1) -> List[Dict]:
+        """
+        Non-blocking search. Providers without native async I/O fall back to
+        running the sync search() in the threadpool.
+        """
+        return await run_in_threadpool(self.search, query, limit, page)
+
+    async def asearch_iter(
+        self, query: str, limit: int = 10, page: int = 1
+    ) -> AsyncIterator[List[Dict]]:
+        """
+        Results in batches as they arrive (for streaming responses).
+        A single upstream answers in one response, hence one batch.
+        """
+        yield await self.asearch(query, limit=limit, page=page)
+
 
 class SearxNGProvider(BaseProvider):
     """
@@ -18,9 +47,15 @@ class SearxNGProvider(BaseProvider):
     to {title, url, snippet, preview_url}.
     """
 
-    def __init__(self, base_url: Optional[str] = None, categories: Optional[str] = None):
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        categories: Optional[str] = None,
+        name: str = "searxng",
+    ):
         self.base_url = (base_url or settings.SEARXNG_URL).rstrip("/")
         self.categories = categories or settings.SEARXNG_CATEGORIES
+        self.name = name
 
     def _normalize_img_url(self, img: str) -> str:
         if not img:
@@ -37,24 +72,17 @@ class SearxNGProvider(BaseProvider):
 
         return img
 
-    def search(self, query: str, limit: int = 10) -> List[Dict]:
-        params = {
+    def _params(self, query: str, page: int = 1) -> Dict:
+        return {
             "q": query,
             "format": "json",
             "categories": self.categories,
             "language": "en",
             "safesearch": 0,
+            "pageno": page,
         }
 
-        url = f"{self.base_url}/search"
-        headers = {
-            "User-Agent": "NetSentinelSafeSearch/1.0 (student project; contact: youremail@example.com)"
-        }
-
-        resp = requests.get(url, params=params, headers=headers, timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
-
+    def _parse(self, data: Dict, limit: int) -> List[Dict]:
         raw_results: List[Dict] = []
         for item in data.get("results", [])[:limit]:
             title = item.get("title") or item.get("url") or "Untitled"
@@ -80,18 +108,172 @@ class SearxNGProvider(BaseProvider):
 
         return raw_results
 
+    def search(self, query: str, limit: int = 10, page: int = 1) -> List[Dict]:
+        client = get_http_manager().sync_client()
+        resp = client.get(f"{self.base_url}/search", params=self._params(query, page))
+        resp.raise_for_status()
+        return self._parse(resp.json(), limit)
+
+    async def asearch(self, query: str, limit: int = 10, page: int = 1) -> List[Dict]:
+        resp = await get_http_manager().get(
+            f"{self.base_url}/search", params=self._params(query, page)
+        )
+        resp.raise_for_status()
+        return self._parse(resp.json(), limit)
+
+
+_TAG_RE = re.compile(r"<[^>]+>")
+
+
+class WikipediaProvider(BaseProvider):
+    """
+    MediaWiki full-text search (action=query&list=search). Text only, no
+    preview images. Pages are WIKIPEDIA_PAGE_SIZE results via sroffset.
+    """
+
+    def __init__(self, api_url: Optional[str] = None, page_size: Optional[int] = None):
+        self.api_url = api_url or settings.WIKIPEDIA_API_URL
+        self.page_size = page_size or settings.WIKIPEDIA_PAGE_SIZE
+        parsed = urlparse(self.api_url)
+        self.article_base = f"{parsed.scheme}://{parsed.netloc}/wiki/"
+        self.name = "wikipedia"
+        self.categories = f"wikipedia:{parsed.netloc}"
+
+    def _params(self, query: str, limit: int, page: int) -> Dict:
+        size = min(limit, self.page_size)
+        return {
+            "action": "query",
+            "list": "search",
+            "srsearch": query,
+            "srlimit": size,
+            "sroffset": (page - 1) * self.page_size,
+            "format": "json",
+            "utf8": 1,
+        }
+
+    def _parse(self, data: Dict) -> List[Dict]:
+        results: List[Dict] = []
+        for item in data.get("query", {}).get("search", []):
+            title = item.get("title") or "Untitled"
+            snippet = html.unescape(_TAG_RE.sub("", item.get("snippet") or ""))
+            results.append(
+                {
+                    "title": title,
+                    "url": self.article_base + quote(title.replace(" ", "_")),
+                    "snippet": snippet,
+                    "preview_url": None,
+                }
+            )
+        return results
+
+    def search(self, query: str, limit: int = 10, page: int = 1) -> List[Dict]:
+        client = get_http_manager().sync_client()
+        resp = client.get(self.api_url, params=self._params(query, limit, page))
+        resp.raise_for_status()
+        return self._parse(resp.json())
+
+    async def asearch(self, query: str, limit: int = 10, page: int = 1) -> List[Dict]:
+        resp = await get_http_manager().get(self.api_url, params=self._params(query, limit, page))
+        resp.raise_for_status()
+        return self._parse(resp.json())
+
+
+class FakeProvider(BaseProvider):
+    """
+    Deterministic offline provider for local development and tests: the
+    same (query, page) always yields the same results, after an optional
+    artificial delay.
+    """
+
+    def __init__(self, name: str = "fake", latency_ms: float = 0.0, page_size: int = 10):
+        self.name = name
+        self.categories = name
+        self.latency_ms = latency_ms
+        self.page_size = page_size
+
+    def _results(self, query: str, limit: int, page: int) -> List[Dict]:
+        slug = quote_plus(query.strip().lower())
+        first = (page - 1) * self.page_size
+        out = []
+        for i in range(first, first + min(limit, self.page_size)):
+            digest = hashlib.sha1(f"{query}\x1f{i}".encode("utf-8")).hexdigest()[:8]
+            out.append(
+                {
+                    "title": f"{query} result {i + 1}",
+                    "url": f"https://example.com/{slug}/{i + 1}-{digest}",
+                    "snippet": f"Offline result {i + 1} for {query} from {self.name}.",
+                    "preview_url": None,
+                }
+            )
+        return out
+
+    def search(self, query: str, limit: int = 10, page: int = 1) -> List[Dict]:
+        return self._results(query, limit, page)
+
+    async def asearch(self, query: str, limit: int = 10, page: int = 1) -> List[Dict]:
+        if self.latency_ms > 0:
+            await asyncio.sleep(self.latency_ms / 1000.0)
+        return self._results(query, limit, page)
+
+
+def _searxng_providers() -> List[BaseProvider]:
+    providers: List[BaseProvider] = [SearxNGProvider()]
+    extra = [u.strip() for u in settings.SEARXNG_EXTRA_URLS.split(",") if u.strip()]
+    for i, url in enumerate(extra, start=2):
+        providers.append(SearxNGProvider(base_url=url, name=f"searxng-{i}"))
+    return providers
+
+
+# SEARCH_PROVIDER names -> provider instances
+PROVIDER_REGISTRY: Dict[str, Callable[[], List[BaseProvider]]] = {
+    "searxng": _searxng_providers,
+    "wikipedia": lambda: [WikipediaProvider()],
+    "fake": lambda: [FakeProvider(latency_ms=settings.FAKE_PROVIDER_LATENCY_MS)],
+}
+
+
+def build_providers(spec: str) -> List[BaseProvider]:
+    providers: List[BaseProvider] = []
+    for name in (n.strip().lower() for n in spec.split(",")):
+        if not name:
+            continue
+        factory = PROVIDER_REGISTRY.get(name)
+        if factory is None:
+            raise ValueError(f"Unknown search provider: {name!r}")
+        providers.extend(factory())
+
+    # stats, deadlines and hedging are keyed by provider name
+    seen = set()
+    for provider in providers:
+        if provider.name in seen:
+            raise ValueError(f"Search provider configured twice: {provider.name!r}")
+        seen.add(provider.name)
+    return providers
+
+
 _provider_singleton: BaseProvider | None = None
 
 
 def get_provider() -> BaseProvider:
+    """
+    SEARCH_PROVIDER is a comma-separated list of registry names; several
+    providers (or SEARXNG_EXTRA_URLS) are queried concurrently via fan-out.
+    """
     global _provider_singleton
     if _provider_singleton is not None:
         return _provider_singleton
 
-    if settings.SEARCH_PROVIDER.lower() == "searxng":
-        _provider_singleton = SearxNGProvider()
+    providers = build_providers(settings.SEARCH_PROVIDER) or _searxng_providers()
+    if len(providers) == 1:
+        _provider_singleton = providers[0]
     else:
-        # fallback
-        _provider_singleton = SearxNGProvider()
+        from .fanout import FanOutProvider
+
+        _provider_singleton = FanOutProvider(providers)
 
     return _provider_singleton
+
+
+def provider_metrics() -> Optional[Dict]:
+    provider = _provider_singleton
+    return provider.metrics() if provider is not None and hasattr(provider, "metrics") else None
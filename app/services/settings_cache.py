@@ -0,0 +1,225 @@
+# app/services/settings_cache.py
+"""
+In-process cache of GlobalSettings.
+
+The hot paths (search, media proxy) read an immutable SettingsSnapshot
+instead of querying global_settings on every request. The snapshot carries
+the parsed domain set and the compiled keyword matcher for every filter
+mode, so no parsing or compiling happens per request either.
+
+Invalidation:
+  - update_settings invalidates the local cache and sends a Postgres
+    NOTIFY on SETTINGS_NOTIFY_CHANNEL;
+  - every worker runs a LISTEN thread that invalidates on notification;
+  - SETTINGS_CACHE_TTL is a safety net for missed notifications
+    (and the only mechanism on non-Postgres databases).
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import select
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..database import SessionLocal, engine
+from ..models import FilterMode
+from ..utils.settings import get_or_create_global_settings
+from .filtering import get_keyword_matcher, parse_domain_set
+from .keyword_matcher import KeywordMatcher
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class SettingsSnapshot:
+    version: int
+    filter_mode: FilterMode
+    parental_controls: bool
+    notifications: bool
+    save_search_history: bool
+    blocked_keywords: str
+    allowed_domains: str
+    allowed_domain_set: FrozenSet[str]
+    matchers: Dict[FilterMode, KeywordMatcher] = field(repr=False)
+
+    def matcher(self, mode: FilterMode) -> KeywordMatcher:
+        return self.matchers[mode]
+
+
+def load_snapshot(version: int) -> SettingsSnapshot:
+    """Read the settings row and precompile everything the filters need."""
+    with SessionLocal() as db:
+        s = get_or_create_global_settings(db)
+        blocked_keywords = s.blocked_keywords or ""
+        allowed_domains = s.allowed_domains or ""
+        snapshot_fields = dict(
+            filter_mode=s.filter_mode,
+            parental_controls=s.parental_controls,
+            notifications=s.notifications,
+            save_search_history=s.save_search_history,
+        )
+
+    return SettingsSnapshot(
+        version=version,
+        blocked_keywords=blocked_keywords,
+        allowed_domains=allowed_domains,
+        allowed_domain_set=parse_domain_set(allowed_domains),
+        matchers={
+            mode: get_keyword_matcher(mode, blocked_keywords, settings.KEYWORD_WORD_BOUNDARY)
+            for mode in FilterMode
+        },
+        **snapshot_fields,
+    )
+
+
+class SettingsCache:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._snapshot: Optional[SettingsSnapshot] = None
+        self._loaded_at = 0.0
+        self._version = 0
+        # bumped from any thread (LISTEN thread, request handlers)
+        self._generation = 0
+        self._loaded_generation = -1
+        self._lock: Optional[asyncio.Lock] = None
+
+        self.reloads = 0
+        self.invalidations = 0
+
+    def invalidate(self) -> None:
+        self._generation += 1
+        self.invalidations += 1
+
+    def _fresh(self, generation: int) -> bool:
+        return (
+            self._snapshot is not None
+            and generation == self._loaded_generation
+            and time.monotonic() - self._loaded_at < self.ttl
+        )
+
+    async def get(self) -> SettingsSnapshot:
+        generation = self._generation
+        if self._fresh(generation):
+            return self._snapshot
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            generation = self._generation
+            if self._fresh(generation):
+                return self._snapshot
+
+            self._version += 1
+            # DB read + keyword compilation: keep it off the event loop
+            snapshot = await run_in_threadpool(load_snapshot, self._version)
+            self._snapshot = snapshot
+            self._loaded_at = time.monotonic()
+            self._loaded_generation = generation
+            self.reloads += 1
+            return snapshot
+
+    def metrics(self) -> Dict:
+        return {
+            "version": self._snapshot.version if self._snapshot else None,
+            "age_s": round(time.monotonic() - self._loaded_at, 1) if self._snapshot else None,
+            "reloads": self.reloads,
+            "invalidations": self.invalidations,
+        }
+
+
+_cache: SettingsCache | None = None
+
+
+def get_settings_cache() -> SettingsCache:
+    global _cache
+    if _cache is None:
+        _cache = SettingsCache(ttl=settings.SETTINGS_CACHE_TTL)
+    return _cache
+
+
+async def get_settings_snapshot() -> SettingsSnapshot:
+    return await get_settings_cache().get()
+
+
+def _is_postgres() -> bool:
+    return engine.url.get_backend_name() == "postgresql"
+
+
+def notify_settings_changed(db: Session) -> None:
+    """Invalidate locally and tell the other workers (Postgres only)."""
+    get_settings_cache().invalidate()
+    if _is_postgres():
+        db.execute(text("SELECT pg_notify(:channel, '')"), {"channel": settings.SETTINGS_NOTIFY_CHANNEL})
+        db.commit()
+
+
+class SettingsListener(threading.Thread):
+    """LISTENs for settings changes made by other workers."""
+
+    def __init__(self, cache: SettingsCache, channel: str):
+        super().__init__(name="settings-listener", daemon=True)
+        self.cache = cache
+        self.channel = channel
+        self._stop_event = threading.Event()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def _dsn(self) -> str:
+        return engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+
+    def run(self) -> None:
+        import psycopg2
+
+        backoff = 1.0
+        while not self._stop_event.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(self._dsn())
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f'LISTEN "{self.channel}"')
+                # anything may have changed while we were not listening
+                self.cache.invalidate()
+                backoff = 1.0
+
+                while not self._stop_event.is_set():
+                    if select.select([conn], [], [], 1.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    if conn.notifies:
+                        conn.notifies.clear()
+                        self.cache.invalidate()
+            except Exception:
+                logger.warning("Settings listener lost its connection; retrying", exc_info=True)
+                self._stop_event.wait(backoff)
+                backoff = min(backoff * 2, 30.0)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+
+_listener: SettingsListener | None = None
+
+
+def start_settings_listener() -> None:
+    global _listener
+    if _listener is None and _is_postgres():
+        _listener = SettingsListener(get_settings_cache(), settings.SETTINGS_NOTIFY_CHANNEL)
+        _listener.start()
+
+
+def stop_settings_listener() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener.join(timeout=5)
+        _listener = None
@@ -0,0 +1,83 @@
+# app/services/singleflight.py
+"""
+Request coalescing ("single flight").
+
+Concurrent callers asking for the same key share one in-flight call instead
+of each hitting the upstream. The shared call runs as its own task, so a
+caller that disconnects does not cancel the work for everyone else.
+"""
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._waiters: Dict[Hashable, int] = {}
+        self.calls = 0
+        self.coalesced = 0
+        self.abandoned = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.calls += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._done(k, t))
+
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            left = self._waiters.get(key, 1) - 1
+            if left:
+                self._waiters[key] = left
+            else:
+                self._waiters.pop(key, None)
+
+    def abandon(self, key: Hashable) -> bool:
+        """
+        Cancel the in-flight call for key if nobody is waiting for it any more
+        (e.g. background prefetch that was superseded). Returns True if cancelled.
+        """
+        task = self._inflight.get(key)
+        if task is None or task.done() or self._waiters.get(key):
+            return False
+        task.cancel()
+        self.abandoned += 1
+        return True
+
+    def _done(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # mark the exception as retrieved even if every waiter went away
+        if not task.cancelled():
+            task.exception()
+
+    def metrics(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "abandoned": self.abandoned,
+            "inflight": len(self._inflight),
+        }
+
+
+_groups: Dict[str, SingleFlight] = {}
+
+
+def get_singleflight(name: str) -> SingleFlight:
+    group = _groups.get(name)
+    if group is None:
+        group = _groups[name] = SingleFlight(name)
+    return group
+
+
+def singleflight_metrics() -> Dict:
+    return {name: group.metrics() for name, group in _groups.items()}
@@ -0,0 +1,290 @@
+# app/services/text_classifier.py
+"""
+Optional text moderation stage: a hashed n-gram linear model.
+
+Each title + snippet is turned into word unigrams, word bigrams and
+character n-grams of words (which catch "pr0n"-style spellings and
+inflections the keyword list misses). Every feature is hashed (crc32) into
+2**bits buckets of a weight vector, and a whole page is scored in one
+vectorized call:
+
+    score = sigmoid(bias + sum(weights[buckets of the text]))
+
+i.e. one gather + one np.bincount for all texts of the page, so a results
+page costs about a millisecond instead of one model call per result.
+Scores are cached per text hash; TEXT_CLASSIFIER_THRESHOLDS gives the
+minimum score that blocks a result for each FilterMode (a mode without a
+threshold skips the stage).
+
+Models are .npz files (weights, bias, bits, char_ngram, version). Train one
+from "<0|1><TAB><text>" lines with:
+    python -m app.services.text_classifier train labeled.tsv -o model.npz
+NumPy is only imported when TEXT_CLASSIFIER_MODEL_PATH is set.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import logging
+import re
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+from ..config import settings
+from ..models import FilterMode
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def extract_features(text: str, bits: int, char_ngram: int) -> List[int]:
+    """Hashed feature buckets of one text (repeats count)."""
+    mask = (1 << bits) - 1
+    tokens = _TOKEN_RE.findall(text.lower())
+    features = [zlib.crc32(f"w:{t}".encode("utf-8")) & mask for t in tokens]
+    features.extend(
+        zlib.crc32(f"b:{a} {b}".encode("utf-8")) & mask for a, b in zip(tokens, tokens[1:])
+    )
+    if char_ngram:
+        for t in tokens:
+            padded = f"<{t}>"
+            for i in range(len(padded) - char_ngram + 1):
+                features.append(zlib.crc32(f"c:{padded[i:i + char_ngram]}".encode("utf-8")) & mask)
+    return features
+
+
+def _feature_matrix(texts: Sequence[str], bits: int, char_ngram: int):
+    """(row of every feature, bucket of every feature) for a batch of texts."""
+    import numpy as np
+
+    per_text = [extract_features(t, bits, char_ngram) for t in texts]
+    lengths = np.fromiter((len(f) for f in per_text), dtype=np.intp, count=len(per_text))
+    rows = np.repeat(np.arange(len(per_text), dtype=np.intp), lengths)
+    buckets = np.fromiter(
+        (b for f in per_text for b in f), dtype=np.intp, count=int(lengths.sum())
+    )
+    return rows, buckets
+
+
+def parse_thresholds(spec: str) -> Dict[FilterMode, float]:
+    """"strict=0.5,moderate=0.8" -> {FilterMode.strict: 0.5, FilterMode.moderate: 0.8}"""
+    thresholds: Dict[FilterMode, float] = {}
+    for item in spec.split(","):
+        name, sep, value = item.partition("=")
+        if not sep:
+            continue
+        try:
+            thresholds[FilterMode(name.strip().lower())] = float(value)
+        except ValueError:
+            logger.warning("Ignoring bad text classifier threshold %r", item)
+    return thresholds
+
+
+class TextClassifier:
+    def __init__(
+        self,
+        weights,
+        bias: float,
+        bits: int,
+        char_ngram: int,
+        version: str,
+        thresholds: Dict[FilterMode, float],
+        cache_entries: int,
+    ):
+        self.weights = weights
+        self.bias = float(bias)
+        self.bits = bits
+        self.char_ngram = char_ngram
+        self.version = version
+        self.thresholds = thresholds
+        self.cache_entries = cache_entries
+        self._scores: "OrderedDict[bytes, float]" = OrderedDict()
+
+        self.pages = 0
+        self.texts = 0
+        self.cache_hits = 0
+        self.blocked = 0
+        self.time_total = 0.0
+
+    @classmethod
+    def load(cls, path: str, thresholds: Dict[FilterMode, float], cache_entries: int) -> "TextClassifier":
+        import numpy as np
+
+        with np.load(path, allow_pickle=False) as model:
+            weights = np.ascontiguousarray(model["weights"], dtype=np.float32)
+            bits = int(model["bits"])
+            if weights.shape != (1 << bits,):
+                raise ValueError(f"{path}: expected {1 << bits} weights, got {weights.shape}")
+            return cls(
+                weights,
+                bias=float(model["bias"]),
+                bits=bits,
+                char_ngram=int(model["char_ngram"]),
+                version=str(model["version"]),
+                thresholds=thresholds,
+                cache_entries=cache_entries,
+            )
+
+    def threshold(self, mode: FilterMode) -> Optional[float]:
+        return self.thresholds.get(mode)
+
+    def score(self, texts: Sequence[str]) -> List[float]:
+        """Unsafe-probability of every text; one vectorized pass for the uncached ones."""
+        import numpy as np
+
+        started = time.perf_counter()
+        keys = [hashlib.blake2b(t.encode("utf-8"), digest_size=16).digest() for t in texts]
+        scores: List[Optional[float]] = []
+        for k in keys:
+            cached = self._scores.get(k)
+            if cached is not None:
+                self._scores.move_to_end(k)  # LRU, not FIFO
+            scores.append(cached)
+        missing = [i for i, s in enumerate(scores) if s is None]
+        self.cache_hits += len(texts) - len(missing)
+
+        if missing:
+            rows, buckets = _feature_matrix([texts[i] for i in missing], self.bits, self.char_ngram)
+            logits = np.bincount(rows, weights=self.weights[buckets], minlength=len(missing))
+            probs = 1.0 / (1.0 + np.exp(-(logits + self.bias)))
+            for i, p in zip(missing, probs.tolist()):
+                scores[i] = p
+                self._scores[keys[i]] = p
+            while len(self._scores) > self.cache_entries:
+                self._scores.popitem(last=False)
+
+        self.pages += 1
+        self.texts += len(texts)
+        self.time_total += time.perf_counter() - started
+        return scores  # type: ignore[return-value]
+
+    def metrics(self) -> Dict:
+        return {
+            "version": self.version,
+            "pages": self.pages,
+            "texts": self.texts,
+            "cache_hits": self.cache_hits,
+            "cache_size": len(self._scores),
+            "blocked": self.blocked,
+            "avg_ms_per_page": round(self.time_total / self.pages * 1000, 3) if self.pages else 0.0,
+        }
+
+
+def train(
+    texts: Sequence[str],
+    labels: Sequence[int],
+    bits: int = 20,
+    char_ngram: int = 3,
+    epochs: int = 30,
+    learning_rate: float = 0.5,
+    l2: float = 1e-6,
+):
+    """Logistic regression with AdaGrad over the hashed features. Returns (weights, bias)."""
+    import numpy as np
+
+    rows, buckets = _feature_matrix(texts, bits, char_ngram)
+    y = np.asarray(labels, dtype=np.float64)
+    weights = np.zeros(1 << bits, dtype=np.float64)
+    bias = 0.0
+    g2_w = np.full_like(weights, 1e-8)
+    g2_b = 1e-8
+    n = len(texts)
+
+    for _ in range(epochs):
+        logits = np.bincount(rows, weights=weights[buckets], minlength=n) + bias
+        err = 1.0 / (1.0 + np.exp(-logits)) - y
+        grad_w = np.bincount(buckets, weights=err[rows], minlength=weights.size) / n + l2 * weights
+        grad_b = float(err.mean())
+        g2_w += grad_w * grad_w
+        g2_b += grad_b * grad_b
+        weights -= learning_rate * grad_w / np.sqrt(g2_w)
+        bias -= learning_rate * grad_b / g2_b ** 0.5
+
+    return weights.astype(np.float32), bias
+
+
+def save_model(path: str, weights, bias: float, bits: int, char_ngram: int, version: str) -> None:
+    import numpy as np
+
+    with open(path, "wb") as f:
+        np.savez_compressed(
+            f,
+            weights=weights,
+            bias=np.float64(bias),
+            bits=np.int64(bits),
+            char_ngram=np.int64(char_ngram),
+            version=np.str_(version),
+        )
+
+
+_classifier: TextClassifier | None = None
+_load_failed = False
+
+
+def get_text_classifier() -> Optional[TextClassifier]:
+    """The configured classifier, or None when the stage is off or failed to load."""
+    global _classifier, _load_failed
+    if _classifier is None and not _load_failed and settings.TEXT_CLASSIFIER_MODEL_PATH:
+        try:
+            _classifier = TextClassifier.load(
+                settings.TEXT_CLASSIFIER_MODEL_PATH,
+                parse_thresholds(settings.TEXT_CLASSIFIER_THRESHOLDS),
+                settings.TEXT_CLASSIFIER_CACHE_ENTRIES,
+            )
+            logger.info("Loaded text classifier %s", _classifier.version)
+        except Exception:
+            # don't retry on every request; keyword filtering still applies
+            _load_failed = True
+            logger.exception("Could not load text classifier; stage disabled")
+    return _classifier
+
+
+def text_classifier_metrics() -> Optional[Dict]:
+    # no loading as a side effect of reading metrics
+    return _classifier.metrics() if _classifier is not None else None
+
+
+def _read_labeled(path: str):
+    texts: List[str] = []
+    labels: List[int] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            label, sep, text = line.rstrip("\n").partition("\t")
+            if sep and label.strip() in ("0", "1"):
+                labels.append(int(label))
+                texts.append(text)
+    return texts, labels
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Train or try the hashed n-gram text classifier.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    tr = sub.add_parser("train", help='lines of "<0|1>\\t<text>"')
+    tr.add_argument("data")
+    tr.add_argument("-o", "--output", required=True)
+    tr.add_argument("--bits", type=int, default=20)
+    tr.add_argument("--char-ngram", type=int, default=3, help="0 disables character n-grams")
+    tr.add_argument("--epochs", type=int, default=30)
+    tr.add_argument("--version", default=None)
+    sc = sub.add_parser("score")
+    sc.add_argument("model")
+    sc.add_argument("text", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "train":
+        texts, labels = _read_labeled(args.data)
+        weights, bias = train(texts, labels, args.bits, args.char_ngram, args.epochs)
+        version = args.version or f"hashed-ngram-{time.strftime('%Y%m%d%H%M%S')}"
+        save_model(args.output, weights, bias, args.bits, args.char_ngram, version)
+        print(f"{args.output}: {len(texts)} examples, version {version}")
+    else:
+        clf = TextClassifier.load(args.model, {}, cache_entries=0)
+        for text, score in zip(args.text, clf.score(args.text)):
+            print(f"{score:.3f}\t{text}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+# app/services/thumbnail_store.py
+"""
+Content-addressed on-disk store of processed (thumbnailed + moderated)
+proxy images.
+
+Layout under MEDIA_STORE_DIR:
+    objects/ab/<etag>       processed image bytes
+    index/cd/<url key>      "<etag> <media type>" for (url, mode)
+
+etag = sha256(url, mode, model version, sha256(original bytes)), so a
+changed remote image or a new moderation model yields a new object, and
+the etag doubles as the HTTP ETag. The total size of objects and index
+entries is bounded by MEDIA_STORE_MAX_BYTES; the least recently served
+objects are evicted first (lookup hits and reads bump the object's mtime),
+and index entries that expired or point at an evicted object go with them.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from ..config import settings
+from .moderation_cache import moderation_config_digest
+
+logger = logging.getLogger(__name__)
+
+
+def url_key(url: str, mode: str) -> str:
+    # anything that changes the processed output belongs in the key
+    raw = "\x1f".join([
+        mode,
+        settings.MODERATION_MODEL_VERSION,
+        moderation_config_digest(),
+        settings.MEDIA_THUMB_FORMAT,
+        str(settings.MEDIA_THUMB_MAX_SIDE),
+        url,
+    ])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def content_etag(url: str, mode: str, original_bytes: bytes) -> str:
+    content_hash = hashlib.sha256(original_bytes).hexdigest()
+    raw = f"{url_key(url, mode)}\x1f{content_hash}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class ThumbnailStore:
+    # sweep at most this often, even when writes keep coming
+    SWEEP_INTERVAL = 30.0
+
+    def __init__(self, root: str, max_bytes: int, index_ttl: float):
+        self.root = root
+        self.max_bytes = max_bytes
+        # after this long the remote image is fetched again to detect changes
+        self.index_ttl = index_ttl
+        self._lock = threading.Lock()
+        self._approx_bytes: Optional[int] = None
+        self._last_sweep = 0.0
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.index_pruned = 0
+
+    def _object_path(self, etag: str) -> str:
+        return os.path.join(self.root, "objects", etag[:2], etag)
+
+    def _index_path(self, key: str) -> str:
+        return os.path.join(self.root, "index", key[:2], key)
+
+    def lookup(self, url: str, mode: str) -> Optional[Tuple[str, str]]:
+        """(etag, media_type) of the stored result for (url, mode), if any."""
+        path = self._index_path(url_key(url, mode))
+        try:
+            if time.time() - os.stat(path).st_mtime > self.index_ttl:
+                raise OSError("index entry expired")
+            with open(path, "r", encoding="ascii") as f:
+                etag, media_type = f.read().split(" ", 1)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        # also bumps it: a 304 served from the index counts as use too
+        if not self.touch(etag):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return etag, media_type.strip()
+
+    def read(self, etag: str) -> Optional[bytes]:
+        path = self._object_path(etag)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # LRU: mark as recently served
+            return data
+        except OSError:
+            return None
+
+    def touch(self, etag: str) -> bool:
+        """Mark an object as recently served; False if it no longer exists."""
+        try:
+            os.utime(self._object_path(etag))
+            return True
+        except OSError:
+            return False
+
+    def put(self, url: str, mode: str, etag: str, media_type: str, content: bytes) -> None:
+        try:
+            path = self._object_path(etag)
+            if not os.path.exists(path):
+                _write_atomic(path, content)
+                with self._lock:
+                    if self._approx_bytes is not None:
+                        self._approx_bytes += len(content)
+            entry = f"{etag} {media_type}".encode("ascii")
+            _write_atomic(self._index_path(url_key(url, mode)), entry)
+            with self._lock:
+                # over-counts rewritten entries; the next sweep recounts
+                if self._approx_bytes is not None:
+                    self._approx_bytes += len(entry)
+            self.writes += 1
+        except OSError:
+            logger.warning("Thumbnail store write failed", exc_info=True)
+            return
+        self._maybe_sweep()
+
+    def _maybe_sweep(self) -> None:
+        with self._lock:
+            due = time.monotonic() - self._last_sweep >= self.SWEEP_INTERVAL
+            over = self._approx_bytes is None or self._approx_bytes > self.max_bytes
+            if not (due and over):
+                return
+            self._last_sweep = time.monotonic()
+        self.sweep()
+
+    def _scan(self, subdir: str) -> List[Tuple[float, int, str]]:
+        files = []
+        for dirpath, _, filenames in os.walk(os.path.join(self.root, subdir)):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+        return files
+
+    def _index_entry_dead(self, mtime: float, path: str, now: float) -> bool:
+        if now - mtime > self.index_ttl:
+            return True  # lookup ignores it; put rewrites it if needed
+        try:
+            with open(path, "r", encoding="ascii") as f:
+                etag = f.read().split(" ", 1)[0]
+        except (OSError, ValueError):
+            return True
+        return not os.path.exists(self._object_path(etag))
+
+    def sweep(self) -> None:
+        """
+        Evict least recently served objects until objects + index entries
+        fit in max_bytes, then drop index entries that expired or point at
+        a missing object.
+        """
+        objects = self._scan("objects")
+        index = self._scan("index")
+        total = sum(size for _, size, _ in objects) + sum(size for _, size, _ in index)
+
+        if total > self.max_bytes:
+            # evict down to 90% so we don't sweep again right away
+            target = int(self.max_bytes * 0.9)
+            for _, size, path in sorted(objects):
+                if total <= target:
+                    break
+                try:
+                    os.unlink(path)
+                except OSError:
+                    continue
+                total -= size
+                self.evictions += 1
+
+        now = time.time()
+        for mtime, size, path in index:
+            if not self._index_entry_dead(mtime, path, now):
+                continue
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+            self.index_pruned += 1
+
+        with self._lock:
+            self._approx_bytes = total
+
+    def metrics(self) -> Dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "index_pruned": self.index_pruned,
+            "approx_bytes": self._approx_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+_store: ThumbnailStore | None = None
+
+
+def get_thumbnail_store() -> Optional[ThumbnailStore]:
+    global _store
+    if not settings.MEDIA_STORE_DIR:
+        return None
+    if _store is None:
+        _store = ThumbnailStore(
+            settings.MEDIA_STORE_DIR,
+            settings.MEDIA_STORE_MAX_BYTES,
+            settings.MEDIA_STORE_INDEX_TTL,
+        )
+    return _store
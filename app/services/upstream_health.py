@@ -0,0 +1,199 @@
+# app/services/upstream_health.py
+"""
+Per-upstream health: latency percentiles, adaptive timeouts and circuit
+breakers, keyed by origin (scheme://host:port).
+
+Breaker states:
+  closed     requests flow; BREAKER_FAILURE_THRESHOLD consecutive failures
+             (transport errors, timeouts, 5xx) open it
+  open       requests fail immediately with CircuitOpenError for
+             BREAKER_OPEN_SECONDS (doubling on repeated trips, capped)
+  half_open  one probe request is let through; success closes the
+             breaker, failure opens it again
+
+The read timeout of a request follows the host's observed latency
+(p99 x HTTP_TIMEOUT_MULTIPLIER, clamped to [HTTP_MIN_READ_TIMEOUT,
+HTTP_READ_TIMEOUT]), so a host that normally answers in 200 ms is given up
+on after a second or two instead of the full read timeout.
+"""
+from __future__ import annotations
+
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Optional
+
+import httpx
+
+from ..config import settings
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(httpx.TransportError):
+    """Raised instead of contacting an upstream whose breaker is open."""
+
+    def __init__(self, origin: str, retry_after: float):
+        super().__init__(f"Circuit open for {origin}; retry in {retry_after:.0f}s")
+        self.origin = origin
+        self.retry_after = max(1, int(retry_after + 0.5))
+
+
+class LatencyTracker:
+    """Recent successful latencies of one upstream."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self._samples: Deque[float] = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def observe(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, open_seconds: float, max_open_seconds: float):
+        self.failure_threshold = max(1, failure_threshold)
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.trips = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._current_open = open_seconds
+        self._probe_in_flight = False
+
+    def retry_after(self) -> float:
+        return max(0.0, self._opened_at + self._current_open - time.monotonic())
+
+    def allow(self) -> bool:
+        """May a request go out now? Claims the probe slot when half-open."""
+        if self.state == OPEN:
+            if self.retry_after() > 0:
+                self.rejected += 1
+                return False
+            self.state = HALF_OPEN
+            self._probe_in_flight = False
+
+        if self.state == HALF_OPEN:
+            if self._probe_in_flight:
+                self.rejected += 1
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def record_success(self) -> None:
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+        if self.state != CLOSED:
+            self.state = CLOSED
+            self._current_open = self.open_seconds
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == HALF_OPEN:
+            # still down: stay away for longer
+            self._current_open = min(self._current_open * 2, self.max_open_seconds)
+            self._open()
+        elif self.state == CLOSED and self.consecutive_failures >= self.failure_threshold:
+            self._open()
+
+    def release_probe(self) -> None:
+        self._probe_in_flight = False
+
+    def _open(self) -> None:
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self.trips += 1
+
+
+class UpstreamHealth:
+    def __init__(self, origin: str):
+        self.origin = origin
+        self.latency = LatencyTracker()
+        self.breaker = CircuitBreaker(
+            settings.BREAKER_FAILURE_THRESHOLD,
+            settings.BREAKER_OPEN_SECONDS,
+            settings.BREAKER_MAX_OPEN_SECONDS,
+        )
+        self.successes = 0
+        self.failures = 0
+
+    def check(self) -> None:
+        if not self.breaker.allow():
+            raise CircuitOpenError(self.origin, self.breaker.retry_after())
+
+    def read_timeout(self) -> float:
+        p99 = self.latency.percentile(0.99)
+        if p99 is None:
+            return settings.HTTP_READ_TIMEOUT
+        adaptive = p99 * settings.HTTP_TIMEOUT_MULTIPLIER
+        return min(settings.HTTP_READ_TIMEOUT, max(settings.HTTP_MIN_READ_TIMEOUT, adaptive))
+
+    def timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(
+            self.read_timeout(),
+            connect=settings.HTTP_CONNECT_TIMEOUT,
+            pool=settings.HTTP_POOL_TIMEOUT,
+        )
+
+    def record_success(self, seconds: float) -> None:
+        self.successes += 1
+        self.latency.observe(seconds)
+        self.breaker.record_success()
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.breaker.record_failure()
+
+    def release(self) -> None:
+        """The request ended without a verdict (e.g. cancelled): free the probe slot."""
+        self.breaker.release_probe()
+
+    def state(self) -> Dict:
+        p50 = self.latency.percentile(0.5)
+        p99 = self.latency.percentile(0.99)
+        b = self.breaker
+        return {
+            "state": b.state,
+            "retry_after_s": round(b.retry_after(), 1) if b.state == OPEN else 0,
+            "consecutive_failures": b.consecutive_failures,
+            "trips": b.trips,
+            "rejected": b.rejected,
+            "successes": self.successes,
+            "failures": self.failures,
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p99_ms": round(p99 * 1000, 1) if p99 is not None else None,
+            "read_timeout_s": round(self.read_timeout(), 2),
+        }
+
+
+class UpstreamRegistry:
+    """Bounded LRU of UpstreamHealth; outlives the connection pools."""
+
+    def __init__(self, max_hosts: int):
+        self.max_hosts = max_hosts
+        self._hosts: "OrderedDict[str, UpstreamHealth]" = OrderedDict()
+
+    def get(self, origin: str) -> UpstreamHealth:
+        health = self._hosts.get(origin)
+        if health is None:
+            health = UpstreamHealth(origin)
+            self._hosts[origin] = health
+            while len(self._hosts) > self.max_hosts:
+                self._hosts.popitem(last=False)
+        else:
+            self._hosts.move_to_end(origin)
+        return health
+
+    def states(self) -> Dict[str, Dict]:
+        return {origin: h.state() for origin, h in self._hosts.items()}
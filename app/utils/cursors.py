@@ -0,0 +1,39 @@
+# app/utils/cursors.py
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+
+def encode_cursor(data: Dict) -> str:
+    """Opaque, URL-safe pagination token."""
+    raw = json.dumps(data, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(token: str) -> Dict:
+    """Inverse of encode_cursor; ValueError for anything that isn't one."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        data = json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError):
+        raise ValueError("invalid cursor")
+    if not isinstance(data, dict):
+        raise ValueError("invalid cursor")
+    return data
+
+
+def encode_keyset(created_at: datetime, row_id: int) -> str:
+    return encode_cursor({"t": created_at.isoformat(), "id": row_id})
+
+
+def decode_keyset(token: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    """(created_at, id) of the last row already seen, or None for the first page."""
+    if not token:
+        return None
+    data = decode_cursor(token)
+    try:
+        return datetime.fromisoformat(data["t"]), int(data["id"])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("invalid cursor")
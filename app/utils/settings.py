@@ -14,3 +14,4 @@ def get_or_create_global_settings(db: Session) -> models.GlobalSettings:
     db.commit()
     db.refresh(settings)
     return settings
+
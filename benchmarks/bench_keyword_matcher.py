@@ -0,0 +1,71 @@
+# benchmarks/bench_keyword_matcher.py
+"""
+Compares the old per-keyword substring loop with the compiled KeywordMatcher.
+
+Run from the repo root:
+    python -m benchmarks.bench_keyword_matcher
+"""
+import random
+import string
+import time
+
+from app.services.keyword_matcher import KeywordMatcher
+
+SIZES = [10, 1_000, 50_000]
+RESULTS_PER_PAGE = 20
+ROUNDS = 20
+
+
+def legacy_contains_banned(text: str, banned: set[str]) -> bool:
+    # copy of the original filtering.text_contains_banned
+    lowered = text.lower()
+    return any(word in lowered for word in banned)
+
+
+def random_word(rng: random.Random, lo: int = 5, hi: int = 12) -> str:
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(lo, hi)))
+
+
+def make_page(rng: random.Random):
+    page = []
+    for _ in range(RESULTS_PER_PAGE):
+        title = " ".join(random_word(rng, 3, 9) for _ in range(8))
+        snippet = " ".join(random_word(rng, 2, 10) for _ in range(35))
+        page.append(f"{title} {snippet}")
+    return page
+
+
+def bench(fn, texts) -> float:
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        for t in texts:
+            fn(t)
+    return (time.perf_counter() - start) / ROUNDS * 1000
+
+
+def main():
+    rng = random.Random(42)
+    texts = make_page(rng)
+
+    print(f"{'keywords':>9} {'compile ms':>11} {'loop ms/page':>13} {'matcher ms/page':>16} {'speedup':>8}")
+    for n in SIZES:
+        banned = {random_word(rng) for _ in range(n)}
+
+        t0 = time.perf_counter()
+        matcher = KeywordMatcher(banned)
+        compile_ms = (time.perf_counter() - t0) * 1000
+
+        # sanity check: both engines must agree
+        for t in texts:
+            assert legacy_contains_banned(t, banned) == matcher.matches(t)
+
+        loop_ms = bench(lambda t: legacy_contains_banned(t, banned), texts)
+        matcher_ms = bench(matcher.matches, texts)
+        print(
+            f"{n:>9} {compile_ms:>11.1f} {loop_ms:>13.3f} {matcher_ms:>16.3f} "
+            f"{loop_ms / matcher_ms:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
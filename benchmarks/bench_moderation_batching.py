@@ -0,0 +1,74 @@
+# benchmarks/bench_moderation_batching.py
+"""
+Throughput of the NSFW classifier: one image per forward pass (the
+original per-image path) vs. batched passes (classifier_scores).
+
+Needs the moderation models (downloads them on first run). From the repo root:
+    python -m benchmarks.bench_moderation_batching [n_images]
+"""
+import sys
+import time
+from io import BytesIO
+
+from PIL import Image
+
+from app.services.image_moderation import classifier_scores, get_classifier
+
+BATCH_SIZES = [1, 4, 8, 16, 32]
+
+
+def classify_nsfw(image_bytes: bytes) -> bool:
+    # copy of the original image_moderation.classify_nsfw
+    import torch
+
+    model, proc = get_classifier()
+    image = Image.open(BytesIO(image_bytes)).convert("RGB")
+    inputs = proc(images=image, return_tensors="pt")
+    with torch.no_grad():
+        logits = model(**inputs).logits
+    label = model.config.id2label[logits.argmax(-1).item()]
+    return label.lower() == "nsfw"
+
+
+def classify_nsfw_batch(images) -> list:
+    """One forward pass for a whole batch of decoded RGB images."""
+    return [p >= 0.5 for p in classifier_scores(images)]
+
+
+def make_images(n: int):
+    images = []
+    for i in range(n):
+        img = Image.new("RGB", (320, 240), color=((i * 37) % 255, (i * 91) % 255, (i * 13) % 255))
+        buf = BytesIO()
+        img.save(buf, format="JPEG")
+        images.append(buf.getvalue())
+    return images
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    images = make_images(n)
+
+    get_classifier()  # load outside the timed region
+    classify_nsfw(images[0])
+
+    start = time.perf_counter()
+    for image_bytes in images:
+        classify_nsfw(image_bytes)
+    serial = time.perf_counter() - start
+    print(f"{'serial':>10}: {n / serial:8.1f} img/s  ({serial * 1000 / n:.1f} ms/img)")
+
+    decoded = [Image.open(BytesIO(b)).convert("RGB") for b in images]
+    for size in BATCH_SIZES:
+        start = time.perf_counter()
+        for i in range(0, n, size):
+            classify_nsfw_batch(decoded[i:i + size])
+        elapsed = time.perf_counter() - start
+        print(
+            f"{'batch ' + str(size):>10}: {n / elapsed:8.1f} img/s  "
+            f"({elapsed * 1000 / n:.1f} ms/img, {serial / elapsed:.2f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# benchmarks/bench_moderation_cascade.py
+"""
+Cost of censor_batch under the configured MODERATION_CASCADE: throughput,
+how many images each stage had to look at, and the per-stage time.
+
+Needs the moderation models (downloads them on first run). From the repo root:
+    python -m benchmarks.bench_moderation_cascade [n_images]
+    MODERATION_CASCADE=detector,classifier python -m benchmarks.bench_moderation_cascade
+"""
+import sys
+import time
+from io import BytesIO
+
+from PIL import Image, ImageDraw
+
+from app.config import settings
+from app.services.image_moderation import censor_batch, warm_up
+
+BATCH_SIZE = 16
+
+
+def make_images(n: int):
+    # plain scenes: what most search thumbnails look like to the models
+    images = []
+    for i in range(n):
+        img = Image.new("RGB", (320, 240), color=((i * 37) % 255, (i * 91) % 255, (i * 13) % 255))
+        draw = ImageDraw.Draw(img)
+        draw.rectangle((40 + i % 60, 30, 200, 180), fill=((i * 53) % 255, 200, (i * 7) % 255))
+        draw.ellipse((150, 60 + i % 40, 300, 220), fill=(30, (i * 17) % 255, 160))
+        buf = BytesIO()
+        img.save(buf, format="JPEG")
+        images.append(buf.getvalue())
+    return images
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    images = make_images(n)
+    warm_up()  # load outside the timed region
+
+    stage_counts = {}
+    stage_ms = {}
+    blurred = 0
+    start = time.perf_counter()
+    for i in range(0, n, BATCH_SIZE):
+        for result in censor_batch([(b, 0.6) for b in images[i:i + BATCH_SIZE]]):
+            if isinstance(result, Exception):
+                raise result
+            _, is_nsfw, timings = result
+            blurred += is_nsfw
+            for stage, ms in timings.items():
+                stage_counts[stage] = stage_counts.get(stage, 0) + 1
+                stage_ms[stage] = stage_ms.get(stage, 0.0) + ms
+    elapsed = time.perf_counter() - start
+
+    print(f"cascade {settings.MODERATION_CASCADE!r}: {n / elapsed:.1f} img/s "
+          f"({elapsed * 1000 / n:.1f} ms/img), {blurred} blurred")
+    for stage, count in stage_counts.items():
+        print(f"  {stage:>10}: {count:>4}/{n} images, {stage_ms[stage] / count:.1f} ms/img")
+
+
+if __name__ == "__main__":
+    main()
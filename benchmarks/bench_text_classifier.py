@@ -0,0 +1,76 @@
+# benchmarks/bench_text_classifier.py
+"""
+Cost of the text classifier stage per results page: one call per result
+versus one batched call for the page, cold and with warm score cache.
+
+Run from the repo root:
+    python -m benchmarks.bench_text_classifier
+"""
+import random
+import string
+import time
+
+import numpy as np
+
+from app.services.text_classifier import TextClassifier
+
+BITS = [18, 20]
+CHAR_NGRAMS = [0, 3]
+RESULTS_PER_PAGE = 20
+ROUNDS = 20
+
+
+def random_word(rng: random.Random, lo: int = 2, hi: int = 10) -> str:
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(lo, hi)))
+
+
+def make_page(rng: random.Random):
+    page = []
+    for _ in range(RESULTS_PER_PAGE):
+        title = " ".join(random_word(rng, 3, 9) for _ in range(8))
+        snippet = " ".join(random_word(rng) for _ in range(35))
+        page.append(f"{title} {snippet}")
+    return page
+
+
+def make_classifier(bits: int, char_ngram: int, cache_entries: int) -> TextClassifier:
+    weights = np.random.default_rng(0).normal(0, 0.1, 1 << bits).astype(np.float32)
+    return TextClassifier(weights, -2.0, bits, char_ngram, "bench", {}, cache_entries)
+
+
+def bench(fn, pages) -> float:
+    start = time.perf_counter()
+    for page in pages:
+        fn(page)
+    return (time.perf_counter() - start) / len(pages) * 1000
+
+
+def main():
+    rng = random.Random(42)
+    pages = [make_page(rng) for _ in range(ROUNDS)]
+
+    print(
+        f"{'bits':>5} {'char':>5} {'per-result ms/page':>19} "
+        f"{'batched ms/page':>16} {'cached ms/page':>15} {'speedup':>8}"
+    )
+    for bits in BITS:
+        for char_ngram in CHAR_NGRAMS:
+            per_result = make_classifier(bits, char_ngram, cache_entries=0)
+            batched = make_classifier(bits, char_ngram, cache_entries=10_000)
+
+            # sanity check: batching must not change the scores
+            for page in pages[:3]:
+                single = [per_result.score([t])[0] for t in page]
+                assert np.allclose(single, per_result.score(page))
+
+            per_result_ms = bench(lambda page: [per_result.score([t]) for t in page], pages)
+            batched_ms = bench(batched.score, pages)
+            cached_ms = bench(batched.score, pages)
+            print(
+                f"{bits:>5} {char_ngram:>5} {per_result_ms:>19.3f} {batched_ms:>16.3f} "
+                f"{cached_ms:>15.3f} {per_result_ms / batched_ms:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
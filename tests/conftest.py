@@ -0,0 +1,12 @@
+# tests/conftest.py
+import os
+import tempfile
+
+# settings are read at import time: point every on-disk path at a
+# throwaway directory before anything under app/ is imported
+_tmp = tempfile.mkdtemp(prefix="netsentinel-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmp}/test.db")
+os.environ.setdefault("MEDIA_STORE_DIR", os.path.join(_tmp, "thumbnails"))
+os.environ.setdefault("MODERATION_CACHE_PATH", os.path.join(_tmp, "moderation_cache.sqlite3"))
+os.environ.setdefault("DOMAIN_INDEX_PATH", os.path.join(_tmp, "domain_index.bin"))
+os.environ.setdefault("RESULT_CACHE_BACKEND", "memory")
@@ -0,0 +1,53 @@
+# tests/test_filtering.py
+from app.services.domain_index import DomainIndex, build_index
+from app.services.filtering import apply_filters
+from app.services.keyword_matcher import KeywordMatcher
+
+
+def _result(url: str) -> dict:
+    return {"url": url, "title": "title", "snippet": "snippet"}
+
+
+def test_blocklist_applies_inside_allowed_domain(tmp_path):
+    path = str(tmp_path / "index.bin")
+    build_index(["bad.example.com"], [], path)
+    index = DomainIndex(path)
+
+    blocked_terms = []
+    filtered, blocked = apply_filters(
+        [
+            _result("https://example.com/"),
+            _result("https://www.example.com/page"),
+            _result("https://bad.example.com/"),
+            _result("https://x.bad.example.com/"),
+            _result("https://other.org/"),
+        ],
+        KeywordMatcher([]),
+        frozenset({"example.com"}),
+        blocked_terms,
+        domain_index=index,
+    )
+
+    assert [r["url"] for r in filtered] == ["https://example.com/", "https://www.example.com/page"]
+    assert blocked == 3
+    assert blocked_terms == [
+        ("domain", "bad.example.com"),
+        ("domain", "bad.example.com"),
+        ("domain", "other.org"),
+    ]
+
+
+def test_allow_entry_in_index_exempts_subdomain_of_blocked_domain(tmp_path):
+    path = str(tmp_path / "index.bin")
+    build_index(["example.com"], ["ok.example.com"], path)
+    index = DomainIndex(path)
+
+    filtered, blocked = apply_filters(
+        [_result("https://ok.example.com/"), _result("https://example.com/")],
+        KeywordMatcher([]),
+        frozenset(),
+        domain_index=index,
+    )
+
+    assert [r["url"] for r in filtered] == ["https://ok.example.com/"]
+    assert blocked == 1
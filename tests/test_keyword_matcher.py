@@ -0,0 +1,21 @@
+# tests/test_keyword_matcher.py
+from app.services.keyword_matcher import LOOP_MAX_KEYWORDS, KeywordMatcher
+
+TEXTS = ["Visit Essex today", "free PORN here", "nothing to see", "", "xxxl shirts"]
+
+
+def test_small_lists_match_like_the_compiled_pattern():
+    keywords = ["sex", "porn", "xxx"]
+    small = KeywordMatcher(keywords)
+    # pad past the loop limit with keywords that never occur, forcing the regex
+    big = KeywordMatcher(keywords + [f"zz{i}qq" for i in range(LOOP_MAX_KEYWORDS)])
+    assert small._loop_words is not None and big._pattern is not None
+    for text in TEXTS:
+        assert small.matches(text) == big.matches(text)
+        assert small.search(text) == big.search(text)
+
+
+def test_word_boundary_never_uses_the_substring_loop():
+    matcher = KeywordMatcher(["sex"], word_boundary=True)
+    assert not matcher.matches("Visit Essex today")
+    assert matcher.matches("sex ed")
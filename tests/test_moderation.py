@@ -0,0 +1,46 @@
+# tests/test_moderation.py
+import asyncio
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from app.config import settings
+from app.models import FilterMode
+from app.services import image_moderation, media_pipeline
+from app.services.media_pipeline import MediaError
+from app.services.moderation_cache import get_moderation_cache
+from app.services.thumbnail_store import get_thumbnail_store
+
+
+def _jpeg() -> bytes:
+    out = BytesIO()
+    Image.new("RGB", (64, 48), color=(200, 120, 90)).save(out, format="JPEG")
+    return out.getvalue()
+
+
+def test_classifier_failure_is_not_cached(monkeypatch):
+    def broken(images):
+        raise RuntimeError("model failed to load")
+
+    monkeypatch.setattr(settings, "MODERATION_CASCADE", "classifier")
+    monkeypatch.setattr(image_moderation, "classifier_scores", broken)
+
+    url = "https://images.example.com/a.jpg"
+    original = _jpeg()
+
+    async def fetch(u):
+        return original, "image/jpeg"
+
+    monkeypatch.setattr(media_pipeline, "fetch_image", fetch)
+
+    with pytest.raises(MediaError) as err:
+        asyncio.run(media_pipeline.process_image(url, FilterMode.strict))
+    assert err.value.status_code == 503
+
+    # neither the verdict cache nor the thumbnail store may remember "safe"
+    thumb, _ = media_pipeline.make_thumbnail(original)
+    cache = get_moderation_cache()
+    assert cache.get(cache.key(thumb, media_pipeline.MODE_THRESHOLDS[FilterMode.strict])) is None
+    store = get_thumbnail_store()
+    assert store.lookup(url, FilterMode.strict.value) is None
@@ -0,0 +1,70 @@
+# tests/test_search_stream.py
+import asyncio
+import json
+import time
+
+import httpx
+
+from app import schemas
+from app.models import FilterMode
+from app.routers import search
+from app.services.filtering import get_keyword_matcher
+from app.services.result_cache import get_result_cache, make_cache_key
+from app.services.search_providers import BaseProvider
+from app.services.settings_cache import SettingsSnapshot
+
+
+class DownProvider(BaseProvider):
+    name = "down"
+    categories = "general"
+
+    async def asearch(self, query, limit=10, page=1):
+        raise httpx.ConnectError("upstream down")
+
+
+def _snapshot() -> SettingsSnapshot:
+    return SettingsSnapshot(
+        version=0,
+        filter_mode=FilterMode.moderate,
+        parental_controls=False,
+        notifications=False,
+        save_search_history=False,
+        blocked_keywords="",
+        allowed_domains="",
+        allowed_domain_set=frozenset(),
+        matchers={mode: get_keyword_matcher(mode, "") for mode in FilterMode},
+    )
+
+
+async def _collect(payload):
+    return [
+        json.loads(line)
+        async for line in search.stream_search_events(payload, page=1, offset=0, fmt="ndjson")
+    ]
+
+
+def test_stream_serves_stale_results_when_upstream_fails(monkeypatch):
+    async def snapshot():
+        return _snapshot()
+
+    provider = DownProvider()
+    monkeypatch.setattr(search, "get_provider", lambda: provider)
+    monkeypatch.setattr(search, "get_settings_snapshot", snapshot)
+
+    cache = get_result_cache()
+    query = "stale streams"
+    # same key as /search; past ttl + stale_ttl, so only stale-if-error serves it
+    key = make_cache_key(query, provider.categories, search.UPSTREAM_PAGE_LIMIT, 1)
+    stored_at = time.time() - cache.ttl - cache.stale_ttl - 1
+    cached = [{"title": "Old result", "url": "https://example.com/a", "snippet": "still useful"}]
+
+    async def run():
+        await cache.backend.set(key, cached, stored_at, 3600)
+        return await _collect(schemas.SearchRequest(query=query))
+
+    events = asyncio.run(run())
+
+    assert [e["event"] for e in events] == ["result", "summary"]
+    assert events[0]["data"]["url"] == "https://example.com/a"
+    assert events[1]["data"]["safe"] == 1
+    assert cache.stale_on_error == 1